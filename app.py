@@ -1,61 +1,115 @@
 from flask import Flask, render_template, request, jsonify, redirect, url_for
-import mysql.connector
-from mysql.connector import Error
-from datetime import datetime
+from markupsafe import Markup
 import os
+import threading
+import click
+
+from ledger_store import MySQLLedgerStore, check_store
 
 app = Flask(__name__)
 
-# Database configuration
+# Database configuration - create the database with database_schema.sql
 DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',  # Change this to your MySQL username
-    'password': '',  # Change this to your MySQL password
-    'database': 'store_credit_system'
+    'host': os.getenv('MYSQL_HOST', 'localhost'),
+    'port': int(os.getenv('MYSQL_PORT', '3306')),
+    'user': os.getenv('MYSQL_USER', 'root'),
+    'password': os.getenv('MYSQL_PASSWORD', ''),
+    'database': os.getenv('MYSQL_DATABASE', 'store_credit_system'),
 }
 
-def get_db_connection():
-    """Create and return a database connection"""
+# Connections kept open by the mysql.connector pool, per worker process
+MYSQL_POOL_SIZE = int(os.getenv('MYSQL_POOL_SIZE', '5'))
+
+# Credit list pagination - page size can be overridden with ?per_page=
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '25'))
+PAGE_SIZE_CHOICES = (10, 25, 50, 100)
+
+# Maximum number of credits returned by a search
+SEARCH_LIMIT = int(os.getenv('SEARCH_LIMIT', '200'))
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """The ledger store, with its connection pool opened on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MySQLLedgerStore(DB_CONFIG, MYSQL_POOL_SIZE)
+        return _store
+
+@app.template_global()
+def asset_url(filename):
+    return url_for('static', filename=filename)
+
+@app.template_global()
+def has_endpoint(endpoint):
+    """Whether this app serves `endpoint`; index.html also links pages only app_sqlite.py has"""
+    return endpoint in app.view_functions
+
+def encode_cursor(credit):
+    """Build a 'created_at|id' pagination cursor from a credit row"""
+    return f"{credit['created_at']}|{credit['id']}"
+
+def decode_cursor(value):
+    """Split a 'created_at|id' cursor into a (created_at, id) tuple, or None if malformed"""
+    if not value or '|' not in value:
+        return None
+    created_at, _, credit_id = value.rpartition('|')
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
-    except Error as e:
-        print(f"Error connecting to MySQL: {e}")
+        return created_at, int(credit_id)
+    except ValueError:
         return None
 
+def render_fragments(store, cursor, credits):
+    """Render the mobile card and table rows of each credit"""
+    items_by_credit = store.fetch_items_by_credit(cursor, [credit['id'] for credit in credits])
+    return [{
+        'card': Markup(render_template('_credit_card.html', credit=credit)),
+        'row': Markup(render_template('_credit_row.html', credit=credit,
+                                      items=items_by_credit.get(credit['id'], []))),
+    } for credit in credits]
+
+def summary_to_dict(summary):
+    return {
+        'total_pending': summary['total_pending'],
+        'total_paid': summary['total_paid'],
+        'total_all': summary['total_all'],
+        'item_count': summary['item_count'],
+        'pending_credits': summary['pending'],
+        'paid_credits': summary['paid'],
+        'total_credits': summary['total'],
+    }
+
 @app.route('/')
 def index():
-    """Main page - display all credits"""
-    connection = get_db_connection()
-    if not connection:
-        return "Database connection error", 500
+    """Main page - display one page of credits"""
+    per_page = request.args.get('per_page', type=int)
+    if per_page not in PAGE_SIZE_CHOICES:
+        per_page = PAGE_SIZE
+    after = decode_cursor(request.args.get('after'))
+    before = decode_cursor(request.args.get('before')) if not after else None
     
     try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT id, customer_name, product, cost, 
-                   estimated_payment_date, status, created_at, paid_date
-            FROM credits 
-            ORDER BY created_at DESC
-        """)
-        credits = cursor.fetchall()
+        store = get_store()
+        with store.transaction() as cursor:
+            credits, has_newer, has_older = store.fetch_credit_page(cursor, per_page, after, before)
+            fragments = render_fragments(store, cursor, credits)
+            summary = store.fetch_ledger_summary(cursor)
         
-        # Calculate totals
-        cursor.execute("""
-            SELECT 
-                SUM(CASE WHEN status = 'pending' THEN cost ELSE 0 END) as total_pending,
-                SUM(CASE WHEN status = 'paid' THEN cost ELSE 0 END) as total_paid,
-                SUM(cost) as total_all
-            FROM credits
-        """)
-        totals = cursor.fetchone()
+        summary_html = Markup(render_template('_summary.html', totals=summary, counts=summary))
+        pagination = {
+            'per_page': per_page,
+            'choices': PAGE_SIZE_CHOICES,
+            'prev_url': url_for('index', before=encode_cursor(credits[0]), per_page=per_page) + '#credit-list' if credits and has_newer else None,
+            'next_url': url_for('index', after=encode_cursor(credits[-1]), per_page=per_page) + '#credit-list' if credits and has_older else None,
+        }
         
-        cursor.close()
-        connection.close()
-        
-        return render_template('index.html', credits=credits, totals=totals)
-    except Error as e:
-        print(f"Database error: {e}")
+        return render_template('index.html', credits=credits, fragments=fragments,
+                               summary_html=summary_html, pagination=pagination,
+                               ledger_version=summary['version'])
+    except Exception as e:
+        app.logger.exception("Database error")
         return f"Database error: {e}", 500
 
 @app.route('/add_credit', methods=['POST'])
@@ -65,107 +119,217 @@ def add_credit():
     product = request.form.get('product')
     cost = request.form.get('cost')
     estimated_payment_date = request.form.get('estimated_payment_date')
+    quantity = request.form.get('quantity', 1)
+    price = request.form.get('price', 0)
+    phone_number = request.form.get('phone_number') or None
     
     if not all([customer_name, product, cost, estimated_payment_date]):
         return jsonify({'error': 'All fields are required'}), 400
     
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({'error': 'Database connection error'}), 500
-    
     try:
-        cursor = connection.cursor()
-        cursor.execute("""
-            INSERT INTO credits (customer_name, product, cost, estimated_payment_date)
-            VALUES (%s, %s, %s, %s)
-        """, (customer_name, product, float(cost), estimated_payment_date))
-        connection.commit()
-        cursor.close()
-        connection.close()
+        store = get_store()
+        with store.transaction() as cursor:
+            store.create_credit(cursor, customer_name, estimated_payment_date, product, cost, quantity, price,
+                                phone_number)
         
-        return redirect(url_for('index'))
-    except Error as e:
-        print(f"Database error: {e}")
+        return redirect(url_for('index', success='added'))
+    except Exception as e:
+        app.logger.exception("Database error")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/mark_paid/<int:credit_id>', methods=['POST'])
 def mark_paid(credit_id):
     """Mark a credit as paid"""
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({'error': 'Database connection error'}), 500
+    try:
+        store = get_store()
+        with store.transaction() as cursor:
+            if not store.pay_credit(cursor, credit_id):
+                return "Credit not found", 404
+        
+        return redirect(url_for('index', success='paid'))
+    except Exception as e:
+        app.logger.exception("Database error")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/add_product/<int:credit_id>', methods=['POST'])
+def add_product(credit_id):
+    """Add a new product to an existing credit"""
+    product = request.form.get('product')
+    cost = request.form.get('cost')
+    quantity = request.form.get('quantity', 1)
+    price = request.form.get('price', 0)
+    
+    if not all([product, cost]):
+        return jsonify({'error': 'Product and cost are required'}), 400
     
     try:
-        cursor = connection.cursor()
-        cursor.execute("""
-            UPDATE credits 
-            SET status = 'paid', paid_date = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (credit_id,))
-        connection.commit()
-        cursor.close()
-        connection.close()
+        store = get_store()
+        with store.transaction() as cursor:
+            # Reopens the credit if it was paid
+            store.add_item(cursor, credit_id, product, cost, quantity, price)
         
-        return redirect(url_for('index'))
-    except Error as e:
-        print(f"Database error: {e}")
+        return redirect(url_for('index', success='product_added'))
+    except Exception as e:
+        app.logger.exception("Database error")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/view_items/<int:credit_id>')
+def view_items(credit_id):
+    """View all items for a specific credit"""
+    try:
+        store = get_store()
+        with store.transaction() as cursor:
+            credit = store.fetch_credit(cursor, credit_id)
+            if not credit:
+                return "Credit not found", 404
+            items = store.fetch_items(cursor, credit_id)
+            payments = store.fetch_payments(cursor, credit_id)
+        
+        total = {'total': credit['total_cost'], 'paid': credit['paid_amount'], 'balance': credit['balance']}
+        return render_template('view_items.html', credit=credit, items=items, payments=payments, total=total)
+    except Exception as e:
+        app.logger.exception("Database error")
+        return f"Database error: {e}", 500
+
+@app.route('/mark_item_paid/<int:credit_id>/<int:item_id>', methods=['POST'])
+def mark_item_paid(credit_id, item_id):
+    """Record a payment for one item and mark it paid"""
+    try:
+        store = get_store()
+        with store.transaction() as cursor:
+            store.pay_item(cursor, credit_id, item_id)
+        
+        return redirect(url_for('index', success='item_paid') + '#credit-list')
+    except Exception as e:
+        app.logger.exception("Database error")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/add_payment/<int:credit_id>', methods=['POST'])
+def add_payment(credit_id):
+    """Record a partial payment on a credit"""
+    try:
+        amount = float(request.form.get('amount') or 0)
+    except ValueError:
+        return jsonify({'error': 'Amount must be a number'}), 400
+    
+    try:
+        store = get_store()
+        with store.transaction() as cursor:
+            if store.add_payment(cursor, credit_id, amount) is None:
+                return "Credit not found", 404
+        
+        return redirect(url_for('index', success='payment_added') + '#credit-list')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.exception("Database error")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/delete_credit/<int:credit_id>', methods=['POST'])
 def delete_credit(credit_id):
-    """Delete a credit entry"""
-    connection = get_db_connection()
-    if not connection:
-        return jsonify({'error': 'Database connection error'}), 500
-    
+    """Delete a credit entry and its items"""
     try:
-        cursor = connection.cursor()
-        cursor.execute("DELETE FROM credits WHERE id = %s", (credit_id,))
-        connection.commit()
-        cursor.close()
-        connection.close()
+        store = get_store()
+        with store.transaction() as cursor:
+            store.remove_credit(cursor, credit_id)
         
-        return redirect(url_for('index'))
-    except Error as e:
-        print(f"Database error: {e}")
+        return redirect(url_for('index', success='deleted'))
+    except Exception as e:
+        app.logger.exception("Database error")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/search')
 def search():
-    """Search credits by customer name"""
+    """Search credits by customer name or phone number"""
     query = request.args.get('q', '')
-    connection = get_db_connection()
-    if not connection:
-        return "Database connection error", 500
+    if not query.strip():
+        return redirect(url_for('index'))
     
     try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT id, customer_name, product, cost, 
-                   estimated_payment_date, status, created_at, paid_date
-            FROM credits 
-            WHERE customer_name LIKE %s
-            ORDER BY created_at DESC
-        """, (f'%{query}%',))
-        credits = cursor.fetchall()
+        store = get_store()
+        with store.transaction() as cursor:
+            credits = store.fetch_credits(cursor, store.search_credit_ids(cursor, query.strip(), SEARCH_LIMIT))
+            fragments = render_fragments(store, cursor, credits)
+            version = store.fetch_ledger_summary(cursor)['version']
         
-        cursor.execute("""
-            SELECT 
-                SUM(CASE WHEN status = 'pending' THEN cost ELSE 0 END) as total_pending,
-                SUM(CASE WHEN status = 'paid' THEN cost ELSE 0 END) as total_paid,
-                SUM(cost) as total_all
-            FROM credits
-            WHERE customer_name LIKE %s
-        """, (f'%{query}%',))
-        totals = cursor.fetchone()
+        # Totals for the matched credits only
+        totals = {
+            'total_pending': sum(credit['balance'] for credit in credits),
+            'total_paid': sum(credit['paid_amount'] for credit in credits),
+            'total_all': sum(credit['total_cost'] for credit in credits),
+        }
+        counts = {
+            'total': len(credits),
+            'pending': sum(1 for credit in credits if credit['status'] == 'pending'),
+            'paid': sum(1 for credit in credits if credit['status'] == 'paid'),
+        }
+        summary_html = Markup(render_template('_summary.html', totals=totals, counts=counts))
         
-        cursor.close()
-        connection.close()
-        
-        return render_template('index.html', credits=credits, totals=totals, search_query=query)
-    except Error as e:
-        print(f"Database error: {e}")
+        return render_template('index.html', credits=credits, fragments=fragments,
+                               summary_html=summary_html, search_query=query, ledger_version=version)
+    except Exception as e:
+        app.logger.exception("Database error")
         return f"Database error: {e}", 500
 
+# Item payments from the page scripts (static/js/app.js)
+@app.route('/api/credits/<int:credit_id>/items/<int:item_id>/pay', methods=['POST'])
+def api_pay_item(credit_id, item_id):
+    """Pay off one item"""
+    try:
+        store = get_store()
+        with store.transaction() as cursor:
+            if not store.pay_item(cursor, credit_id, item_id):
+                return jsonify({'error': 'Unpaid item not found'}), 404
+            credit = store.fetch_credit(cursor, credit_id)
+            summary = store.fetch_ledger_summary(cursor)
+        return jsonify({'credit': credit, 'summary': summary_to_dict(summary)})
+    except Exception as e:
+        app.logger.exception("Database error")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/credits/<int:credit_id>/items/pay', methods=['POST'])
+def api_pay_items(credit_id):
+    """Pay off several items of a credit in one request"""
+    data = request.get_json(silent=True) or {}
+    item_ids = data.get('item_ids')
+    if not isinstance(item_ids, list) or not item_ids:
+        return jsonify({'error': 'item_ids must be a non-empty list'}), 400
+    try:
+        item_ids = [int(item_id) for item_id in item_ids]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'item_ids must be integers'}), 400
+    
+    try:
+        store = get_store()
+        with store.transaction() as cursor:
+            if not store.fetch_credit(cursor, credit_id):
+                return jsonify({'error': 'Credit not found'}), 404
+            paid = store.pay_items(cursor, credit_id, item_ids)
+            credit = store.fetch_credit(cursor, credit_id)
+            summary = store.fetch_ledger_summary(cursor)
+        return jsonify({'paid': paid, 'credit': credit, 'summary': summary_to_dict(summary)})
+    except Exception as e:
+        app.logger.exception("Database error")
+        return jsonify({'error': str(e)}), 500
+
+@app.cli.command('check-store')
+def check_store_command():
+    """Exercise every ledger write on a throwaway credit, then roll it back"""
+    store = get_store()
+    connection = store.connect()
+    try:
+        problems = check_store(store, store.cursor(connection))
+    finally:
+        connection.rollback()
+        connection.close()
+    
+    if not problems:
+        click.echo("Ledger store checks passed.")
+    else:
+        for problem in problems:
+            click.echo(f"  {problem}")
+        click.echo(f"{len(problems)} problem(s) found.")
+        raise SystemExit(1)
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -1,12 +1,48 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, Response, session, g, stream_with_context, send_file, abort
+from markupsafe import Markup
 import sqlite3
-from datetime import datetime
+from datetime import datetime, date, timedelta
 import os
+import sys
+import io
+import csv
+import json
+import math
+import re
+import queue
+import threading
+import zlib
+import gzip
+import hashlib
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import mimetypes
+import shutil
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
 from functools import wraps
+import click
+
+from ledger_store import SQLiteLedgerStore, check_store
+
+try:
+    import brotli  # optional - enables .br precompressed assets
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl  # POSIX only - serializes migrations across workers
+except ImportError:
+    fcntl = None
 
 
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'utang-secret-key-change-in-production-2025')
+# Lowest level app.logger writes (migrations and SMS sends log at INFO)
+app.logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
 
 # Login credentials
 LOGIN_EMAIL = 'jcpogi@1234'
@@ -16,20 +52,1536 @@ LOGIN_PASSWORD = '12345'
 DB_PATH = os.getenv('DB_PATH', '.')
 DB_FILE = os.path.join(DB_PATH, 'store_credit.db')
 
+# Connection pool and SQLite tuning - see ConnectionPool
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', '8192'))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(64 * 1024 * 1024)))
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+
+# Credit list pagination - page size can be overridden per session with ?per_page=
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', '25'))
+PAGE_SIZE_CHOICES = (10, 25, 50, 100)
+
+# Maximum number of items accepted by one batch request
+MAX_BATCH_ITEMS = int(os.getenv('MAX_BATCH_ITEMS', '500'))
+
+# Rendered HTML kept by the fragment cache, per worker process
+FRAGMENT_CACHE_BYTES = int(os.getenv('FRAGMENT_CACHE_BYTES', str(8 * 1024 * 1024)))
+
+# Days covered by the collections report unless a range is given
+REPORT_DAYS = int(os.getenv('REPORT_DAYS', '30'))
+
+# Where exports and reports read from - see get_report_connection()
+REPORT_SOURCE = os.getenv('REPORT_SOURCE', 'live')
+REPORT_SNAPSHOT_SECONDS = int(os.getenv('REPORT_SNAPSHOT_SECONDS', '300'))
+REPORT_SNAPSHOT_FILE = os.getenv('REPORT_SNAPSHOT_FILE', os.path.join(DB_PATH, 'store_credit.snapshot.db'))
+
+# Maximum number of changed credits returned by one /api/changes call
+CHANGES_LIMIT = int(os.getenv('CHANGES_LIMIT', '500'))
+
+# How soon a page's live-update stream reconnects - see api_events()
+LIVE_RETRY_SECONDS = int(os.getenv('LIVE_RETRY_SECONDS', '5'))
+
+# Maximum number of credits returned by a search
+SEARCH_LIMIT = int(os.getenv('SEARCH_LIMIT', '200'))
+
+# Set by init_db() - False when this SQLite build has no FTS5 module
+FTS_ENABLED = False
+
 # Login required decorator
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'logged_in' not in session:
+            if request.path.startswith('/api/'):
+                return jsonify({'error': 'Login required'}), 401
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
 
-def init_db():
-    """Initialize the database with the required table"""
-    connection = sqlite3.connect(DB_FILE)
-    cursor = connection.cursor()
+# Triggers that keep credit_totals and ledger_summary in step with credits,
+# credit_items and payments. They run inside the writing statement's
+# transaction, so the running totals commit (or roll back) together with the
+# change itself. Amounts follow the money, not the credit status: total_cost
+# is what was charged, paid_total what was collected, and pending_total the
+# balance still owed.
+# Every change also bumps ledger_summary.version, which the JSON API uses
+# for ETags, and stamps the affected credit_totals.version with it, which
+# keys the rendered-fragment cache. Deleted credits leave a tombstone in
+# deleted_credits so /api/changes can report them.
+TOTALS_TRIGGERS = {
+    'trg_credits_insert': """
+        CREATE TRIGGER trg_credits_insert AFTER INSERT ON credits
+        BEGIN
+            UPDATE ledger_summary SET
+                version = version + 1,
+                total_credits = total_credits + 1,
+                pending_credits = pending_credits + (NEW.status IS 'pending'),
+                paid_credits = paid_credits + (NEW.status IS 'paid')
+            WHERE id = 1;
+            INSERT OR IGNORE INTO credit_totals (credit_id, version)
+            VALUES (NEW.id, (SELECT version FROM ledger_summary WHERE id = 1));
+        END
+    """,
+    'trg_credits_status': """
+        CREATE TRIGGER trg_credits_status AFTER UPDATE OF status ON credits
+        WHEN OLD.status IS NOT NEW.status
+        BEGIN
+            UPDATE ledger_summary SET
+                version = version + 1,
+                pending_credits = pending_credits - (OLD.status IS 'pending') + (NEW.status IS 'pending'),
+                paid_credits = paid_credits - (OLD.status IS 'paid') + (NEW.status IS 'paid')
+            WHERE id = 1;
+            UPDATE credit_totals SET version = (SELECT version FROM ledger_summary WHERE id = 1) WHERE credit_id = NEW.id;
+        END
+    """,
+    'trg_credits_delete': """
+        CREATE TRIGGER trg_credits_delete AFTER DELETE ON credits
+        BEGIN
+            UPDATE ledger_summary SET
+                version = version + 1,
+                total_credits = total_credits - 1,
+                pending_credits = pending_credits - (OLD.status IS 'pending'),
+                paid_credits = paid_credits - (OLD.status IS 'paid'),
+                item_count = item_count - COALESCE((SELECT item_count FROM credit_totals WHERE credit_id = OLD.id), 0),
+                total_cost = total_cost - COALESCE((SELECT total_cost FROM credit_totals WHERE credit_id = OLD.id), 0),
+                paid_total = paid_total - COALESCE((SELECT paid_amount FROM credit_totals WHERE credit_id = OLD.id), 0),
+                pending_total = pending_total - COALESCE((SELECT total_cost - paid_amount FROM credit_totals WHERE credit_id = OLD.id), 0)
+            WHERE id = 1;
+            DELETE FROM credit_totals WHERE credit_id = OLD.id;
+            INSERT OR REPLACE INTO deleted_credits (credit_id, version)
+            VALUES (OLD.id, (SELECT version FROM ledger_summary WHERE id = 1));
+        END
+    """,
+    'trg_items_insert': """
+        CREATE TRIGGER trg_items_insert AFTER INSERT ON credit_items
+        BEGIN
+            UPDATE ledger_summary SET
+                version = version + 1,
+                item_count = item_count + 1,
+                total_cost = total_cost + NEW.cost,
+                pending_total = pending_total + NEW.cost
+            WHERE id = 1 AND EXISTS (SELECT 1 FROM credit_totals WHERE credit_id = NEW.credit_id);
+            UPDATE credit_totals SET
+                total_cost = total_cost + NEW.cost,
+                item_count = item_count + 1,
+                version = (SELECT version FROM ledger_summary WHERE id = 1)
+            WHERE credit_id = NEW.credit_id;
+        END
+    """,
+    'trg_items_delete': """
+        CREATE TRIGGER trg_items_delete AFTER DELETE ON credit_items
+        BEGIN
+            UPDATE ledger_summary SET
+                version = version + 1,
+                item_count = item_count - 1,
+                total_cost = total_cost - OLD.cost,
+                pending_total = pending_total - OLD.cost
+            WHERE id = 1 AND EXISTS (SELECT 1 FROM credit_totals WHERE credit_id = OLD.credit_id)
+              AND EXISTS (SELECT 1 FROM credits WHERE id = OLD.credit_id);
+            -- Items removed by ON DELETE CASCADE are left to trg_credits_delete,
+            -- which subtracts the credit's whole total at once
+            UPDATE credit_totals SET
+                total_cost = total_cost - OLD.cost,
+                item_count = item_count - 1,
+                version = (SELECT version FROM ledger_summary WHERE id = 1)
+            WHERE credit_id = OLD.credit_id AND EXISTS (SELECT 1 FROM credits WHERE id = OLD.credit_id);
+        END
+    """,
+    'trg_items_update': """
+        CREATE TRIGGER trg_items_update AFTER UPDATE OF cost, credit_id ON credit_items
+        BEGIN
+            UPDATE ledger_summary SET
+                version = version + 1,
+                item_count = item_count - 1,
+                total_cost = total_cost - OLD.cost,
+                pending_total = pending_total - OLD.cost
+            WHERE id = 1 AND EXISTS (SELECT 1 FROM credit_totals WHERE credit_id = OLD.credit_id);
+            UPDATE credit_totals SET
+                total_cost = total_cost - OLD.cost,
+                item_count = item_count - 1,
+                version = (SELECT version FROM ledger_summary WHERE id = 1)
+            WHERE credit_id = OLD.credit_id;
+            UPDATE ledger_summary SET
+                version = version + 1,
+                item_count = item_count + 1,
+                total_cost = total_cost + NEW.cost,
+                pending_total = pending_total + NEW.cost
+            WHERE id = 1 AND EXISTS (SELECT 1 FROM credit_totals WHERE credit_id = NEW.credit_id);
+            UPDATE credit_totals SET
+                total_cost = total_cost + NEW.cost,
+                item_count = item_count + 1,
+                version = (SELECT version FROM ledger_summary WHERE id = 1)
+            WHERE credit_id = NEW.credit_id;
+        END
+    """,
+    'trg_credits_update': """
+        CREATE TRIGGER trg_credits_update AFTER UPDATE ON credits
+        WHEN OLD.status IS NEW.status
+        BEGIN
+            UPDATE ledger_summary SET version = version + 1 WHERE id = 1;
+            UPDATE credit_totals SET version = (SELECT version FROM ledger_summary WHERE id = 1) WHERE credit_id = NEW.id;
+        END
+    """,
+    'trg_payments_insert': """
+        CREATE TRIGGER trg_payments_insert AFTER INSERT ON payments
+        BEGIN
+            UPDATE ledger_summary SET
+                version = version + 1,
+                paid_total = paid_total + NEW.amount,
+                pending_total = pending_total - NEW.amount
+            WHERE id = 1 AND EXISTS (SELECT 1 FROM credit_totals WHERE credit_id = NEW.credit_id);
+            UPDATE credit_totals SET
+                paid_amount = paid_amount + NEW.amount,
+                version = (SELECT version FROM ledger_summary WHERE id = 1)
+            WHERE credit_id = NEW.credit_id;
+        END
+    """,
+}
+
+def create_totals_tables(cursor):
+    """Create the running-totals tables. Returns True if they did not exist yet."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ledger_summary'")
+    created = cursor.fetchone() is None
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS credit_totals (
+            credit_id INTEGER PRIMARY KEY,
+            total_cost REAL NOT NULL DEFAULT 0,
+            item_count INTEGER NOT NULL DEFAULT 0,
+            paid_amount REAL NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ledger_summary (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            pending_total REAL NOT NULL DEFAULT 0,
+            paid_total REAL NOT NULL DEFAULT 0,
+            total_cost REAL NOT NULL DEFAULT 0,
+            item_count INTEGER NOT NULL DEFAULT 0,
+            pending_credits INTEGER NOT NULL DEFAULT 0,
+            paid_credits INTEGER NOT NULL DEFAULT 0,
+            total_credits INTEGER NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO ledger_summary (id) VALUES (1)")
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS deleted_credits (
+            credit_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    """)
+    
+    return created
+
+def create_totals_indexes(cursor):
+    # Delta sync walks credits and tombstones in version order
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_credit_totals_version ON credit_totals(version, credit_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_deleted_credits_version ON deleted_credits(version)")
+
+def create_totals_triggers(cursor):
+    """(Re)create the triggers that maintain the running totals"""
+    for name, sql in TOTALS_TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(sql)
+
+def rebuild_totals(cursor):
+    """Recompute credit_totals and ledger_summary from scratch"""
+    cursor.execute("DELETE FROM credit_totals")
+    cursor.execute("""
+        INSERT INTO credit_totals (credit_id, total_cost, item_count, paid_amount, version)
+        SELECT c.id, COALESCE(SUM(ci.cost), 0), COUNT(ci.id),
+               (SELECT COALESCE(SUM(amount), 0) FROM payments WHERE credit_id = c.id),
+               (SELECT COALESCE(MAX(version), 0) + 1 FROM ledger_summary)
+        FROM credits c
+        LEFT JOIN credit_items ci ON c.id = ci.credit_id
+        GROUP BY c.id
+    """)
+    cursor.execute("""
+        INSERT OR REPLACE INTO ledger_summary
+            (id, pending_total, paid_total, total_cost, item_count,
+             pending_credits, paid_credits, total_credits, version)
+        SELECT 1,
+               COALESCE(SUM(ct.total_cost - ct.paid_amount), 0),
+               COALESCE(SUM(ct.paid_amount), 0),
+               COALESCE(SUM(ct.total_cost), 0),
+               COALESCE(SUM(ct.item_count), 0),
+               COALESCE(SUM(CASE WHEN c.status = 'pending' THEN 1 ELSE 0 END), 0),
+               COALESCE(SUM(CASE WHEN c.status = 'paid' THEN 1 ELSE 0 END), 0),
+               COUNT(c.id),
+               (SELECT COALESCE(MAX(version), 0) + 1 FROM ledger_summary)
+        FROM credits c
+        JOIN credit_totals ct ON ct.credit_id = c.id
+    """)
+
+def check_totals(cursor):
+    """Compare the running totals against a full recount.
+
+    Returns a list of human-readable mismatches (empty when consistent).
+    """
+    problems = []
+    
+    cursor.execute("""
+        SELECT c.id, ct.total_cost, ct.item_count, ct.paid_amount,
+               COALESCE(agg.total_cost, 0) as actual_cost,
+               COALESCE(agg.item_count, 0) as actual_count,
+               COALESCE(paid.amount, 0) as actual_paid
+        FROM credits c
+        LEFT JOIN credit_totals ct ON ct.credit_id = c.id
+        LEFT JOIN (
+            SELECT credit_id, SUM(cost) as total_cost, COUNT(*) as item_count
+            FROM credit_items
+            GROUP BY credit_id
+        ) agg ON agg.credit_id = c.id
+        LEFT JOIN (
+            SELECT credit_id, SUM(amount) as amount
+            FROM payments
+            GROUP BY credit_id
+        ) paid ON paid.credit_id = c.id
+        WHERE ct.credit_id IS NULL
+           OR ABS(ct.total_cost - COALESCE(agg.total_cost, 0)) > 0.005
+           OR ct.item_count != COALESCE(agg.item_count, 0)
+           OR ABS(ct.paid_amount - COALESCE(paid.amount, 0)) > 0.005
+    """)
+    for row in cursor.fetchall():
+        problems.append(
+            f"credit {row[0]}: stored total={row[1]} items={row[2]} paid={row[3]}, "
+            f"actual total={row[4]} items={row[5]} paid={row[6]}"
+        )
+    
+    cursor.execute("""
+        SELECT credit_id FROM credit_totals
+        WHERE credit_id NOT IN (SELECT id FROM credits)
+    """)
+    for row in cursor.fetchall():
+        problems.append(f"credit_totals row for missing credit {row[0]}")
+    
+    cursor.execute("""
+        SELECT ls.pending_total, ls.paid_total, ls.total_cost, ls.item_count,
+               ls.pending_credits, ls.paid_credits, ls.total_credits,
+               actual.pending_total, actual.paid_total, actual.total_cost, actual.item_count,
+               actual.pending_credits, actual.paid_credits, actual.total_credits
+        FROM ledger_summary ls, (
+            SELECT COALESCE(SUM(ci.cost), 0) - (SELECT COALESCE(SUM(p.amount), 0) FROM payments p
+                                                    JOIN credits pc ON pc.id = p.credit_id) as pending_total,
+                   (SELECT COALESCE(SUM(p.amount), 0) FROM payments p
+                    JOIN credits pc ON pc.id = p.credit_id) as paid_total,
+                   COALESCE(SUM(ci.cost), 0) as total_cost,
+                   COUNT(ci.id) as item_count,
+                   (SELECT COUNT(*) FROM credits WHERE status = 'pending') as pending_credits,
+                   (SELECT COUNT(*) FROM credits WHERE status = 'paid') as paid_credits,
+                   (SELECT COUNT(*) FROM credits) as total_credits
+            FROM credits c
+            JOIN credit_items ci ON ci.credit_id = c.id
+        ) actual
+        WHERE ls.id = 1
+    """)
+    row = cursor.fetchone()
+    fields = ('pending_total', 'paid_total', 'total_cost', 'item_count',
+              'pending_credits', 'paid_credits', 'total_credits')
+    if row is None:
+        problems.append("ledger_summary row is missing")
+    else:
+        for idx, field in enumerate(fields):
+            stored, actual = row[idx], row[idx + len(fields)]
+            if abs((stored or 0) - (actual or 0)) > 0.005:
+                problems.append(f"ledger_summary.{field}: stored={stored}, actual={actual}")
+    
+    return problems
+
+# Full-text search over customer names, phone numbers and item products.
+# Both tables use external content, so the indexed text lives only in
+# credits/credit_items; the triggers below keep the indexes in sync.
+SEARCH_TRIGGERS = {
+    'trg_credits_fts_insert': """
+        CREATE TRIGGER trg_credits_fts_insert AFTER INSERT ON credits
+        BEGIN
+            INSERT INTO credits_fts (rowid, customer_name, phone_number)
+            VALUES (NEW.id, NEW.customer_name, NEW.phone_number);
+        END
+    """,
+    'trg_credits_fts_delete': """
+        CREATE TRIGGER trg_credits_fts_delete AFTER DELETE ON credits
+        BEGIN
+            INSERT INTO credits_fts (credits_fts, rowid, customer_name, phone_number)
+            VALUES ('delete', OLD.id, OLD.customer_name, OLD.phone_number);
+        END
+    """,
+    'trg_credits_fts_update': """
+        CREATE TRIGGER trg_credits_fts_update AFTER UPDATE OF customer_name, phone_number ON credits
+        BEGIN
+            INSERT INTO credits_fts (credits_fts, rowid, customer_name, phone_number)
+            VALUES ('delete', OLD.id, OLD.customer_name, OLD.phone_number);
+            INSERT INTO credits_fts (rowid, customer_name, phone_number)
+            VALUES (NEW.id, NEW.customer_name, NEW.phone_number);
+        END
+    """,
+    'trg_items_fts_insert': """
+        CREATE TRIGGER trg_items_fts_insert AFTER INSERT ON credit_items
+        BEGIN
+            INSERT INTO credit_items_fts (rowid, product) VALUES (NEW.id, NEW.product);
+        END
+    """,
+    'trg_items_fts_delete': """
+        CREATE TRIGGER trg_items_fts_delete AFTER DELETE ON credit_items
+        BEGIN
+            INSERT INTO credit_items_fts (credit_items_fts, rowid, product)
+            VALUES ('delete', OLD.id, OLD.product);
+        END
+    """,
+    'trg_items_fts_update': """
+        CREATE TRIGGER trg_items_fts_update AFTER UPDATE OF product ON credit_items
+        BEGIN
+            INSERT INTO credit_items_fts (credit_items_fts, rowid, product)
+            VALUES ('delete', OLD.id, OLD.product);
+            INSERT INTO credit_items_fts (rowid, product) VALUES (NEW.id, NEW.product);
+        END
+    """,
+}
+
+def create_search_index(cursor):
+    """Create the FTS5 search tables and triggers.
+
+    Returns False if this SQLite build lacks FTS5, in which case search
+    falls back to LIKE matching.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'credits_fts'")
+    created = cursor.fetchone() is None
+    
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS credits_fts USING fts5(
+                customer_name, phone_number,
+                content='credits', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS credit_items_fts USING fts5(
+                product,
+                content='credit_items', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        app.logger.warning("Full-text search disabled: %s", e)
+        return False
+    
+    for name, sql in SEARCH_TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(sql)
+    
+    if created:
+        # Index the rows that existed before the search tables
+        cursor.execute("INSERT INTO credits_fts (credits_fts) VALUES ('rebuild')")
+        cursor.execute("INSERT INTO credit_items_fts (credit_items_fts) VALUES ('rebuild')")
+    return True
+
+def build_fts_query(text):
+    """Turn free text into an FTS5 query where every word is a quoted prefix term"""
+    terms = re.findall(r'\w+', text)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+# Aging report: balances of pending credits per due date, kept up to date
+# by triggers.
+# Buckets are relative to today, so they are summed from this table at
+# read time - one row per distinct due date instead of one per credit.
+AGING_BUCKETS = [
+    # (key, label, fewest days overdue, most days overdue)
+    ('current', 'Dae pa abot', None, 0),
+    ('1_7', '1–7 aldaw', 1, 7),
+    ('8_30', '8–30 aldaw', 8, 30),
+    ('31_90', '31–90 aldaw', 31, 90),
+    ('over_90', 'Lampas 90 aldaw', 91, None),
+]
+
+AGING_TRIGGERS = {
+    'trg_aging_credits_insert': """
+        CREATE TRIGGER trg_aging_credits_insert AFTER INSERT ON credits
+        WHEN NEW.status IS 'pending'
+        BEGIN
+            INSERT INTO due_date_totals (due_date, pending_credits) VALUES (NEW.estimated_payment_date, 1)
+            ON CONFLICT (due_date) DO UPDATE SET pending_credits = pending_credits + 1;
+        END
+    """,
+    'trg_aging_credits_update': """
+        CREATE TRIGGER trg_aging_credits_update AFTER UPDATE OF status, estimated_payment_date ON credits
+        WHEN (OLD.status IS 'pending' OR NEW.status IS 'pending')
+         AND (OLD.status IS NOT NEW.status OR OLD.estimated_payment_date IS NOT NEW.estimated_payment_date)
+        BEGIN
+            UPDATE due_date_totals SET
+                pending_credits = pending_credits - 1,
+                pending_total = pending_total - ((SELECT COALESCE(SUM(cost), 0) FROM credit_items WHERE credit_id = OLD.id)
+                                 - (SELECT COALESCE(SUM(amount), 0) FROM payments WHERE credit_id = OLD.id))
+            WHERE due_date = OLD.estimated_payment_date AND OLD.status IS 'pending';
+            DELETE FROM due_date_totals WHERE due_date = OLD.estimated_payment_date AND pending_credits <= 0;
+            INSERT INTO due_date_totals (due_date, pending_total, pending_credits)
+            SELECT NEW.estimated_payment_date,
+                   COALESCE(SUM(cost), 0) - (SELECT COALESCE(SUM(amount), 0) FROM payments WHERE credit_id = NEW.id), 1
+            FROM credit_items WHERE credit_id = NEW.id
+            HAVING NEW.status IS 'pending'
+            ON CONFLICT (due_date) DO UPDATE SET
+                pending_credits = pending_credits + 1,
+                pending_total = pending_total + excluded.pending_total;
+        END
+    """,
+    'trg_aging_credits_delete': """
+        CREATE TRIGGER trg_aging_credits_delete AFTER DELETE ON credits
+        WHEN OLD.status IS 'pending'
+        BEGIN
+            UPDATE due_date_totals SET
+                pending_credits = pending_credits - 1,
+                pending_total = pending_total - ((SELECT COALESCE(SUM(cost), 0) FROM credit_items WHERE credit_id = OLD.id)
+                                 - (SELECT COALESCE(SUM(amount), 0) FROM payments WHERE credit_id = OLD.id))
+            WHERE due_date = OLD.estimated_payment_date;
+            DELETE FROM due_date_totals WHERE due_date = OLD.estimated_payment_date AND pending_credits <= 0;
+        END
+    """,
+    'trg_aging_items_insert': """
+        CREATE TRIGGER trg_aging_items_insert AFTER INSERT ON credit_items
+        BEGIN
+            UPDATE due_date_totals SET pending_total = pending_total + NEW.cost
+            WHERE due_date = (SELECT estimated_payment_date FROM credits WHERE id = NEW.credit_id AND status = 'pending');
+        END
+    """,
+    'trg_aging_items_delete': """
+        CREATE TRIGGER trg_aging_items_delete AFTER DELETE ON credit_items
+        BEGIN
+            UPDATE due_date_totals SET pending_total = pending_total - OLD.cost
+            WHERE due_date = (SELECT estimated_payment_date FROM credits WHERE id = OLD.credit_id AND status = 'pending');
+        END
+    """,
+    'trg_aging_items_update': """
+        CREATE TRIGGER trg_aging_items_update AFTER UPDATE OF cost, credit_id ON credit_items
+        BEGIN
+            UPDATE due_date_totals SET pending_total = pending_total - OLD.cost
+            WHERE due_date = (SELECT estimated_payment_date FROM credits WHERE id = OLD.credit_id AND status = 'pending');
+            UPDATE due_date_totals SET pending_total = pending_total + NEW.cost
+            WHERE due_date = (SELECT estimated_payment_date FROM credits WHERE id = NEW.credit_id AND status = 'pending');
+        END
+    """,
+    'trg_aging_payments_insert': """
+        CREATE TRIGGER trg_aging_payments_insert AFTER INSERT ON payments
+        BEGIN
+            UPDATE due_date_totals SET pending_total = pending_total - NEW.amount
+            WHERE due_date = (SELECT estimated_payment_date FROM credits WHERE id = NEW.credit_id AND status = 'pending');
+        END
+    """,
+}
+
+def create_aging_index(cursor):
+    """Create the per-due-date balances table and its triggers"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'due_date_totals'")
+    created = cursor.fetchone() is None
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS due_date_totals (
+            due_date TEXT PRIMARY KEY,
+            pending_total REAL NOT NULL DEFAULT 0,
+            pending_credits INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    
+    for name, sql in AGING_TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(sql)
+    
+    if created:
+        rebuild_aging(cursor)
+
+def rebuild_aging(cursor):
+    """Recompute due_date_totals from scratch"""
+    cursor.execute("DELETE FROM due_date_totals")
+    cursor.execute("""
+        INSERT INTO due_date_totals (due_date, pending_total, pending_credits)
+        SELECT c.estimated_payment_date, COALESCE(SUM(ct.total_cost - ct.paid_amount), 0), COUNT(*)
+        FROM credits c
+        LEFT JOIN credit_totals ct ON ct.credit_id = c.id
+        WHERE c.status = 'pending'
+        GROUP BY c.estimated_payment_date
+    """)
+
+def check_aging(cursor):
+    """Compare due_date_totals against a full recount; returns mismatches"""
+    cursor.execute("""
+        WITH actual AS (
+            SELECT c.estimated_payment_date as due_date,
+                   COALESCE(SUM(
+                       (SELECT COALESCE(SUM(cost), 0) FROM credit_items WHERE credit_id = c.id)
+                       - (SELECT COALESCE(SUM(amount), 0) FROM payments WHERE credit_id = c.id)
+                   ), 0) as pending_total,
+                   COUNT(*) as pending_credits
+            FROM credits c
+            WHERE c.status = 'pending'
+            GROUP BY c.estimated_payment_date
+        )
+        SELECT actual.due_date, d.pending_total, d.pending_credits,
+               actual.pending_total, actual.pending_credits
+        FROM actual
+        LEFT JOIN due_date_totals d ON d.due_date = actual.due_date
+        WHERE d.due_date IS NULL
+           OR ABS(d.pending_total - actual.pending_total) > 0.005
+           OR d.pending_credits != actual.pending_credits
+        UNION ALL
+        SELECT d.due_date, d.pending_total, d.pending_credits, NULL, NULL
+        FROM due_date_totals d
+        WHERE d.due_date NOT IN (SELECT due_date FROM actual)
+    """)
+    return [
+        f"due_date_totals[{row[0]}]: stored total={row[1]} credits={row[2]}, "
+        f"actual total={row[3]} credits={row[4]}"
+        for row in cursor.fetchall()
+    ]
+
+def aging_bounds(today):
+    """Earliest due date (inclusive) for each bucket, or None for the oldest"""
+    bounds = {}
+    for key, label, fewest, most in AGING_BUCKETS:
+        bounds[key] = (today - timedelta(days=most)).isoformat() if most is not None else None
+    return bounds
+
+def fetch_aging(cursor, today):
+    """Pending credits and amounts per aging bucket, in AGING_BUCKETS order"""
+    bounds = aging_bounds(today)
+    cases = ' '.join(
+        f"WHEN due_date >= :{key} THEN '{key}'"
+        for key, label, fewest, most in AGING_BUCKETS if bounds[key] is not None
+    )
+    cursor.execute(f"""
+        SELECT CASE {cases} ELSE '{AGING_BUCKETS[-1][0]}' END as bucket,
+               SUM(pending_credits) as credits, SUM(pending_total) as total
+        FROM due_date_totals
+        GROUP BY bucket
+    """, bounds)
+    found = {row['bucket']: row for row in cursor.fetchall()}
+    
+    buckets = []
+    for key, label, fewest, most in AGING_BUCKETS:
+        row = found.get(key)
+        buckets.append({
+            'key': key,
+            'label': label,
+            'credits': row['credits'] if row else 0,
+            'total': row['total'] if row else 0,
+        })
+    return buckets
+
+def fetch_overdue_credits(cursor, today, bucket=None):
+    """Pending credits past their due date, most overdue first.
+
+    With a bucket key, only credits in that aging bucket are returned.
+    Served by idx_status_due on credits(status, estimated_payment_date).
+    """
+    fewest, most = 1, None
+    for key, label, low, high in AGING_BUCKETS:
+        if key == bucket and key != 'current':
+            fewest, most = low, high
+    
+    conditions = ["c.status = 'pending'", "c.estimated_payment_date <= ?"]
+    params = [(today - timedelta(days=fewest)).isoformat()]
+    if most is not None:
+        conditions.append("c.estimated_payment_date >= ?")
+        params.append((today - timedelta(days=most)).isoformat())
+    
+    cursor.execute(f"""
+        SELECT c.id, c.customer_name, c.estimated_payment_date,
+               c.status, c.created_at, c.paid_date,
+               COALESCE(ct.total_cost, 0) as total_cost,
+               COALESCE(ct.item_count, 0) as item_count,
+               COALESCE(ct.paid_amount, 0) as paid_amount,
+               COALESCE(ct.total_cost - ct.paid_amount, 0) as balance,
+               COALESCE(ct.version, 0) as version
+        FROM credits c
+        LEFT JOIN credit_totals ct ON ct.credit_id = c.id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY c.estimated_payment_date, c.id
+        LIMIT ?
+    """, params + [SEARCH_LIMIT])
+    return [dict(row) for row in cursor.fetchall()]
+
+# Payments are append-only: settling an item or a credit, or paying part of
+# a credit, adds a row here instead of deleting the items. Daily rollups of
+# what was charged and collected are kept by triggers, so the collection
+# reports read one row per day however much history piles up. Like the
+# running totals, the rollups cover the credits that still exist; the
+# payments of a deleted credit stay in the payments table only.
+ROLLUP_TRIGGERS = {
+    'trg_rollup_items_insert': """
+        CREATE TRIGGER trg_rollup_items_insert AFTER INSERT ON credit_items
+        BEGIN
+            INSERT INTO daily_rollups (day, charged, items_charged) VALUES (date(NEW.added_at), NEW.cost, 1)
+            ON CONFLICT (day) DO UPDATE SET
+                charged = charged + excluded.charged,
+                items_charged = items_charged + 1;
+        END
+    """,
+    'trg_rollup_items_delete': """
+        CREATE TRIGGER trg_rollup_items_delete AFTER DELETE ON credit_items
+        BEGIN
+            UPDATE daily_rollups SET
+                charged = charged - OLD.cost,
+                items_charged = items_charged - 1
+            WHERE day = date(OLD.added_at);
+        END
+    """,
+    'trg_rollup_items_update': """
+        CREATE TRIGGER trg_rollup_items_update AFTER UPDATE OF cost ON credit_items
+        BEGIN
+            UPDATE daily_rollups SET charged = charged - OLD.cost + NEW.cost
+            WHERE day = date(NEW.added_at);
+        END
+    """,
+    'trg_rollup_payments_insert': """
+        CREATE TRIGGER trg_rollup_payments_insert AFTER INSERT ON payments
+        BEGIN
+            INSERT INTO daily_rollups (day, collected, payments) VALUES (date(NEW.paid_at), NEW.amount, 1)
+            ON CONFLICT (day) DO UPDATE SET
+                collected = collected + excluded.collected,
+                payments = payments + 1;
+        END
+    """,
+    'trg_rollup_credits_delete': """
+        CREATE TRIGGER trg_rollup_credits_delete AFTER DELETE ON credits
+        BEGIN
+            UPDATE daily_rollups SET
+                collected = collected - (SELECT COALESCE(SUM(amount), 0) FROM payments
+                                         WHERE credit_id = OLD.id AND date(paid_at) = daily_rollups.day),
+                payments = payments - (SELECT COUNT(*) FROM payments
+                                       WHERE credit_id = OLD.id AND date(paid_at) = daily_rollups.day)
+            WHERE day IN (SELECT date(paid_at) FROM payments WHERE credit_id = OLD.id);
+        END
+    """,
+}
+
+def create_payments_table(cursor):
+    """Create the payments table. Returns True if it did not exist yet."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'payments'")
+    created = cursor.fetchone() is None
+    
+    # No foreign key: the payment history outlives a deleted credit
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            credit_id INTEGER NOT NULL,
+            item_id INTEGER,
+            amount REAL NOT NULL CHECK (amount > 0),
+            paid_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_credit ON payments(credit_id, amount)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_paid_at ON payments(paid_at, amount)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_amount ON payments(amount)")
+    
+    for operation in ('UPDATE', 'DELETE'):
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_payments_no_{operation.lower()} BEFORE {operation} ON payments
+            BEGIN
+                SELECT RAISE(ABORT, 'payments are append-only');
+            END
+        """)
+    return created
+
+def backfill_payments(cursor):
+    """Record credits settled before the payments table existed.
+
+    Paying a credit used to only set its status, and paying an item deleted
+    it, so the paid credits' remaining items are the only history left.
+    """
+    cursor.execute("""
+        INSERT INTO payments (credit_id, amount, paid_at)
+        SELECT c.id, SUM(ci.cost), COALESCE(c.paid_date, c.created_at)
+        FROM credits c
+        JOIN credit_items ci ON ci.credit_id = c.id
+        WHERE c.status = 'paid'
+        GROUP BY c.id
+        HAVING SUM(ci.cost) > 0
+    """)
+    cursor.execute("""
+        UPDATE credit_items
+        SET status = 'paid',
+            paid_date = (SELECT COALESCE(c.paid_date, c.created_at) FROM credits c WHERE c.id = credit_items.credit_id)
+        WHERE status IS NOT 'paid'
+          AND credit_id IN (SELECT id FROM credits WHERE status = 'paid')
+    """)
+
+def create_rollups(cursor):
+    """Create the daily rollup table and the triggers that maintain it"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_rollups'")
+    created = cursor.fetchone() is None
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS daily_rollups (
+            day TEXT PRIMARY KEY,
+            charged REAL NOT NULL DEFAULT 0,
+            items_charged INTEGER NOT NULL DEFAULT 0,
+            collected REAL NOT NULL DEFAULT 0,
+            payments INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """)
+    
+    for name, sql in ROLLUP_TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(sql)
+    
+    if created:
+        rebuild_rollups(cursor)
+
+ROLLUP_RECOUNT = """
+    SELECT day, SUM(charged) as charged, SUM(items_charged) as items_charged,
+           SUM(collected) as collected, SUM(payments) as payments
+    FROM (
+        SELECT date(added_at) as day, cost as charged, 1 as items_charged, 0 as collected, 0 as payments
+        FROM credit_items
+        UNION ALL
+        SELECT date(p.paid_at), 0, 0, p.amount, 1
+        FROM payments p
+        JOIN credits c ON c.id = p.credit_id
+    )
+    GROUP BY day
+"""
+
+def rebuild_rollups(cursor):
+    """Recompute daily_rollups from the items and payments"""
+    cursor.execute("DELETE FROM daily_rollups")
+    cursor.execute(f"""
+        INSERT INTO daily_rollups (day, charged, items_charged, collected, payments)
+        {ROLLUP_RECOUNT}
+    """)
+
+def check_rollups(cursor):
+    """Compare daily_rollups against a full recount; returns mismatches"""
+    cursor.execute(f"""
+        WITH actual AS ({ROLLUP_RECOUNT})
+        SELECT actual.day, r.charged, r.collected, actual.charged, actual.collected
+        FROM actual
+        LEFT JOIN daily_rollups r ON r.day = actual.day
+        WHERE r.day IS NULL
+           OR ABS(r.charged - actual.charged) > 0.005
+           OR ABS(r.collected - actual.collected) > 0.005
+           OR r.items_charged != actual.items_charged
+           OR r.payments != actual.payments
+        UNION ALL
+        SELECT r.day, r.charged, r.collected, 0, 0
+        FROM daily_rollups r
+        WHERE r.day NOT IN (SELECT day FROM actual)
+          AND (ABS(r.charged) > 0.005 OR ABS(r.collected) > 0.005)
+    """)
+    return [
+        f"daily_rollups[{row[0]}]: stored charged={row[1]} collected={row[2]}, "
+        f"actual charged={row[3]} collected={row[4]}"
+        for row in cursor.fetchall()
+    ]
+
+def fetch_collections(cursor, start, end):
+    """Daily charges and collections between two ISO dates, with the collection rate.
+
+    The rate is what was collected in the period over what was owed in it:
+    the balance carried in from before the period plus the new charges.
+    """
+    cursor.execute("""
+        SELECT COALESCE(SUM(charged - collected), 0) FROM daily_rollups WHERE day < ?
+    """, (start,))
+    opening_balance = cursor.fetchone()[0]
+    
+    cursor.execute("""
+        SELECT day, charged, items_charged, collected, payments
+        FROM daily_rollups
+        WHERE day BETWEEN ? AND ?
+        ORDER BY day DESC
+    """, (start, end))
+    days = [dict(row) for row in cursor.fetchall()]
+    
+    charged = sum(day['charged'] for day in days)
+    collected = sum(day['collected'] for day in days)
+    owed = opening_balance + charged
+    return {
+        'from': start,
+        'to': end,
+        'opening_balance': opening_balance,
+        'charged': charged,
+        'collected': collected,
+        'collection_rate': collected / owed if owed > 0.005 else None,
+        'days': days,
+    }
+
+# Customers: one row per person, matched on a normalized name key, so
+# "Juan dela Cruz" and "juan  DELA CRUZ." share a ledger. Credits point at
+# their customer by ID. The customer's totals, outstanding balance and
+# last activity are kept by triggers like the per-credit totals, so the
+# directory reads them straight from customers, ordered by an index.
+CUSTOMER_TRIGGERS = {
+    'trg_customers_credits_insert': """
+        CREATE TRIGGER trg_customers_credits_insert AFTER INSERT ON credits
+        WHEN NEW.customer_id IS NOT NULL
+        BEGIN
+            UPDATE customers SET
+                credit_count = credit_count + 1,
+                last_activity_at = MAX(COALESCE(last_activity_at, ''), NEW.created_at)
+            WHERE id = NEW.customer_id;
+        END
+    """,
+    'trg_customers_credits_delete': """
+        CREATE TRIGGER trg_customers_credits_delete BEFORE DELETE ON credits
+        WHEN OLD.customer_id IS NOT NULL
+        BEGIN
+            UPDATE customers SET
+                credit_count = credit_count - 1,
+                total_charged = total_charged - COALESCE((SELECT total_cost FROM credit_totals WHERE credit_id = OLD.id), 0),
+                total_paid = total_paid - COALESCE((SELECT paid_amount FROM credit_totals WHERE credit_id = OLD.id), 0),
+                balance = balance - COALESCE((SELECT total_cost - paid_amount FROM credit_totals WHERE credit_id = OLD.id), 0)
+            WHERE id = OLD.customer_id;
+        END
+    """,
+    'trg_customers_credits_move': """
+        CREATE TRIGGER trg_customers_credits_move AFTER UPDATE OF customer_id ON credits
+        WHEN OLD.customer_id IS NOT NEW.customer_id
+        BEGIN
+            UPDATE customers SET
+                credit_count = credit_count - 1,
+                total_charged = total_charged - COALESCE((SELECT total_cost FROM credit_totals WHERE credit_id = OLD.id), 0),
+                total_paid = total_paid - COALESCE((SELECT paid_amount FROM credit_totals WHERE credit_id = OLD.id), 0),
+                balance = balance - COALESCE((SELECT total_cost - paid_amount FROM credit_totals WHERE credit_id = OLD.id), 0)
+            WHERE id = OLD.customer_id;
+            UPDATE customers SET
+                credit_count = credit_count + 1,
+                total_charged = total_charged + COALESCE((SELECT total_cost FROM credit_totals WHERE credit_id = NEW.id), 0),
+                total_paid = total_paid + COALESCE((SELECT paid_amount FROM credit_totals WHERE credit_id = NEW.id), 0),
+                balance = balance + COALESCE((SELECT total_cost - paid_amount FROM credit_totals WHERE credit_id = NEW.id), 0),
+                last_activity_at = MAX(
+                    COALESCE(last_activity_at, ''), NEW.created_at,
+                    COALESCE((SELECT MAX(added_at) FROM credit_items WHERE credit_id = NEW.id), ''),
+                    COALESCE((SELECT MAX(paid_at) FROM payments WHERE credit_id = NEW.id), '')
+                )
+            WHERE id = NEW.customer_id;
+        END
+    """,
+    'trg_customers_items_insert': """
+        CREATE TRIGGER trg_customers_items_insert AFTER INSERT ON credit_items
+        BEGIN
+            UPDATE customers SET
+                total_charged = total_charged + NEW.cost,
+                balance = balance + NEW.cost,
+                last_activity_at = MAX(COALESCE(last_activity_at, ''), NEW.added_at)
+            WHERE id = (SELECT customer_id FROM credits WHERE id = NEW.credit_id);
+        END
+    """,
+    # When a credit is deleted its items go by cascade after the credit row,
+    # so the lookup finds no customer; trg_customers_credits_delete has
+    # already taken the credit's totals off
+    'trg_customers_items_delete': """
+        CREATE TRIGGER trg_customers_items_delete AFTER DELETE ON credit_items
+        BEGIN
+            UPDATE customers SET
+                total_charged = total_charged - OLD.cost,
+                balance = balance - OLD.cost
+            WHERE id = (SELECT customer_id FROM credits WHERE id = OLD.credit_id);
+        END
+    """,
+    'trg_customers_items_update': """
+        CREATE TRIGGER trg_customers_items_update AFTER UPDATE OF cost ON credit_items
+        BEGIN
+            UPDATE customers SET
+                total_charged = total_charged - OLD.cost + NEW.cost,
+                balance = balance - OLD.cost + NEW.cost
+            WHERE id = (SELECT customer_id FROM credits WHERE id = NEW.credit_id);
+        END
+    """,
+    'trg_customers_payments_insert': """
+        CREATE TRIGGER trg_customers_payments_insert AFTER INSERT ON payments
+        BEGIN
+            UPDATE customers SET
+                total_paid = total_paid + NEW.amount,
+                balance = balance - NEW.amount,
+                last_activity_at = MAX(COALESCE(last_activity_at, ''), NEW.paid_at)
+            WHERE id = (SELECT customer_id FROM credits WHERE id = NEW.credit_id);
+        END
+    """,
+}
+
+def customer_key(name):
+    """Normalize a customer name for matching: case, accents, punctuation and spacing are ignored"""
+    text = unicodedata.normalize('NFKD', name or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r'[^\w\s]', ' ', text.casefold())
+    return ' '.join(text.split()) or (name or '').strip().casefold()
+
+def create_customers(cursor):
+    """Create the customers table, link existing credits to it and add its triggers"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS customers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            name_key TEXT NOT NULL UNIQUE,
+            phone_number TEXT,
+            credit_count INTEGER NOT NULL DEFAULT 0,
+            total_charged REAL NOT NULL DEFAULT 0,
+            total_paid REAL NOT NULL DEFAULT 0,
+            balance REAL NOT NULL DEFAULT 0,
+            last_activity_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    add_column(cursor, 'credits', 'customer_id', "INTEGER REFERENCES customers(id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_credits_customer ON credits(customer_id, created_at)")
+    # The directory pages through customers by balance
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_customers_balance ON customers(balance DESC, id DESC)")
+    
+    link_customers(cursor)
+    for name, sql in CUSTOMER_TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(sql)
+    rebuild_customers(cursor)
+
+def link_customers(cursor):
+    """Attach credits without a customer to one, adding customers as needed"""
+    # One customer per name key, named as on their first credit
+    cursor.connection.create_function('customer_key', 1, customer_key, deterministic=True)
+    cursor.execute("""
+        INSERT OR IGNORE INTO customers (name, name_key, created_at)
+        SELECT customer_name, customer_key(customer_name), MIN(created_at)
+        FROM credits
+        WHERE customer_id IS NULL
+        GROUP BY customer_key(customer_name)
+    """)
+    cursor.execute("""
+        UPDATE credits SET customer_id = (
+            SELECT id FROM customers WHERE name_key = customer_key(credits.customer_name)
+        )
+        WHERE customer_id IS NULL
+    """)
+    cursor.execute("""
+        UPDATE customers SET phone_number = (
+            SELECT c.phone_number FROM credits c
+            WHERE c.customer_id = customers.id AND c.phone_number IS NOT NULL AND c.phone_number != ''
+            ORDER BY c.created_at DESC
+            LIMIT 1
+        )
+        WHERE phone_number IS NULL
+    """)
+
+CUSTOMER_RECOUNT = """
+    SELECT cu.id,
+           COUNT(c.id) as credit_count,
+           COALESCE(SUM(ct.total_cost), 0) as total_charged,
+           COALESCE(SUM(ct.paid_amount), 0) as total_paid
+    FROM customers cu
+    LEFT JOIN credits c ON c.customer_id = cu.id
+    LEFT JOIN credit_totals ct ON ct.credit_id = c.id
+    GROUP BY cu.id
+"""
+
+def rebuild_customers(cursor):
+    """Recompute every customer's totals and last activity"""
+    cursor.execute("""
+        UPDATE customers SET
+            credit_count = (SELECT COUNT(*) FROM credits WHERE customer_id = customers.id),
+            total_charged = (SELECT COALESCE(SUM(ct.total_cost), 0) FROM credits c
+                             JOIN credit_totals ct ON ct.credit_id = c.id WHERE c.customer_id = customers.id),
+            total_paid = (SELECT COALESCE(SUM(ct.paid_amount), 0) FROM credits c
+                          JOIN credit_totals ct ON ct.credit_id = c.id WHERE c.customer_id = customers.id)
+    """)
+    cursor.execute("UPDATE customers SET balance = total_charged - total_paid")
+    cursor.execute("""
+        UPDATE customers SET last_activity_at = (
+            SELECT MAX(activity) FROM (
+                SELECT c.created_at as activity FROM credits c WHERE c.customer_id = customers.id
+                UNION ALL
+                SELECT MAX(ci.added_at) FROM credit_items ci JOIN credits c ON c.id = ci.credit_id
+                WHERE c.customer_id = customers.id
+                UNION ALL
+                SELECT MAX(p.paid_at) FROM payments p JOIN credits c ON c.id = p.credit_id
+                WHERE c.customer_id = customers.id
+            )
+        )
+    """)
+
+def check_customers(cursor):
+    """Compare the customers' maintained totals against a full recount; returns mismatches"""
+    cursor.execute(f"""
+        WITH actual AS ({CUSTOMER_RECOUNT})
+        SELECT cu.id, cu.credit_count, cu.total_charged, cu.total_paid, cu.balance,
+               actual.credit_count, actual.total_charged, actual.total_paid
+        FROM customers cu
+        JOIN actual ON actual.id = cu.id
+        WHERE cu.credit_count != actual.credit_count
+           OR ABS(cu.total_charged - actual.total_charged) > 0.005
+           OR ABS(cu.total_paid - actual.total_paid) > 0.005
+           OR ABS(cu.balance - (actual.total_charged - actual.total_paid)) > 0.005
+    """)
+    problems = [
+        f"customers[{row[0]}]: stored credits={row[1]} charged={row[2]} paid={row[3]} balance={row[4]}, "
+        f"actual credits={row[5]} charged={row[6]} paid={row[7]}"
+        for row in cursor.fetchall()
+    ]
+    cursor.execute("SELECT COUNT(*) FROM credits WHERE customer_id IS NULL")
+    unlinked = cursor.fetchone()[0]
+    if unlinked:
+        problems.append(f"credits: {unlinked} not linked to a customer")
+    return problems
+
+def find_or_create_customer(cursor, name, phone_number=None):
+    """Return the ID of the customer matching `name`, adding them if new.
+
+    A phone number given here replaces the one on file.
+    """
+    key = customer_key(name)
+    cursor.execute("""
+        INSERT OR IGNORE INTO customers (name, name_key, phone_number) VALUES (?, ?, ?)
+    """, (name.strip(), key, phone_number))
+    cursor.execute("SELECT id, phone_number FROM customers WHERE name_key = ?", (key,))
+    customer = cursor.fetchone()
+    if phone_number and customer['phone_number'] != phone_number:
+        cursor.execute("UPDATE customers SET phone_number = ? WHERE id = ?", (phone_number, customer['id']))
+    return customer['id']
+
+CUSTOMER_COLUMNS = """
+    SELECT id, name, phone_number, credit_count, total_charged, total_paid, balance, last_activity_at
+    FROM customers
+"""
+
+def fetch_customer(cursor, customer_id):
+    cursor.execute(CUSTOMER_COLUMNS + " WHERE id = ?", (customer_id,))
+    return cursor.fetchone()
+
+def fetch_customer_page(cursor, per_page, after=None):
+    """One page of customers, largest balance first, by a (balance, id) keyset cursor.
+
+    Returns (customers, has_more). Served by idx_customers_balance.
+    """
+    if after:
+        cursor.execute(CUSTOMER_COLUMNS + """
+            WHERE (balance, id) < (?, ?)
+            ORDER BY balance DESC, id DESC
+            LIMIT ?
+        """, (after[0], after[1], per_page + 1))
+    else:
+        cursor.execute(CUSTOMER_COLUMNS + """
+            ORDER BY balance DESC, id DESC
+            LIMIT ?
+        """, (per_page + 1,))
+    rows = [dict(row) for row in cursor.fetchall()]
+    return rows[:per_page], len(rows) > per_page
+
+def fetch_customer_credits(cursor, customer_id):
+    """A customer's credits, newest first"""
+    cursor.execute("""
+        SELECT c.id, c.customer_name, c.estimated_payment_date,
+               c.status, c.created_at, c.paid_date,
+               COALESCE(ct.total_cost, 0) as total_cost,
+               COALESCE(ct.item_count, 0) as item_count,
+               COALESCE(ct.paid_amount, 0) as paid_amount,
+               COALESCE(ct.total_cost - ct.paid_amount, 0) as balance,
+               COALESCE(ct.version, 0) as version
+        FROM credits c
+        LEFT JOIN credit_totals ct ON ct.credit_id = c.id
+        WHERE c.customer_id = ?
+        ORDER BY c.created_at DESC, c.id DESC
+        LIMIT ?
+    """, (customer_id, SEARCH_LIMIT))
+    return [dict(row) for row in cursor.fetchall()]
+
+def merge_customers(cursor, customer_id, into_id):
+    """Move every credit of one customer to another and remove the first.
+
+    Returns False if either customer does not exist.
+    """
+    source, target = fetch_customer(cursor, customer_id), fetch_customer(cursor, into_id)
+    if source is None or target is None:
+        return False
+    cursor.execute("UPDATE credits SET customer_id = ? WHERE customer_id = ?", (into_id, customer_id))
+    if not target['phone_number'] and source['phone_number']:
+        cursor.execute("UPDATE customers SET phone_number = ? WHERE id = ?", (source['phone_number'], into_id))
+    cursor.execute("DELETE FROM customers WHERE id = ?", (customer_id,))
+    # Moving no credits bumps nothing, but the customer list still changed
+    cursor.execute("UPDATE ledger_summary SET version = version + 1 WHERE id = 1")
+    return True
+
+def fetch_customer_balances(cursor, limit):
+    """Customers who still owe, largest balance first, from their maintained balances"""
+    cursor.execute("""
+        SELECT id, name as customer_name,
+               credit_count as credits,
+               total_charged as total_cost,
+               total_paid as paid_amount,
+               balance
+        FROM customers
+        WHERE balance > 0.005
+        ORDER BY balance DESC, id DESC
+        LIMIT ?
+    """, (limit,))
+    return [dict(row) for row in cursor.fetchall()]
+
+# Live updates: every change to a credit, an item or a payment appends a
+# row to ledger_events from a trigger, in the changing transaction, so an
+# event becomes visible exactly when its change commits, whichever route or
+# process made it. /api/events sends them to open pages as Server-Sent
+# Events. Only the newest LIVE_EVENTS_KEEP are kept; a page that fell
+# further behind is told to reload.
+LIVE_EVENTS_KEEP = 10000
+LIVE_EVENTS_LIMIT = 200
+
+LIVE_EVENT_TRIGGERS = {
+    'trg_events_credits_insert': """
+        CREATE TRIGGER trg_events_credits_insert AFTER INSERT ON credits
+        BEGIN
+            INSERT INTO ledger_events (kind, credit_id) VALUES ('credit_added', NEW.id);
+        END
+    """,
+    'trg_events_credits_update': """
+        CREATE TRIGGER trg_events_credits_update AFTER UPDATE ON credits
+        BEGIN
+            INSERT INTO ledger_events (kind, credit_id) VALUES ('credit_updated', NEW.id);
+        END
+    """,
+    'trg_events_credits_delete': """
+        CREATE TRIGGER trg_events_credits_delete AFTER DELETE ON credits
+        BEGIN
+            INSERT INTO ledger_events (kind, credit_id) VALUES ('credit_deleted', OLD.id);
+        END
+    """,
+    'trg_events_items_insert': """
+        CREATE TRIGGER trg_events_items_insert AFTER INSERT ON credit_items
+        BEGIN
+            INSERT INTO ledger_events (kind, credit_id, item_id) VALUES ('item_added', NEW.credit_id, NEW.id);
+        END
+    """,
+    'trg_events_items_paid': """
+        CREATE TRIGGER trg_events_items_paid AFTER UPDATE OF status ON credit_items
+        WHEN NEW.status IS 'paid' AND OLD.status IS NOT 'paid'
+        BEGIN
+            INSERT INTO ledger_events (kind, credit_id, item_id) VALUES ('item_paid', NEW.credit_id, NEW.id);
+        END
+    """,
+    'trg_events_payments_insert': """
+        CREATE TRIGGER trg_events_payments_insert AFTER INSERT ON payments
+        BEGIN
+            INSERT INTO ledger_events (kind, credit_id) VALUES ('payment_added', NEW.credit_id);
+        END
+    """,
+    'trg_events_prune': f"""
+        CREATE TRIGGER trg_events_prune AFTER INSERT ON ledger_events
+        BEGIN
+            DELETE FROM ledger_events WHERE id <= NEW.id - {LIVE_EVENTS_KEEP};
+        END
+    """,
+}
+
+def create_live_events(cursor):
+    """Create the ledger_events log and the triggers that append to it"""
+    # AUTOINCREMENT: ids are never reused after pruning, so a page's
+    # last-seen id always means the same point in the log
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ledger_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            credit_id INTEGER NOT NULL,
+            item_id INTEGER
+        )
+    """)
+    for name, sql in LIVE_EVENT_TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(sql)
+
+def fetch_live_position(cursor):
+    """The id of the newest ledger event, where a freshly rendered page starts listening"""
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM ledger_events")
+    return cursor.fetchone()[0]
+
+def format_sse(data, event=None, event_id=None):
+    """One Server-Sent Events message; `data` is sent as a line of JSON"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    if data is not None:
+        lines.append(f"data: {json.dumps(data, default=str)}")
+    return '\n'.join(lines) + '\n\n'
+
+def live_event_stream(cursor, after_id, limit=LIVE_EVENTS_LIMIT):
+    """The ledger events after `after_id` as Server-Sent Events text.
+
+    Returns (text, last_id, has_more); text is empty when nothing happened
+    since `after_id`. Events carry the current state of the credit and item
+    they name, and added credits and items also carry the credit's
+    re-rendered card and table rows (rendered once per batch, through the
+    fragment cache), so the page never needs templates of its own. Run it
+    inside one read transaction and an app context.
+    """
+    cursor.execute("""
+        SELECT id, kind, credit_id, item_id FROM ledger_events
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    """, (after_id, limit + 1))
+    rows = cursor.fetchall()
+    if not rows:
+        return '', after_id, False
+    if rows[0]['id'] > after_id + 1:
+        # The events in between were pruned; only a reload catches up
+        last_id = fetch_live_position(cursor)
+        return format_sse({}, 'reload', last_id), last_id, False
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    credit_ids = sorted({row['credit_id'] for row in rows})
+    credits = {credit['id']: credit for credit in store.fetch_credits(cursor, credit_ids)}
+    item_ids = sorted({row['item_id'] for row in rows if row['item_id'] is not None})
+    items = {}
+    if item_ids:
+        cursor.execute(f"""
+            SELECT id, credit_id, product, cost, quantity, unit_price, added_at, status, paid_date
+            FROM credit_items
+            WHERE id IN ({','.join('?' * len(item_ids))})
+        """, item_ids)
+        items = {row['id']: dict(row) for row in cursor.fetchall()}
+    
+    messages, rendered = [], set()
+    for row in rows:
+        data = {'credit_id': row['credit_id']}
+        credit = credits.get(row['credit_id'])
+        # A credit deleted since has no state left; its deletion comes later
+        if credit is not None and row['kind'] != 'credit_deleted':
+            data['credit'] = dict(credit)
+            if row['item_id'] is not None:
+                data['item'] = items.get(row['item_id'])
+            if row['kind'] in ('credit_added', 'item_added') and credit['id'] not in rendered:
+                fragment = render_credit_fragments(cursor, store.number_credits(cursor, [credit]))[0]
+                data['html'] = {'card': str(fragment['card']), 'row': str(fragment['row'])}
+                rendered.add(credit['id'])
+        messages.append(format_sse(data, row['kind'], row['id']))
+    
+    summary = store.fetch_ledger_summary(cursor)
+    messages.append(format_sse({'summary': summary_to_dict(summary), 'version': summary['version']}, 'summary'))
+    return ''.join(messages), rows[-1]['id'], has_more
+
+def open_connection():
+    """Open a new SQLite connection with the configured PRAGMAs applied"""
+    connection = sqlite3.connect(
+        DB_FILE,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,  # pooled connections move between threads
+    )
+    connection.row_factory = sqlite3.Row
+    connection.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}")
+    connection.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    connection.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    connection.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    connection.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    connection.execute("PRAGMA foreign_keys = ON")
+    return connection
+
+class ProfiledCursor:
+    """Cursor wrapper that records each statement's time and row count.
+
+    Time spent fetching is added to the statement that produced the rows,
+    since SQLite does most of a query's work while the rows are stepped.
+    """
+    
+    def __init__(self, cursor, profile):
+        self._cursor = cursor
+        self._profile = profile
+        self._record = None
+    
+    def _run(self, method, sql, params, many=False):
+        started = time.perf_counter()
+        try:
+            getattr(self._cursor, method)(sql, params)
+        finally:
+            self._record = {
+                'sql': sql,
+                'params': None if many else params,
+                'ms': (time.perf_counter() - started) * 1000,
+                'rows': max(self._cursor.rowcount, 0),
+            }
+            self._profile.append(self._record)
+        return self
+    
+    def execute(self, sql, params=()):
+        return self._run('execute', sql, params)
+    
+    def executemany(self, sql, seq_of_params):
+        return self._run('executemany', sql, seq_of_params, many=True)
+    
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        rows = getattr(self._cursor, method)(*args)
+        if self._record is not None:
+            self._record['ms'] += (time.perf_counter() - started) * 1000
+            self._record['rows'] += len(rows) if isinstance(rows, list) else rows is not None
+        return rows
+    
+    def fetchone(self):
+        return self._fetch('fetchone')
     
+    def fetchmany(self, size=None):
+        return self._fetch('fetchmany', size or self._cursor.arraysize)
+    
+    def fetchall(self):
+        return self._fetch('fetchall')
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+    
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class ProfiledConnection:
+    """A pooled connection whose statements are recorded while `profile` is set.
+
+    get_db_connection() points `profile` at the current request's list;
+    outside requests it is None and plain cursors are handed out.
+    """
+    
+    def __init__(self, connection):
+        self.raw = connection
+        self.profile = None
+    
+    def cursor(self):
+        if self.profile is None:
+            return self.raw.cursor()
+        return ProfiledCursor(self.raw.cursor(), self.profile)
+    
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+    
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+class ConnectionPool:
+    """Keeps up to `size` idle connections per worker process for reuse.
+
+    Connections are handed out one per request and returned at app context
+    teardown. When the pool is empty a new connection is opened, so requests
+    never wait on the pool; surplus connections are closed on release.
+    A forked gunicorn worker starts with an empty pool of its own.
+    """
+    
+    def __init__(self, size):
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._pid = os.getpid()
+        # id(connection) -> ((data_version, total_changes), ledger version); see get_ledger_version
+        self.ledger_versions = {}
+    
+    def _check_fork(self):
+        if self._pid != os.getpid():
+            # Connections must not be shared across processes
+            self._idle = queue.LifoQueue()
+            self._pid = os.getpid()
+            self.ledger_versions = {}
+    
+    def _close(self, connection):
+        self.ledger_versions.pop(id(connection), None)
+        connection.close()
+    
+    def acquire(self):
+        self._check_fork()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return ProfiledConnection(open_connection())
+    
+    def release(self, connection):
+        self._check_fork()
+        connection.profile = None
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except sqlite3.Error:
+            self._close(connection)
+            return
+        
+        if self._idle.qsize() < self.size:
+            self._idle.put(connection)
+        else:
+            self._close(connection)
+    
+    def close_all(self):
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+db_pool = ConnectionPool(DB_POOL_SIZE)
+
+class FragmentCache:
+    """LRU cache of rendered HTML fragments, bounded by total size.
+
+    Each entry is stored under a name (a credit ID, or 'summary') together
+    with the key it was rendered for, e.g. the credit's version. A lookup
+    with a different key is a miss, so an entry rendered before another
+    worker changed the credit is never served.
+    """
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+    
+    def get(self, name, key):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry[0] != key:
+                return None
+            self._entries.move_to_end(name)
+            return entry[1]
+    
+    def put(self, name, key, value, size):
+        with self._lock:
+            self._discard(name)
+            self._entries[name] = (key, value, size)
+            self._size += size
+            while self._size > self.max_bytes and self._entries:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+    
+    def invalidate(self, name):
+        with self._lock:
+            self._discard(name)
+    
+    def _discard(self, name):
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            self._size -= entry[2]
+
+fragment_cache = FragmentCache(FRAGMENT_CACHE_BYTES)
+
+# Reads and writes of the ledger tables, shared with the MySQL app (app.py) -
+# see ledger_store.py. Writes drop the changed credit's cached fragments.
+store = SQLiteLedgerStore(open_connection, on_change=fragment_cache.invalidate,
+                          find_customer=find_or_create_customer)
+
+def column_exists(cursor, table, column):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row['name'] == column for row in cursor.fetchall())
+
+def add_column(cursor, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN unless the column is already there"""
+    if not column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def migrate_baseline(cursor):
+    """Create the schema, or bring a database from before versioned migrations up to it.
+
+    Databases created by earlier versions of init_db() have user_version 0
+    and may lack any of the columns and tables added since, so every step
+    here checks before it changes anything.
+    """
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS credits (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -57,51 +1609,322 @@ def init_db():
         )
     """)
     
+    # Columns added to the first versions of the tables
+    add_column(cursor, 'credit_items', 'status', "TEXT DEFAULT 'pending'")
+    add_column(cursor, 'credit_items', 'paid_date', "TIMESTAMP NULL")
+    add_column(cursor, 'credits', 'phone_number', "TEXT")
+    
     # Create indexes for better performance
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_customer_name ON credits(customer_name)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_status ON credits(status)")
+    # Overdue lookups filter on status and range over the due date
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_status_due ON credits(status, estimated_payment_date)")
+    cursor.execute("DROP INDEX IF EXISTS idx_status")  # a prefix of idx_status_due
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_payment_date ON credits(estimated_payment_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_created_at ON credits(created_at, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_credit_id ON credit_items(credit_id)")
     
-    # Add status and paid_date columns to credit_items if they don't exist (migration)
-    try:
-        cursor.execute("ALTER TABLE credit_items ADD COLUMN status TEXT DEFAULT 'pending'")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
+    # Append-only payment history
+    payments_created = create_payments_table(cursor)
     
-    try:
-        cursor.execute("ALTER TABLE credit_items ADD COLUMN paid_date TIMESTAMP NULL")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
+    # Running totals for the dashboard, kept up to date by triggers
+    totals_created = create_totals_tables(cursor)
+    add_column(cursor, 'ledger_summary', 'version', "INTEGER NOT NULL DEFAULT 0")
+    add_column(cursor, 'credit_totals', 'version', "INTEGER NOT NULL DEFAULT 0")
+    add_column(cursor, 'credit_totals', 'paid_amount', "REAL NOT NULL DEFAULT 0")
+    create_totals_indexes(cursor)
+    create_totals_triggers(cursor)
+    if payments_created:
+        backfill_payments(cursor)
+    if totals_created or payments_created:
+        rebuild_totals(cursor)
     
-    # Add phone_number column to credits if it doesn't exist (migration)
-    try:
-        cursor.execute("ALTER TABLE credits ADD COLUMN phone_number TEXT")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
+    # Balances per due date for the aging report
+    create_aging_index(cursor)
+    if payments_created:
+        rebuild_aging(cursor)
     
-    try:
-        cursor.execute("ALTER TABLE credit_items ADD COLUMN paid_date TIMESTAMP NULL")
-    except sqlite3.OperationalError:
-        pass  # Column already exists
+    # Charged and collected per day for the collection reports
+    create_rollups(cursor)
     
-    connection.commit()
-    connection.close()
-    print("Database initialized successfully!")
+    # Outgoing SMS reminders
+    create_sms_tables(cursor)
+    
+    create_search_index(cursor)
 
-def get_db_connection():
-    """Create and return a database connection"""
-    connection = sqlite3.connect(DB_FILE)
-    connection.row_factory = sqlite3.Row
-    return connection
+def create_order_indexes(cursor):
+    """Indexes that return items and exported credits already in display order"""
+    # Items are always read per credit, newest first. The plain credit_id
+    # index it replaces left every item list to be sorted afterwards.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_items_credit_added ON credit_items(credit_id, added_at DESC)")
+    cursor.execute("DROP INDEX IF EXISTS idx_items_credit_id")
+    # Exports list credits by name, newest first; also serves name lookups
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_credits_name_created ON credits(customer_name, created_at DESC)")
+    cursor.execute("DROP INDEX IF EXISTS idx_customer_name")
 
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    """Login page"""
-    if request.method == 'POST':
-        email = request.form.get('email')
-        password = request.form.get('password')
+# Schema changes, applied in order. Each runs once, in its own transaction,
+# and PRAGMA user_version records the last one applied. Append new entries;
+# never edit or renumber one that has shipped.
+MIGRATIONS = [
+    (1, 'baseline schema', migrate_baseline),
+    (2, 'customers table linked from credits', create_customers),
+    (3, 'item and export order indexes', create_order_indexes),
+    (4, 'ledger events for live updates', create_live_events),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(connection):
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """Hold an exclusive flock on `path`, shared by every worker process.
+
+    Yields whether the lock was taken, which is always True when blocking.
+    Without fcntl (Windows) nothing is locked and True is yielded.
+    """
+    with open(path, 'a') as lock_file:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def migration_lock():
+    """Hold an exclusive lock file next to the database while migrating.
+
+    Gunicorn workers all import the app at once; the first migrates while
+    the others wait here rather than on SQLite's busy timeout, which a
+    long migration could outlast.
+    """
+    return file_lock(DB_FILE + '.migrate.lock')
+
+def apply_migrations(connection):
+    """Apply every migration newer than the database. Returns the ones applied."""
+    applied = []
+    with migration_lock():
+        cursor = connection.cursor()
+        for number, description, migrate in MIGRATIONS:
+            # Another process may have migrated while we waited for the lock
+            if number <= get_schema_version(connection):
+                continue
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                migrate(cursor)
+                cursor.execute(f"PRAGMA user_version = {number}")
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                app.logger.exception("Migration %d (%s) failed", number, description)
+                raise
+            applied.append((number, description))
+    return applied
+
+def init_db():
+    """Bring the database schema up to date.
+
+    When PRAGMA user_version is already current this is a single read of
+    the database header; nothing is created or locked.
+    """
+    connection = open_connection()
+    try:
+        version = get_schema_version(connection)
+        if version < SCHEMA_VERSION:
+            applied = apply_migrations(connection)
+            for number, description in applied:
+                app.logger.info("Applied migration %d: %s", number, description)
+            if applied:
+                app.logger.info("Database initialized successfully!")
+        elif version > SCHEMA_VERSION:
+            app.logger.warning("Database schema version %d is newer than this code (%d)", version, SCHEMA_VERSION)
         
-        if email == LOGIN_EMAIL and password == LOGIN_PASSWORD:
+        global FTS_ENABLED
+        FTS_ENABLED = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'credits_fts'"
+        ).fetchone() is not None
+    finally:
+        connection.close()
+
+def get_db_connection():
+    """Return this request's pooled database connection"""
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+        g.db.profile = g.get('queries')
+    return g.db
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """Return the request's connection to the pool, rolling back anything uncommitted"""
+    connection = g.pop('db', None)
+    if connection is not None:
+        log_slow_queries(connection)
+        db_pool.release(connection)
+
+def get_ledger_version(connection):
+    """Return ledger_summary.version, re-reading it only when the database changed.
+
+    PRAGMA data_version changes when another connection commits, and
+    total_changes when this one writes; while both are unchanged the cached
+    version is still current and no table is read.
+    """
+    data_version = connection.execute("PRAGMA data_version").fetchone()[0]
+    key = (data_version, connection.total_changes)
+    cached = db_pool.ledger_versions.get(id(connection))
+    if cached and cached[0] == key:
+        return cached[1]
+    
+    version = connection.execute("SELECT version FROM ledger_summary WHERE id = 1").fetchone()[0]
+    db_pool.ledger_versions[id(connection)] = (key, version)
+    return version
+
+# ---------------------------------------------------------------------------
+# Reporting reads
+#
+# Exports and the reports read the whole ledger, which on a large ledger
+# takes long enough to matter. REPORT_SOURCE picks where they read from:
+#
+#   live      one read transaction on the request's pooled connection. In
+#             WAL mode readers and the writer never block each other, and
+#             the report sees one consistent version of the ledger.
+#   snapshot  a copy of the database made with the online backup API and
+#             refreshed in the background once it is older than
+#             REPORT_SNAPSHOT_SECONDS. Reports never touch the live file,
+#             so they cannot hold back a WAL checkpoint, and this also
+#             works with DB_JOURNAL_MODE=DELETE, where readers block writers.
+# ---------------------------------------------------------------------------
+
+# Pages copied per backup step (4 MB at the default page size); the live
+# database is unlocked for BACKUP_STEP_SLEEP_MS between steps
+BACKUP_STEP_PAGES = 1024
+BACKUP_STEP_SLEEP_MS = 5
+
+# Held by this process while a background refresh runs
+_snapshot_refreshing = threading.Lock()
+
+def copy_database(path):
+    """Copy the live database to `path` with the online backup API.
+
+    Writers get the database between steps. In WAL mode the copy is read
+    from one read transaction, which never blocks writers; otherwise a step
+    that sees another connection's commit restarts the copy, which a busy
+    ledger might never let finish. The copy is a single self-contained file
+    with no -wal or -shm.
+    """
+    source = open_connection()
+    target = sqlite3.connect(path)
+    try:
+        if source.execute("PRAGMA journal_mode").fetchone()[0] == 'wal':
+            source.execute("BEGIN")
+            source.execute("SELECT 1 FROM sqlite_master LIMIT 1")  # starts the read
+        source.backup(target, pages=BACKUP_STEP_PAGES, sleep=BACKUP_STEP_SLEEP_MS / 1000)
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        target.close()
+        source.close()
+
+def refresh_snapshot():
+    """Copy the database to REPORT_SNAPSHOT_FILE. Returns the seconds taken.
+
+    The copy is written next to the snapshot and renamed over it, so
+    connections already reading the old snapshot finish on the old file.
+    """
+    started = time.perf_counter()
+    partial = REPORT_SNAPSHOT_FILE + '.partial'
+    copy_database(partial)
+    os.replace(partial, REPORT_SNAPSHOT_FILE)
+    return time.perf_counter() - started
+
+def snapshot_age():
+    """Seconds since the snapshot was written, or None when there is none"""
+    try:
+        return time.time() - os.path.getmtime(REPORT_SNAPSHOT_FILE)
+    except OSError:
+        return None
+
+def refresh_snapshot_in_background():
+    """Refresh the snapshot unless this or another worker already is"""
+    if not _snapshot_refreshing.acquire(blocking=False):
+        return
+    try:
+        with file_lock(REPORT_SNAPSHOT_FILE + '.lock', blocking=False) as locked:
+            age = snapshot_age()
+            if locked and (age is None or age > REPORT_SNAPSHOT_SECONDS):
+                refresh_snapshot()
+    except Exception:
+        app.logger.exception("Snapshot error")
+    finally:
+        _snapshot_refreshing.release()
+
+def ensure_snapshot():
+    """Make sure a snapshot exists, starting a refresh if it is stale.
+
+    Only the very first snapshot is waited for; after that a stale one is
+    served while its replacement is copied.
+    """
+    age = snapshot_age()
+    if age is None:
+        with file_lock(REPORT_SNAPSHOT_FILE + '.lock'):
+            if snapshot_age() is None:
+                refresh_snapshot()
+    elif age > REPORT_SNAPSHOT_SECONDS and not _snapshot_refreshing.locked():
+        threading.Thread(target=refresh_snapshot_in_background, daemon=True).start()
+
+def get_report_connection():
+    """Return this request's connection for exports and reports, per REPORT_SOURCE.
+
+    Either way it is already inside a read transaction, so everything the
+    request reads from it comes from one version of the ledger.
+    """
+    if 'report_db' not in g:
+        if REPORT_SOURCE == 'snapshot':
+            ensure_snapshot()
+            # immutable: the file is replaced, never changed, so skip locking
+            uri = f"file:{urllib.parse.quote(os.path.abspath(REPORT_SNAPSHOT_FILE))}?mode=ro&immutable=1"
+            raw = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            raw.row_factory = sqlite3.Row
+            connection = ProfiledConnection(raw)
+            connection.profile = g.get('queries')
+        else:
+            connection = get_db_connection()
+            if not connection.in_transaction:
+                connection.execute("BEGIN")
+        g.report_db = connection
+    return g.report_db
+
+def get_report_version(connection):
+    """ledger_summary.version as of what the report connection sees"""
+    if connection is g.get('db'):
+        return get_ledger_version(connection)
+    return connection.execute("SELECT version FROM ledger_summary WHERE id = 1").fetchone()[0]
+
+def report_as_of():
+    """When the data behind this request's reports was read, as ISO 8601"""
+    if REPORT_SOURCE == 'snapshot':
+        return datetime.fromtimestamp(os.path.getmtime(REPORT_SNAPSHOT_FILE)).isoformat(timespec='seconds')
+    return datetime.now().isoformat(timespec='seconds')
+
+@app.teardown_appcontext
+def release_report_connection(exception):
+    """Close a snapshot connection; a live one is released with the pool's"""
+    connection = g.pop('report_db', None)
+    if connection is not None and connection is not g.get('db'):
+        log_slow_queries(connection)
+        connection.close()
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    """Login page"""
+    if request.method == 'POST':
+        email = request.form.get('email')
+        password = request.form.get('password')
+        
+        if email == LOGIN_EMAIL and password == LOGIN_PASSWORD:
             session['logged_in'] = True
             session['user'] = email
             return redirect(url_for('index'))
@@ -120,502 +1943,2489 @@ def logout():
     session.clear()
     return redirect(url_for('login'))
 
-@app.route('/')
+def encode_cursor(credit):
+    """Build a 'created_at|id' pagination cursor from a credit row"""
+    return f"{credit['created_at']}|{credit['id']}"
+
+def decode_cursor(value):
+    """Split a 'created_at|id' cursor into a (created_at, id) tuple, or None if malformed"""
+    if not value or '|' not in value:
+        return None
+    created_at, _, credit_id = value.rpartition('|')
+    try:
+        return created_at, int(credit_id)
+    except ValueError:
+        return None
+
+def get_page_size():
+    """Resolve the credit list page size from ?per_page=, remembering it in the session"""
+    per_page = request.args.get('per_page', type=int)
+    if per_page in PAGE_SIZE_CHOICES:
+        session['per_page'] = per_page
+    return session.get('per_page', PAGE_SIZE)
+
+def render_credit_fragments(cursor, credits):
+    """Render the mobile card and table rows of each credit, reusing cached HTML.
+
+    Fragments are keyed by the credit's version and display number, so only
+    credits that changed since they were last rendered are re-rendered, and
+    only their items are loaded.
+    """
+    fragments, misses = {}, []
+    for credit in credits:
+        key = (credit['version'], credit.get('display_no'))
+        cached = fragment_cache.get(credit['id'], key)
+        if cached is None:
+            misses.append(credit)
+        else:
+            fragments[credit['id']] = cached
+    
+    items_by_credit = store.fetch_items_by_credit(cursor, [credit['id'] for credit in misses])
+    for credit in misses:
+        card = Markup(render_template('_credit_card.html', credit=credit))
+        row = Markup(render_template('_credit_row.html', credit=credit,
+                                     items=items_by_credit.get(credit['id'], [])))
+        fragment = {'card': card, 'row': row}
+        fragment_cache.put(credit['id'], (credit['version'], credit.get('display_no')),
+                           fragment, len(card) + len(row))
+        fragments[credit['id']] = fragment
+    
+    return [fragments[credit['id']] for credit in credits]
+
+def render_summary(summary):
+    """Render the dashboard totals header, cached per ledger version"""
+    cached = fragment_cache.get('summary', summary['version'])
+    if cached is None:
+        cached = Markup(render_template('_summary.html', totals=summary, counts=summary))
+        fragment_cache.put('summary', summary['version'], cached, len(cached))
+    return cached
+
+def render_aging(cursor, version, today):
+    """Render the dashboard aging report, cached per ledger version and day"""
+    key = (version, today)
+    cached = fragment_cache.get('aging', key)
+    if cached is None:
+        cached = Markup(render_template('_aging.html', buckets=fetch_aging(cursor, today)))
+        fragment_cache.put('aging', key, cached, len(cached))
+    return cached
+
+def render_reports(today):
+    """Render the collections and balances reports, cached per ledger version and day.
+
+    They read from get_report_connection(), so with REPORT_SOURCE=snapshot
+    the version is the snapshot's and the cache follows the snapshot.
+    """
+    connection = get_report_connection()
+    key = (get_report_version(connection), today)
+    cached = fragment_cache.get('reports', key)
+    if cached is None:
+        cursor = connection.cursor()
+        start = (today - timedelta(days=REPORT_DAYS - 1)).isoformat()
+        cached = Markup(render_template(
+            '_reports.html',
+            collections=fetch_collections(cursor, start, today.isoformat()),
+            balances=fetch_customer_balances(cursor, 10),
+            report_days=REPORT_DAYS,
+        ))
+        fragment_cache.put('reports', key, cached, len(cached))
+    return cached
+
+def render_match_summary(credits):
+    """Render the totals header for a filtered list of credits"""
+    totals = {
+        'total_pending': sum(credit['balance'] for credit in credits),
+        'total_paid': sum(credit['paid_amount'] for credit in credits),
+        'total_all': sum(credit['total_cost'] for credit in credits),
+    }
+    counts = {
+        'total': len(credits),
+        'pending': sum(1 for credit in credits if credit['status'] == 'pending'),
+        'paid': sum(1 for credit in credits if credit['status'] == 'paid'),
+    }
+    return Markup(render_template('_summary.html', totals=totals, counts=counts))
+
+@app.route('/')
+@login_required
+def index():
+    """Main page - display one page of credits"""
+    if request.args.get('filter') == 'overdue':
+        return overdue_credits(request.args.get('bucket'))
+    if request.args.get('customer', type=int):
+        return customer_credits(request.args.get('customer', type=int))
+    
+    try:
+        per_page = get_page_size()
+        after = decode_cursor(request.args.get('after'))
+        before = decode_cursor(request.args.get('before')) if not after else None
+        
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        
+        credits, has_newer, has_older = store.fetch_credit_page(cursor, per_page, after, before)
+        
+        # Rendered per credit; only credits changed since the last render load their items
+        fragments = render_credit_fragments(cursor, credits)
+        
+        # Totals and counts come from the maintained summary row
+        summary = store.fetch_ledger_summary(cursor)
+        summary_html = render_summary(summary)
+        aging_html = render_aging(cursor, summary['version'], date.today())
+        reports_html = render_reports(date.today())
+        
+        pagination = {
+            'per_page': per_page,
+            'choices': PAGE_SIZE_CHOICES,
+            'prev_url': url_for('index', before=encode_cursor(credits[0])) + '#credit-list' if credits and has_newer else None,
+            'next_url': url_for('index', after=encode_cursor(credits[-1])) + '#credit-list' if credits and has_older else None,
+        }
+        
+        return render_template('index.html', credits=credits, fragments=fragments,
+                               summary_html=summary_html, aging_html=aging_html,
+                               reports_html=reports_html, pagination=pagination,
+                               ledger_version=summary['version'], live_after=fetch_live_position(cursor))
+    except Exception as e:
+        app.logger.exception("Database error")
+        return f"Database error: {e}", 500
+
+def overdue_credits(bucket):
+    """Index page filtered to pending credits past their due date"""
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        
+        today = date.today()
+        credits = fetch_overdue_credits(cursor, today, bucket)
+        fragments = render_credit_fragments(cursor, credits)
+        
+        version = get_ledger_version(connection)
+        return render_template('index.html', credits=credits, fragments=fragments,
+                               summary_html=render_match_summary(credits),
+                               aging_html=render_aging(cursor, version, today),
+                               overdue_bucket=bucket or 'all', ledger_version=version,
+                               live_after=fetch_live_position(cursor))
+    except Exception as e:
+        app.logger.exception("Database error")
+        return f"Database error: {e}", 500
+
+def customer_credits(customer_id):
+    """Index page filtered to one customer's credits"""
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        
+        customer = fetch_customer(cursor, customer_id)
+        if customer is None:
+            return redirect(url_for('customers'))
+        credits = fetch_customer_credits(cursor, customer_id)
+        fragments = render_credit_fragments(cursor, credits)
+        
+        version = get_ledger_version(connection)
+        return render_template('index.html', credits=credits, fragments=fragments,
+                               summary_html=render_match_summary(credits),
+                               customer=customer, ledger_version=version,
+                               live_after=fetch_live_position(cursor))
+    except Exception as e:
+        app.logger.exception("Database error")
+        return f"Database error: {e}", 500
+
+def encode_balance_cursor(customer):
+    """Build a 'balance|id' pagination cursor from a customer row"""
+    return f"{customer['balance']!r}|{customer['id']}"
+
+def decode_balance_cursor(value):
+    """Split a 'balance|id' cursor into a (balance, id) tuple, or None if malformed"""
+    balance, _, customer_id = (value or '').rpartition('|')
+    try:
+        return float(balance), int(customer_id)
+    except ValueError:
+        return None
+
+@app.route('/customers')
+@login_required
+def customers():
+    """Customer directory, largest outstanding balance first"""
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        
+        rows, has_more = fetch_customer_page(cursor, get_page_size(),
+                                             decode_balance_cursor(request.args.get('after')))
+        next_url = url_for('customers', after=encode_balance_cursor(rows[-1])) if has_more else None
+        return render_template('customers.html', customers=rows, next_url=next_url)
+    except Exception as e:
+        app.logger.exception("Database error")
+        return f"Database error: {e}", 500
+
+@app.route('/add_credit', methods=['POST'])
+@login_required
+def add_credit():
+    """Add a new credit entry"""
+    customer_name = request.form.get('customer_name')
+    product = request.form.get('product')
+    cost = request.form.get('cost')
+    estimated_payment_date = request.form.get('estimated_payment_date')
+    quantity = request.form.get('quantity', 1)
+    price = request.form.get('price', 0)
+    phone_number = request.form.get('phone_number') or None
+    
+    if not all([customer_name, product, cost, estimated_payment_date]):
+        return jsonify({'error': 'All fields are required'}), 400
+    
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        
+        # Insert credit record with its first item
+        store.create_credit(cursor, customer_name, estimated_payment_date, product, cost, quantity, price,
+                            phone_number)
+        
+        connection.commit()
+        
+        return redirect(url_for('index', success='added'))
+    except Exception as e:
+        app.logger.exception("Database error")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/mark_paid/<int:credit_id>', methods=['POST'])
+@login_required
+def mark_paid(credit_id):
+    """Mark a credit as paid"""
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        
+        if not store.pay_credit(cursor, credit_id):
+            return "Credit not found", 404
+        
+        connection.commit()
+        
+        return redirect(url_for('index', success='paid'))
+    except Exception as e:
+        app.logger.exception("Database error")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/add_product/<int:credit_id>', methods=['POST'])
+@login_required
+def add_product(credit_id):
+    """Add a new product to an existing credit"""
+    product = request.form.get('product')
+    cost = request.form.get('cost')
+    quantity = request.form.get('quantity', 1)
+    price = request.form.get('price', 0)
+    
+    if not all([product, cost]):
+        return jsonify({'error': 'Product and cost are required'}), 400
+    
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        
+        # Insert the new product (reopens the credit if it was paid)
+        store.add_item(cursor, credit_id, product, cost, quantity, price)
+        
+        connection.commit()
+        
+        return redirect(url_for('index', success='product_added'))
+    except Exception as e:
+        app.logger.exception("Database error")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/view_items/<int:credit_id>')
+@login_required
+def view_items(credit_id):
+    """View all items for a specific credit"""
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        
+        # Credit info with its maintained running total
+        credit = store.fetch_credit(cursor, credit_id)
+        
+        if not credit:
+            return "Credit not found", 404
+        
+        # Paid items stay listed; the payments show how the balance came down
+        items = store.fetch_items(cursor, credit_id)
+        payments = store.fetch_payments(cursor, credit_id)
+        total = {'total': credit['total_cost'], 'paid': credit['paid_amount'], 'balance': credit['balance']}
+        
+        return render_template('view_items.html', credit=credit, items=items, payments=payments, total=total)
+    except Exception as e:
+        app.logger.exception("Database error")
+        return f"Database error: {e}", 500
+
+@app.route('/mark_item_paid/<int:credit_id>/<int:item_id>', methods=['POST'])
+@login_required
+def mark_item_paid(credit_id, item_id):
+    """Record a payment for one item and mark it paid"""
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        
+        store.pay_item(cursor, credit_id, item_id)
+        
+        connection.commit()
+        
+        return redirect(url_for('index', success='item_paid') + '#credit-list')
+    except Exception as e:
+        app.logger.exception("Database error")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/add_payment/<int:credit_id>', methods=['POST'])
+@login_required
+def add_payment_route(credit_id):
+    """Record a partial payment on a credit"""
+    try:
+        amount = float(request.form.get('amount') or 0)
+    except ValueError:
+        return jsonify({'error': 'Amount must be a number'}), 400
+    
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        
+        if store.add_payment(cursor, credit_id, amount) is None:
+            return "Credit not found", 404
+        
+        connection.commit()
+        
+        return redirect(url_for('index', success='payment_added') + '#credit-list')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.exception("Database error")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/delete_credit/<int:credit_id>', methods=['POST'])
+@login_required
+def delete_credit(credit_id):
+    """Delete a credit entry and its items"""
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        
+        # Delete the credit and its items. IDs are not renumbered; the list
+        # shows a computed display number instead (see LedgerStore.fetch_credit_page).
+        store.remove_credit(cursor, credit_id)
+        
+        connection.commit()
+        
+        return redirect(url_for('index', success='deleted'))
+    except Exception as e:
+        app.logger.exception("Database error")
+        return jsonify({'error': str(e)}), 500
+
+def search_credit_ids(cursor, text):
+    """Return the IDs of credits matching the search text, best match first"""
+    if not FTS_ENABLED:
+        return store.search_credit_ids(cursor, text, SEARCH_LIMIT)
+    
+    fts_query = build_fts_query(text)
+    if not fts_query:
+        return []
+    # Matches on the name/phone rank above matches on products
+    cursor.execute("""
+        SELECT credit_id, MIN(rank) as rank
+        FROM (
+            SELECT rowid as credit_id, bm25(credits_fts, 10.0, 5.0) as rank
+            FROM credits_fts
+            WHERE credits_fts MATCH ?
+            UNION ALL
+            SELECT ci.credit_id, bm25(credit_items_fts) as rank
+            FROM credit_items_fts
+            JOIN credit_items ci ON ci.id = credit_items_fts.rowid
+            WHERE credit_items_fts MATCH ?
+        )
+        GROUP BY credit_id
+        ORDER BY rank, credit_id DESC
+        LIMIT ?
+    """, (fts_query, fts_query, SEARCH_LIMIT))
+    return [row[0] for row in cursor.fetchall()]
+
+@app.route('/search')
+@login_required
+def search():
+    """Search credits by customer name, phone number or product"""
+    query = request.args.get('q', '')
+    if not query.strip():
+        return redirect(url_for('index'))
+    
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        
+        # Run the search once; the list, items and totals are all built from its result
+        credit_ids = search_credit_ids(cursor, query)
+        
+        # Kept in the ranking order of the search
+        credits = store.fetch_credits(cursor, credit_ids)
+        
+        fragments = render_credit_fragments(cursor, credits)
+        
+        # Totals for the matched credits only, from their maintained per-credit totals
+        summary_html = render_match_summary(credits)
+        
+        return render_template('index.html', credits=credits, fragments=fragments,
+                               summary_html=summary_html, search_query=query,
+                               ledger_version=get_ledger_version(connection),
+                               live_after=fetch_live_position(cursor))
+    except Exception as e:
+        app.logger.exception("Database error")
+        return f"Database error: {e}", 500
+
+EXPORT_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', 'txt'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+}
+
+EXPORT_CSV_COLUMNS = [
+    'credit_id', 'customer_name', 'phone_number', 'status', 'estimated_payment_date',
+    'created_at', 'credit_total', 'credit_paid', 'credit_balance',
+    'item_id', 'product', 'quantity', 'unit_price', 'cost', 'item_status', 'added_at',
+]
+
+# Rows fetched from SQLite per round trip, and bytes buffered before each write
+EXPORT_FETCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+def iter_export_credits(cursor):
+    """Yield (credit, items) pairs for every credit using one ordered join.
+
+    Rows are fetched in batches and grouped on the fly, so only one credit's
+    items are held in memory at a time.
+    """
+    cursor.execute("""
+        SELECT c.id, c.customer_name, c.phone_number, c.estimated_payment_date,
+               c.status, c.created_at,
+               COALESCE(ct.total_cost, 0) as total_cost,
+               COALESCE(ct.paid_amount, 0) as paid_amount,
+               ci.id as item_id, ci.product, ci.cost, ci.quantity, ci.unit_price,
+               ci.status as item_status, ci.added_at
+        FROM credits c
+        LEFT JOIN credit_totals ct ON ct.credit_id = c.id
+        LEFT JOIN credit_items ci ON ci.credit_id = c.id
+        ORDER BY c.customer_name, c.created_at DESC, c.id, ci.added_at DESC
+    """)
+    
+    credit, items = None, []
+    while True:
+        rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            if credit is None or row['id'] != credit['id']:
+                if credit is not None:
+                    yield credit, items
+                credit, items = row, []
+            if row['item_id'] is not None:
+                items.append(row)
+    
+    if credit is not None:
+        yield credit, items
+
+def export_txt(credits, summary):
+    """Yield the Tagalog text report one credit at a time"""
+    yield "\n".join([
+        "=" * 80,
+        "LISTAHAN NG UTANG - TINDAHAN NI ANNIE",
+        "=" * 80,
+        f"Petsa ng Pag-export: {datetime.now().strftime('%B %d, %Y - %I:%M %p')}",
+        "=" * 80,
+        "",
+    ]) + "\n"
+    
+    for credit, items in credits:
+        # Customer header
+        output_lines = []
+        output_lines.append("-" * 80)
+        output_lines.append(f"KOSTUMER: {credit['customer_name']}")
+        output_lines.append(f"ID ng Utang: {credit['id']}")
+        output_lines.append(f"Katayuan: {credit['status'].upper()}")
+        output_lines.append(f"Tinantyang Petsa ng Bayad: {credit['estimated_payment_date']}")
+        output_lines.append(f"Petsa ng Paglikha: {credit['created_at']}")
+        output_lines.append("")
+        
+        # Items list
+        if items:
+            output_lines.append("  MGA PRODUKTO:")
+            output_lines.append("  " + "-" * 76)
+            for idx, item in enumerate(items, 1):
+                paid_mark = " (BAYAD NA)" if item['item_status'] == 'paid' else ""
+                output_lines.append(f"  {idx}. {item['product']}{paid_mark}")
+                output_lines.append(f"     Halaga: ₱{item['cost']:.2f}")
+                output_lines.append(f"     Petsa ng Pagdagdag: {item['added_at']}")
+                output_lines.append("")
+        else:
+            output_lines.append("  Walang mga produkto")
+            output_lines.append("")
+        
+        # Total
+        output_lines.append(f"  KABUUANG UTANG: ₱{credit['total_cost']:.2f}")
+        if credit['paid_amount']:
+            output_lines.append(f"  NABAYARAN: ₱{credit['paid_amount']:.2f}")
+            output_lines.append(f"  NATITIRANG BALANSE: ₱{credit['total_cost'] - credit['paid_amount']:.2f}")
+        output_lines.append("-" * 80)
+        output_lines.append("")
+        yield "\n".join(output_lines) + "\n"
+    
+    # Summary
+    yield "\n".join([
+        "=" * 80,
+        "BUOD",
+        "=" * 80,
+        f"Kabuuang Bilang ng Utang: {summary['total']}",
+        f"Kabuuang Hindi Pa Bayad: ₱{summary['total_pending']:.2f}",
+        f"Kabuuang Nabayaran: ₱{summary['total_paid']:.2f}",
+        f"KABUUANG LAHAT: ₱{summary['total_all']:.2f}",
+        "=" * 80,
+    ])
+
+def export_csv(credits, summary):
+    """Yield one CSV row per item (credits without items get a single row)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_CSV_COLUMNS)
+    
+    for credit, items in credits:
+        head = [credit['id'], credit['customer_name'], credit['phone_number'], credit['status'],
+                credit['estimated_payment_date'], credit['created_at'], f"{credit['total_cost']:.2f}",
+                f"{credit['paid_amount']:.2f}", f"{credit['total_cost'] - credit['paid_amount']:.2f}"]
+        if not items:
+            writer.writerow(head + [''] * 7)
+        for item in items:
+            writer.writerow(head + [item['item_id'], item['product'], item['quantity'],
+                                    item['unit_price'], f"{item['cost']:.2f}", item['item_status'],
+                                    item['added_at']])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def export_jsonl(credits, summary):
+    """Yield one JSON object per credit, with its items nested"""
+    for credit, items in credits:
+        yield json.dumps({
+            'id': credit['id'],
+            'customer_name': credit['customer_name'],
+            'phone_number': credit['phone_number'],
+            'status': credit['status'],
+            'estimated_payment_date': credit['estimated_payment_date'],
+            'created_at': credit['created_at'],
+            'total_cost': credit['total_cost'],
+            'paid_amount': credit['paid_amount'],
+            'balance': credit['total_cost'] - credit['paid_amount'],
+            'items': [{
+                'id': item['item_id'],
+                'product': item['product'],
+                'quantity': item['quantity'],
+                'unit_price': item['unit_price'],
+                'cost': item['cost'],
+                'status': item['item_status'],
+                'added_at': item['added_at'],
+            } for item in items],
+        }, ensure_ascii=False) + "\n"
+
+def buffer_chunks(pieces, size=EXPORT_CHUNK_SIZE):
+    """Coalesce small string pieces into chunks of roughly `size` bytes"""
+    chunk, length = [], 0
+    for piece in pieces:
+        chunk.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk, length = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+@app.route('/export_credits')
+@login_required
+def export_credits():
+    """Stream the credits list as a text report, CSV or JSON Lines"""
+    export_format = request.args.get('format', 'txt')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unknown export format: {export_format}'}), 400
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    writer = {'txt': export_txt, 'csv': export_csv, 'jsonl': export_jsonl}[export_format]
+    
+    try:
+        # A read transaction (or the snapshot), so the summary and the credits agree
+        connection = get_report_connection()
+        cursor = connection.cursor()
+        summary = store.fetch_ledger_summary(cursor)
+    except Exception as e:
+        app.logger.exception("Export error")
+        return f"Export error: {e}", 500
+    
+    def generate():
+        try:
+            yield from buffer_chunks(writer(iter_export_credits(cursor), summary))
+        except Exception:
+            # Headers are already sent; all we can do is log and stop
+            app.logger.exception("Export error")
+        finally:
+            connection.rollback()
+    
+    # Generate filename with current date
+    filename = f"Listahan_ng_Utang_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    
+    # Return as downloadable file, streamed as it is generated
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment;filename={filename}"}
+    )
+
+# ---------------------------------------------------------------------------
+# Bulk import
+#
+# Moves a paper notebook, a spreadsheet or another copy of this app into the
+# ledger. 'flask import-ledger FILE' and POST /api/import read CSV (one row
+# per item, the columns of the CSV export) or JSON Lines (flat rows like the
+# CSV, or the JSONL export's credits with their items nested). Rows with the
+# same credit_id are one credit; rows without one are grouped by customer and
+# due date. Customers are matched on customer_key(), so "Maria  Santos" and
+# "maria santos" become one customer, existing or new.
+#
+# The whole file is one write transaction: the triggers that keep the
+# derived tables are dropped, rows go in IMPORT_BATCH_ROWS at a time with
+# executemany, and the totals, aging, rollups, customers and search index
+# are rebuilt once at the end before the triggers are put back. A file
+# either imports completely or not at all; rows that fail validation are
+# skipped and reported with their line number.
+# ---------------------------------------------------------------------------
+
+# Item rows buffered before each executemany, and rejected rows listed in a result
+IMPORT_BATCH_ROWS = int(os.getenv('IMPORT_BATCH_ROWS', '50000'))
+IMPORT_REJECTS_SHOWN = 100
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+# Trigger families dropped for the duration of an import, with the function
+# that rebuilds what they maintain. Search is handled separately (see
+# import_ledger), and link_customers() runs before any of these.
+IMPORT_REBUILDS = [
+    (TOTALS_TRIGGERS, rebuild_totals),
+    (AGING_TRIGGERS, rebuild_aging),
+    (ROLLUP_TRIGGERS, rebuild_rollups),
+    (CUSTOMER_TRIGGERS, rebuild_customers),
+    (LIVE_EVENT_TRIGGERS, None),
+]
+
+def import_format_for(filename, default='csv'):
+    """Guess the import format from a file name"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    return 'jsonl' if extension in ('.jsonl', '.ndjson', '.json') else default
+
+def iter_import_records(stream, import_format):
+    """Yield (line number, rows, error) for each record of a text stream.
+
+    A record is one CSV row, or one JSON line; an exported credit with
+    nested items becomes one row per item sharing the credit's fields.
+    """
+    if import_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, [row], None
+        return
+    
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "Expected a JSON object"
+            continue
+        items = record.pop('items', None)
+        if items is None:
+            yield line_no, [record], None
+            continue
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            yield line_no, None, "items must be a list of objects"
+            continue
+        credit = {
+            'credit_id': record.get('id') if record.get('id') is not None else f"line {line_no}",
+            'customer_name': record.get('customer_name'),
+            'phone_number': record.get('phone_number'),
+            'status': record.get('status'),
+            'estimated_payment_date': record.get('estimated_payment_date'),
+            'created_at': record.get('created_at'),
+            'credit_paid': record.get('paid_amount'),
+        }
+        yield line_no, [dict(credit, product=item.get('product'), quantity=item.get('quantity'),
+                             unit_price=item.get('unit_price'), cost=item.get('cost'),
+                             item_status=item.get('status'), added_at=item.get('added_at'))
+                        for item in items] or [credit], None
+
+def import_text(value):
+    """A stripped string from a CSV cell or JSON value; '' for missing"""
+    if isinstance(value, str):
+        return value.strip()
+    return '' if value is None else str(value)
+
+def parse_import_time(value, field):
+    """Normalize a date or date-and-time to 'YYYY-MM-DD HH:MM:SS'; None when empty"""
+    text = import_text(value)
+    if not text:
+        return None
+    try:
+        moment = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f'{field} must be a date or a date and time (YYYY-MM-DD HH:MM:SS)')
+    if len(text) == 19 and text[10] == ' ':
+        return text  # already in the stored form
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+# Columns describing the credit rather than the item; rows of one credit
+# repeat them, so they are parsed once per run of identical values
+IMPORT_CREDIT_COLUMNS = ('credit_id', 'customer_name', 'phone_number', 'status',
+                         'estimated_payment_date', 'created_at', 'credit_paid')
+
+def parse_import_credit(row):
+    """Validate the credit columns of an import row; raises ValueError"""
+    customer_name = import_text(row.get('customer_name'))
+    if not customer_name:
+        raise ValueError('Customer name is required')
+    try:
+        due = date.fromisoformat(import_text(row.get('estimated_payment_date'))).isoformat()
+    except ValueError:
+        raise ValueError('estimated_payment_date must be a date (YYYY-MM-DD)')
+    
+    credit_paid = import_text(row.get('credit_paid'))
+    if credit_paid:
+        try:
+            credit_paid = float(credit_paid)
+        except ValueError:
+            raise ValueError('credit_paid must be a number')
+        if not 0 <= credit_paid < float('inf'):
+            raise ValueError('credit_paid must not be negative')
+    
+    return {
+        'credit_ref': import_text(row.get('credit_id')),
+        'customer_name': customer_name,
+        'phone_number': import_text(row.get('phone_number')) or None,
+        'estimated_payment_date': due,
+        'created_at': parse_import_time(row.get('created_at'), 'created_at'),
+        'credit_paid': None if credit_paid == '' else credit_paid,
+        # A credit marked paid without an amount counts each of its items as paid
+        'items_paid': import_text(row.get('status')).lower() == 'paid' and credit_paid == '',
+    }
+
+def parse_import_item(row, credit):
+    """Validate the item columns of an import row; None for a credit-only row. Raises ValueError."""
+    price = row.get('price')
+    fields = {'product': import_text(row.get('product')), 'quantity': import_text(row.get('quantity')),
+              'price': import_text(price if price not in (None, '') else row.get('unit_price')),
+              'cost': import_text(row.get('cost'))}
+    if not any(fields.values()):
+        return None
+    item = parse_item_fields(fields)
+    
+    item_status = import_text(row.get('item_status')).lower()
+    if item_status not in ('', 'pending', 'paid'):
+        raise ValueError("item_status must be 'pending' or 'paid'")
+    item['paid'] = item_status == 'paid' or credit['items_paid']
+    item['added_at'] = parse_import_time(row.get('added_at'), 'added_at')
+    item['paid_at'] = parse_import_time(row.get('paid_at'), 'paid_at')
+    return item
+
+def import_ledger(connection, records, batch_rows=IMPORT_BATCH_ROWS, on_reject=None):
+    """Import the records of iter_import_records() into the ledger in one transaction.
+
+    A generator: yields ('progress', stats) after each batch is written and
+    ('done', stats) once the import is committed, where stats counts lines,
+    credits, items, payments and rejected records. The first
+    IMPORT_REJECTS_SHOWN rejected records are listed in the final stats, and
+    `on_reject(line, error, rows)` is called for every one. Any error, or
+    closing the generator early, rolls the whole import back.
+    """
+    cursor = connection.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        families = IMPORT_REBUILDS + ([(SEARCH_TRIGGERS, None)] if FTS_ENABLED else [])
+        for triggers, rebuild in families:
+            for name in triggers:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        
+        # AUTOINCREMENT: start past ids that deleted rows once had, too
+        cursor.execute("""
+            SELECT (SELECT MAX(COALESCE(MAX(id), 0),
+                               COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'credits'), 0))
+                    FROM credits),
+                   (SELECT MAX(COALESCE(MAX(id), 0),
+                               COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'credit_items'), 0))
+                    FROM credit_items),
+                   CURRENT_TIMESTAMP
+        """)
+        last_credit_id, last_item_id, now = cursor.fetchone()
+        first_credit_id, first_item_id = last_credit_id + 1, last_item_id + 1
+        
+        stats = {'lines': 0, 'credits': 0, 'items': 0, 'payments': 0, 'rejected': 0}
+        rejects = []
+        credit_ids = {}  # grouping key -> credit id
+        name_keys = {}  # customer name -> customer_key(), for rows without a credit_id
+        customer_ids = {}  # customer name -> customers.id
+        # credit id -> [charged, paid, credit_paid, last added_at, last paid_at]
+        balances = {}
+        credit_rows, item_rows, payment_rows = [], [], []
+        last_raw = credit = None
+        
+        def flush():
+            cursor.executemany("""
+                INSERT INTO credits (customer_id, id, customer_name, phone_number, estimated_payment_date,
+                                     created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, credit_rows)
+            cursor.executemany("""
+                INSERT INTO credit_items (id, credit_id, product, cost, quantity, unit_price, added_at,
+                                          status, paid_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, item_rows)
+            cursor.executemany("INSERT INTO payments (credit_id, item_id, amount, paid_at) VALUES (?, ?, ?, ?)",
+                               payment_rows)
+            stats['credits'] += len(credit_rows)
+            stats['items'] += len(item_rows)
+            stats['payments'] += len(payment_rows)
+            credit_rows.clear()
+            item_rows.clear()
+            payment_rows.clear()
+        
+        for line_no, rows, error in records:
+            stats['lines'] += 1
+            if error is None:
+                try:
+                    parsed = []
+                    for row in rows:
+                        raw = tuple(map(row.get, IMPORT_CREDIT_COLUMNS))
+                        if raw != last_raw:
+                            credit, last_raw = parse_import_credit(row), raw
+                        parsed.append((credit, parse_import_item(row, credit)))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                stats['rejected'] += 1
+                if len(rejects) < IMPORT_REJECTS_SHOWN:
+                    rejects.append({'line': line_no, 'error': error})
+                if on_reject:
+                    on_reject(line_no, error, rows)
+                continue
+            
+            for credit, item in parsed:
+                if credit['credit_ref']:
+                    key = credit['credit_ref']
+                else:
+                    name = credit['customer_name']
+                    if name not in name_keys:
+                        name_keys[name] = customer_key(name)
+                    key = (name_keys[name], credit['estimated_payment_date'])
+                
+                credit_id = credit_ids.get(key)
+                if credit_id is None:
+                    last_credit_id += 1
+                    credit_id = credit_ids[key] = last_credit_id
+                    name = credit['customer_name']
+                    if name not in customer_ids:
+                        customer_ids[name] = find_or_create_customer(cursor, name)
+                    created_at = credit['created_at'] or (item and item['added_at']) or now
+                    credit_rows.append((customer_ids[name], credit_id, name, credit['phone_number'],
+                                        credit['estimated_payment_date'], created_at))
+                    balances[credit_id] = [0.0, 0.0, credit['credit_paid'], created_at, None]
+                if item is None:
+                    continue
+                balance = balances[credit_id]
+                
+                last_item_id += 1
+                added_at = item['added_at'] or credit['created_at'] or balance[3]
+                paid_at = (item['paid_at'] or added_at) if item['paid'] else None
+                item_rows.append((last_item_id, credit_id, item['product'], item['cost'], item['quantity'],
+                                  item['price'], added_at, 'paid' if item['paid'] else 'pending', paid_at))
+                balance[0] += item['cost']
+                balance[3] = max(balance[3], added_at)
+                # A credit_paid amount stands for all of the credit's payments
+                if item['paid'] and balance[2] is None and item['cost'] > 0:
+                    payment_rows.append((credit_id, last_item_id, item['cost'], paid_at))
+                    balance[1] += item['cost']
+                    balance[4] = max(balance[4] or paid_at, paid_at)
+            
+            if len(item_rows) >= batch_rows:
+                flush()
+                yield 'progress', dict(stats)
+        
+        # Lump-sum payments, dated at the credit's last item
+        for credit_id, balance in balances.items():
+            if balance[2]:
+                payment_rows.append((credit_id, None, balance[2], balance[3]))
+                balance[1], balance[4] = balance[2], balance[3]
+        flush()
+        yield 'progress', dict(stats)
+        
+        # Paid in full: settle the credit and whatever items are still open
+        settled = [(balance[4], credit_id) for credit_id, balance in balances.items()
+                   if balance[1] > 0 and balance[1] >= balance[0] - 0.005]
+        cursor.executemany("UPDATE credits SET status = 'paid', paid_date = ? WHERE id = ?", settled)
+        cursor.executemany("""
+            UPDATE credit_items SET status = 'paid', paid_date = ?
+            WHERE credit_id = ? AND status IS NOT 'paid'
+        """, settled)
+        stats['settled'] = len(settled)
+        
+        # Derived tables, once for the whole file. Credits arrive linked to
+        # their customers; this fills in the phone numbers of new customers.
+        link_customers(cursor)
+        for triggers, rebuild in IMPORT_REBUILDS:
+            if rebuild:
+                rebuild(cursor)
+        if FTS_ENABLED:
+            cursor.execute("""
+                INSERT INTO credits_fts (rowid, customer_name, phone_number)
+                SELECT id, customer_name, phone_number FROM credits WHERE id >= ?
+            """, (first_credit_id,))
+            cursor.execute("""
+                INSERT INTO credit_items_fts (rowid, product)
+                SELECT id, product FROM credit_items WHERE id >= ?
+            """, (first_item_id,))
+        
+        for triggers, rebuild in families:
+            for sql in triggers.values():
+                cursor.execute(sql)
+        # Open pages re-read the whole ledger rather than replay the import
+        cursor.execute("INSERT INTO ledger_events (kind, credit_id) VALUES ('reload', 0)")
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    
+    yield 'done', dict(stats, rejects=rejects)
+
+@app.route('/api/import', methods=['POST'])
+@login_required
+def api_import():
+    """Import a CSV or JSONL file, streaming progress as JSON lines.
+
+    Send the file as the multipart field 'file' or as the request body;
+    ?format=csv|jsonl overrides the guess from the file name. Each line of
+    the response is {"progress": stats}, then a last {"done": stats} or
+    {"error": message}. A client that disconnects rolls the import back.
+    """
+    upload = request.files.get('file')
+    import_format = request.args.get('format') or import_format_for(upload.filename if upload else '')
+    if import_format not in IMPORT_FORMATS:
+        return api_error(f'Unknown import format: {import_format}')
+    connection = get_db_connection()
+    stream = io.TextIOWrapper(upload.stream if upload else request.stream, encoding='utf-8-sig', newline='')
+    
+    def generate():
+        try:
+            for event, stats in import_ledger(connection, iter_import_records(stream, import_format)):
+                yield json.dumps({event: stats}, ensure_ascii=False) + "\n"
+        except UnicodeDecodeError:
+            yield json.dumps({'error': 'The file must be UTF-8 text'}) + "\n"
+        except Exception as e:
+            app.logger.exception("Import error")
+            yield json.dumps({'error': str(e)}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# ---------------------------------------------------------------------------
+# Fingerprinted static assets
+#
+# Templates link CSS/JS through asset_url(), which embeds a hash of the file
+# contents in the URL. Those URLs never change meaning, so they are served
+# with an immutable, year-long Cache-Control. 'flask build-assets' writes
+# .gz (and .br, when the brotli package is installed) next to each asset,
+# and serve_asset() picks the best one the browser accepts.
+# ---------------------------------------------------------------------------
+
+ASSET_DIR = os.path.join(app.root_path, 'static')
+ASSET_FILES = ('css/app.css', 'js/app.js', 'js/offline.js', 'js/live.js')
+ASSET_URL_PATTERN = re.compile(r'^(?P<name>.+)\.(?P<digest>[0-9a-f]{10})(?P<ext>\.[A-Za-z0-9]+)$')
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+# filename -> (mtime, digest)
+_asset_digests = {}
+
+def asset_digest(filename):
+    """Content hash of a static file, recomputed only when the file changes"""
+    path = os.path.join(ASSET_DIR, filename)
+    mtime = os.path.getmtime(path)
+    cached = _asset_digests.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:10]
+    _asset_digests[filename] = (mtime, digest)
+    return digest
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file with its content hash embedded, e.g. /assets/js/app.1a2b3c4d5e.js"""
+    name, ext = os.path.splitext(filename)
+    return url_for('serve_asset', filename=f"{name}.{asset_digest(filename)}{ext}")
+
+@app.template_global()
+def has_endpoint(endpoint):
+    """Whether this app serves `endpoint`; index.html is shared with app.py, which serves fewer pages"""
+    return endpoint in app.view_functions
+
+@app.route('/sw.js')
+def service_worker():
+    """Serve the service worker from the root so its scope covers the whole app"""
+    response = send_file(os.path.join(ASSET_DIR, 'sw.js'), mimetype='text/javascript', max_age=0)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """Serve a fingerprinted asset, precompressed when possible"""
+    match = ASSET_URL_PATTERN.match(filename)
+    if not match:
+        abort(404)
+    source = match.group('name') + match.group('ext')
+    if source not in ASSET_FILES or asset_digest(source) != match.group('digest'):
+        abort(404)
+    
+    path = os.path.join(ASSET_DIR, source)
+    mimetype = mimetypes.guess_type(source)[0] or 'application/octet-stream'
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if candidate in request.accept_encodings and os.path.exists(path + suffix):
+            path, encoding = path + suffix, candidate
+            break
+    
+    response = send_file(path, mimetype=mimetype, max_age=ASSET_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f'public, max-age={ASSET_MAX_AGE}, immutable'
+    return response
+
+def build_assets():
+    """Write .gz and .br variants of every asset. Returns the files written."""
+    written = []
+    for filename in ASSET_FILES:
+        path = os.path.join(ASSET_DIR, filename)
+        with open(path, 'rb') as f:
+            data = f.read()
+        
+        variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data, quality=11)))
+        
+        for suffix, compressed in variants:
+            tmp_path = f"{path}{suffix}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, path + suffix)
+            written.append(filename + suffix)
+    return written
+
+# ---------------------------------------------------------------------------
+# Query profiling and metrics
+#
+# Every statement run through get_db_connection() is timed (see
+# ProfiledConnection). Responses carry a Server-Timing header with the
+# request's database time and query count, statements slower than
+# SLOW_QUERY_MS are logged with their EXPLAIN QUERY PLAN, and /metrics
+# exposes per-route latency histograms in the Prometheus text format.
+# Metrics are kept per worker process.
+# ---------------------------------------------------------------------------
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '100'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """A Prometheus histogram with one series per label set"""
+    
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                label_text = format_labels(labels)
+                for bound, count in zip(self.buckets, series['counts']):
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series["count"]}')
+                lines.append(f"{self.name}_sum{{{label_text}}} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{{{label_text}}} {series['count']}")
+        return lines
+
+class Counter:
+    """A Prometheus counter with one series per label set"""
+    
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._series.items()):
+                lines.append(f"{self.name}{{{format_labels(labels)}}} {value:g}")
+        return lines
+
+def format_labels(labels):
+    """(('route', 'index'), ...) -> route="index",..."""
+    return ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+
+REQUEST_SECONDS = Histogram('utang_request_duration_seconds', 'Time to produce a response, by route.')
+REQUESTS = Counter('utang_requests_total', 'Responses sent, by route and status.')
+DB_SECONDS = Histogram('utang_db_duration_seconds', 'Database time per request, by route.')
+DB_QUERIES = Counter('utang_db_queries_total', 'SQL statements run, by route.')
+SLOW_QUERIES = Counter('utang_slow_queries_total', 'Statements slower than SLOW_QUERY_MS, by route.')
+METRICS = (REQUEST_SECONDS, REQUESTS, DB_SECONDS, DB_QUERIES, SLOW_QUERIES)
+
+@app.before_request
+def start_request_profile():
+    """Start timing the request and collecting its statements"""
+    g.request_started = time.perf_counter()
+    g.queries = []
+    g.route = request.endpoint or 'unmatched'
+
+@app.after_request
+def record_request_profile(response):
+    """Add the Server-Timing header and record the route's metrics"""
+    if 'request_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    queries = g.queries
+    db_ms = sum(query['ms'] for query in queries)
+    response.headers['Server-Timing'] = (
+        f'db;dur={db_ms:.2f};desc="{len(queries)} queries", total;dur={elapsed * 1000:.2f}'
+    )
+    
+    route = (('route', g.route),)
+    REQUEST_SECONDS.observe(route + (('method', request.method),), elapsed)
+    REQUESTS.inc(route + (('method', request.method), ('status', response.status_code)))
+    DB_SECONDS.observe(route, db_ms / 1000)
+    DB_QUERIES.inc(route, len(queries))
+    return response
+
+def log_slow_queries(connection):
+    """Log the request's statements slower than SLOW_QUERY_MS with their query plans.
+
+    Runs at teardown, so statements of a streamed response are included.
+    """
+    slow = [query for query in g.get('queries') or () if query['ms'] >= SLOW_QUERY_MS]
+    for query in slow:
+        plan = ''
+        if query['params'] is not None:
+            try:
+                rows = connection.raw.execute(f"EXPLAIN QUERY PLAN {query['sql']}", query['params']).fetchall()
+                plan = '\n'.join(f"    {row['detail']}" for row in rows)
+            except sqlite3.Error as e:
+                plan = f"    (no plan: {e})"
+        app.logger.warning("Slow query in %s: %.1f ms, %d rows\n%s\n%s",
+                           g.get('route'), query['ms'], query['rows'],
+                           ' '.join(query['sql'].split()), plan)
+    if slow:
+        SLOW_QUERIES.inc((('route', g.get('route')),), len(slow))
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics; needs a login or 'Authorization: Bearer <METRICS_TOKEN>'"""
+    authorized = session.get('logged_in') or (
+        METRICS_TOKEN and request.headers.get('Authorization') == f"Bearer {METRICS_TOKEN}"
+    )
+    if not authorized:
+        return Response("Unauthorized\n", status=401, mimetype='text/plain')
+    
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+# ---------------------------------------------------------------------------
+# SMS reminders
+#
+# Request handlers never talk to the SMS provider. Reminders are written to
+# the sms_jobs table and a dispatcher - the 'flask sms-worker' command, or a
+# thread in the web server when SMS_WORKER=1 - sends them in the
+# background, at most SMS_RATE_PER_MINUTE a minute, retrying failures with
+# exponential backoff. Every job carries a dedupe key of the phone number
+# and day, so a customer gets at most one text a day however many credits
+# they have due and however many dispatchers are running.
+# ---------------------------------------------------------------------------
+
+SMS_PROVIDER = os.getenv('SMS_PROVIDER', 'semaphore' if os.getenv('SEMAPHORE_API_KEY') else 'fake')
+SMS_WORKER = os.getenv('SMS_WORKER', '0') == '1'
+SMS_RATE_PER_MINUTE = int(os.getenv('SMS_RATE_PER_MINUTE', '30'))
+SMS_BATCH_SIZE = int(os.getenv('SMS_BATCH_SIZE', '20'))
+SMS_MAX_ATTEMPTS = int(os.getenv('SMS_MAX_ATTEMPTS', '5'))
+SMS_RETRY_SECONDS = int(os.getenv('SMS_RETRY_SECONDS', '60'))
+SMS_POLL_SECONDS = int(os.getenv('SMS_POLL_SECONDS', '30'))
+SMS_REMINDER_HOUR = int(os.getenv('SMS_REMINDER_HOUR', '8'))
+SMS_REMIND_DAYS_BEFORE = int(os.getenv('SMS_REMIND_DAYS_BEFORE', '1'))
+SMS_OVERDUE_EVERY_DAYS = int(os.getenv('SMS_OVERDUE_EVERY_DAYS', '7'))
+
+# A job left 'sending' this long belongs to a dispatcher that died mid-send
+SMS_STALE_SECONDS = 10 * 60
+
+SEMAPHORE_URL = 'https://api.semaphore.co/api/v4/messages'
+PHONE_PATTERN = re.compile(r'^(?:\+?63|0)?(9\d{9})$')
+
+def create_sms_tables(cursor):
+    """Create the SMS job queue"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS sms_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone_number TEXT NOT NULL,
+            message TEXT NOT NULL,
+            credit_ids TEXT NOT NULL,
+            dedupe_key TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            claimed_at REAL,
+            sent_at TIMESTAMP,
+            provider_id TEXT,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # The dispatcher scans queued jobs in the order they become due
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sms_jobs_due ON sms_jobs(status, next_attempt_at)")
+
+def normalize_phone(phone_number):
+    """Return a Philippine mobile number as 09XXXXXXXXX, or None if it is not one"""
+    digits = re.sub(r'[\s\-().]', '', phone_number or '')
+    match = PHONE_PATTERN.match(digits)
+    return '0' + match.group(1) if match else None
+
+def reminder_due(due, today):
+    """Whether a credit due on `due` gets a reminder today"""
+    days_overdue = (today - due).days
+    if days_overdue < 0:
+        return -days_overdue == SMS_REMIND_DAYS_BEFORE
+    return days_overdue == 0 or days_overdue % max(SMS_OVERDUE_EVERY_DAYS, 1) == 0
+
+def reminder_message(name, balance, due, today):
+    """The reminder text for one customer's pending credits"""
+    if due > today:
+        when = f"Dapat bayadan sa {due.strftime('%B %d, %Y')}."
+    elif due == today:
+        when = "Dapat bayadan ngonyan na aldaw."
+    else:
+        when = f"Lampas na sa petsa nin pagbayad ({due.strftime('%B %d, %Y')})."
+    return (
+        f"Kumusta {name}!\n\n"
+        f"Paalala sa saimong utang sa Tindahan ni Annie:\n"
+        f"Balanse: ₱{balance:,.2f}\n"
+        f"{when}\n\n"
+        f"Salamat!"
+    )
+
+def enqueue_reminders(cursor, today):
+    """Queue today's due-date reminders; returns the number of new jobs.
+
+    One range scan of idx_status_due finds the pending credits that are
+    due soon or overdue. A customer's credits are grouped by phone number
+    into one message, and the job's dedupe key makes running this more
+    than once a day harmless.
+    """
+    upcoming = today + timedelta(days=SMS_REMIND_DAYS_BEFORE)
+    cursor.execute("""
+        SELECT c.id, c.customer_name, c.phone_number, c.estimated_payment_date,
+               ct.total_cost - ct.paid_amount as balance
+        FROM credits c
+        JOIN credit_totals ct ON ct.credit_id = c.id
+        WHERE c.status = 'pending'
+          AND c.estimated_payment_date <= ?
+          AND c.phone_number IS NOT NULL AND c.phone_number != ''
+    """, (upcoming.isoformat(),))
+    
+    customers = {}
+    for row in cursor.fetchall():
+        phone = normalize_phone(row['phone_number'])
+        if phone is None or row['balance'] <= 0.005:
+            continue
+        due = date.fromisoformat(str(row['estimated_payment_date'])[:10])
+        customer = customers.setdefault(phone, {
+            'name': row['customer_name'], 'balance': 0, 'due': due, 'remind': False, 'credit_ids': [],
+        })
+        customer['balance'] += row['balance']
+        customer['due'] = min(customer['due'], due)
+        customer['remind'] = customer['remind'] or reminder_due(due, today)
+        customer['credit_ids'].append(row['id'])
+    
+    jobs = [
+        (phone, reminder_message(c['name'], c['balance'], c['due'], today),
+         ','.join(map(str, c['credit_ids'])), f"{phone}:{today.isoformat()}", datetime.now().timestamp())
+        for phone, c in customers.items() if c['remind']
+    ]
+    before = cursor.connection.total_changes
+    cursor.executemany("""
+        INSERT OR IGNORE INTO sms_jobs (phone_number, message, credit_ids, dedupe_key, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, jobs)
+    return cursor.connection.total_changes - before
+
+def fetch_sms_stats(cursor):
+    """Job counts by status and the most recent failures"""
+    cursor.execute("SELECT status, COUNT(*) as jobs FROM sms_jobs GROUP BY status")
+    counts = {row['status']: row['jobs'] for row in cursor.fetchall()}
+    cursor.execute("""
+        SELECT id, phone_number, attempts, last_error, created_at
+        FROM sms_jobs
+        WHERE status = 'failed' OR (status = 'queued' AND attempts > 0)
+        ORDER BY id DESC
+        LIMIT 20
+    """)
+    return {'counts': counts, 'errors': [dict(row) for row in cursor.fetchall()]}
+
+class SMSError(Exception):
+    """A failed send. `retryable` is False when sending again cannot help."""
+    
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+class SemaphoreProvider:
+    """Sends through the Semaphore API (https://semaphore.co/)"""
+    
+    def __init__(self, api_key, sender_name=None, timeout=15):
+        self.api_key = api_key
+        self.sender_name = sender_name
+        self.timeout = timeout
+    
+    def send(self, phone_number, message):
+        """Send one message; returns the provider's message ID"""
+        fields = {'apikey': self.api_key, 'number': phone_number, 'message': message}
+        if self.sender_name:
+            fields['sendername'] = self.sender_name
+        data = urllib.parse.urlencode(fields).encode('utf-8')
+        
+        try:
+            with urllib.request.urlopen(SEMAPHORE_URL, data=data, timeout=self.timeout) as response:
+                body = json.loads(response.read().decode('utf-8') or 'null')
+        except urllib.error.HTTPError as e:
+            # Rate limits and server errors pass; a rejected request will not
+            raise SMSError(f"HTTP {e.code}", retryable=e.code == 429 or e.code >= 500)
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise SMSError(str(e))
+        
+        if isinstance(body, list) and body and 'message_id' in body[0]:
+            return str(body[0]['message_id'])
+        raise SMSError(f"Unexpected response: {body}", retryable=False)
+
+class FakeProvider:
+    """Records messages instead of sending them, for development and tests.
+
+    `failures` maps a phone number to how many sends to it should fail
+    before one succeeds.
+    """
+    
+    def __init__(self, failures=None):
+        self.sent = []
+        self.failures = dict(failures or {})
+        self._lock = threading.Lock()
+    
+    def send(self, phone_number, message):
+        with self._lock:
+            if self.failures.get(phone_number, 0) > 0:
+                self.failures[phone_number] -= 1
+                raise SMSError("Simulated failure")
+            self.sent.append((phone_number, message))
+            message_id = f"fake-{len(self.sent)}"
+        app.logger.info("SMS to %s: %s", phone_number, message)
+        return message_id
+
+SMS_PROVIDERS = {
+    'semaphore': lambda: SemaphoreProvider(os.getenv('SEMAPHORE_API_KEY', ''), os.getenv('SEMAPHORE_SENDER_NAME')),
+    'fake': FakeProvider,
+}
+
+def get_sms_provider(name=None):
+    """Build the provider named by SMS_PROVIDER"""
+    name = name or SMS_PROVIDER
+    if name not in SMS_PROVIDERS:
+        raise ValueError(f"Unknown SMS provider '{name}'; choose from {', '.join(SMS_PROVIDERS)}")
+    return SMS_PROVIDERS[name]()
+
+class RateLimiter:
+    """Spaces calls at least 60 / per_minute seconds apart"""
+    
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0
+        self._next = 0.0
+    
+    def wait(self, stop_event=None):
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            if stop_event is not None:
+                stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+        self._next = max(self._next, time.monotonic()) + self.interval
+
+class SMSDispatcher:
+    """Sends queued SMS jobs and queues each day's reminders.
+
+    Jobs are claimed inside BEGIN IMMEDIATE, so dispatchers in several
+    processes never send the same job twice.
+    """
+    
+    def __init__(self, provider, rate_per_minute=SMS_RATE_PER_MINUTE, batch_size=SMS_BATCH_SIZE):
+        self.provider = provider
+        self.limiter = RateLimiter(rate_per_minute)
+        self.batch_size = batch_size
+        self.reminders_queued_on = None
+    
+    def claim(self, connection, now):
+        """Mark up to batch_size due jobs as sending and return them"""
+        cursor = connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("""
+                UPDATE sms_jobs SET status = 'queued'
+                WHERE status = 'sending' AND claimed_at < ?
+            """, (now - SMS_STALE_SECONDS,))
+            cursor.execute("""
+                SELECT id, phone_number, message, attempts
+                FROM sms_jobs
+                WHERE status = 'queued' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id
+                LIMIT ?
+            """, (now, self.batch_size))
+            jobs = [dict(row) for row in cursor.fetchall()]
+            cursor.executemany("UPDATE sms_jobs SET status = 'sending', claimed_at = ? WHERE id = ?",
+                               [(now, job['id']) for job in jobs])
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        return jobs
+    
+    def record(self, connection, job, provider_id=None, error=None):
+        """Store the outcome of one send"""
+        if error is None:
+            connection.execute("""
+                UPDATE sms_jobs SET status = 'sent', attempts = attempts + 1, sent_at = CURRENT_TIMESTAMP,
+                                    provider_id = ?, last_error = NULL
+                WHERE id = ?
+            """, (provider_id, job['id']))
+        else:
+            attempts = job['attempts'] + 1
+            failed = not error.retryable or attempts >= SMS_MAX_ATTEMPTS
+            next_attempt_at = datetime.now().timestamp() + SMS_RETRY_SECONDS * 2 ** (attempts - 1)
+            connection.execute("""
+                UPDATE sms_jobs SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?
+                WHERE id = ?
+            """, ('failed' if failed else 'queued', attempts, next_attempt_at, str(error), job['id']))
+        connection.commit()
+    
+    def queue_reminders(self, connection, now):
+        """Queue the day's reminders once SMS_REMINDER_HOUR has passed"""
+        today = now.date()
+        if self.reminders_queued_on == today or now.hour < SMS_REMINDER_HOUR:
+            return 0
+        queued = enqueue_reminders(connection.cursor(), today)
+        connection.commit()
+        self.reminders_queued_on = today
+        return queued
+    
+    def run_once(self, stop_event=None):
+        """Queue reminders if due and send every job that is ready; returns the number sent"""
+        connection = open_connection()
+        sent = 0
+        try:
+            self.queue_reminders(connection, datetime.now())
+            while stop_event is None or not stop_event.is_set():
+                jobs = self.claim(connection, datetime.now().timestamp())
+                if not jobs:
+                    break
+                for job in jobs:
+                    self.limiter.wait(stop_event)
+                    try:
+                        provider_id = self.provider.send(job['phone_number'], job['message'])
+                    except SMSError as e:
+                        app.logger.warning("SMS error: job %s to %s: %s", job['id'], job['phone_number'], e)
+                        self.record(connection, job, error=e)
+                    else:
+                        self.record(connection, job, provider_id=provider_id)
+                        sent += 1
+        finally:
+            connection.close()
+        return sent
+    
+    def run_forever(self, stop_event, poll_seconds=SMS_POLL_SECONDS):
+        while not stop_event.is_set():
+            try:
+                self.run_once(stop_event)
+            except Exception:
+                app.logger.exception("SMS dispatcher error")
+            stop_event.wait(poll_seconds)
+
+sms_worker = {'pid': None, 'stop': threading.Event()}
+
+def run_sms_worker(stop_event):
+    """Dispatch from this process while it holds the SMS lock.
+
+    Every web worker runs one of these; the rest wait on the lock, so a
+    single dispatcher sends at a time and another takes over when its
+    worker exits.
+    """
+    with file_lock(DB_FILE + '.sms.lock'):
+        if not stop_event.is_set():
+            SMSDispatcher(get_sms_provider()).run_forever(stop_event)
+
+def start_sms_worker():
+    """Start this process's dispatcher thread when SMS_WORKER=1.
+
+    Called once by the server entry points (gunicorn.conf.py, asgi.py and
+    'python app_sqlite.py'), not per request.
+    """
+    if not SMS_WORKER or sms_worker['pid'] == os.getpid():
+        return
+    sms_worker['pid'] = os.getpid()
+    threading.Thread(target=run_sms_worker, args=(sms_worker['stop'],),
+                     name='sms-dispatcher', daemon=True).start()
+
+# ---------------------------------------------------------------------------
+# Backups
+#
+# 'flask backup' copies the live database with copy_database() - the online
+# backup API in small steps, so writers are never locked out for long -
+# checks the copy's integrity, gzips it into BACKUP_DIR as
+# store_credit-YYYYMMDD-HHMMSS.db.gz and writes its SHA-256 next to it in
+# sha256sum format. Only the newest BACKUP_KEEP backups are kept. With
+# BACKUP_INTERVAL_HOURS set, the web server also runs a thread that takes
+# a backup once the newest is that old; a lock file lets only one worker
+# process run it.
+#
+# 'flask restore' verifies the checksum and the integrity of a backup
+# before copying it over the live database, keeping what it replaced.
+# ---------------------------------------------------------------------------
+
+BACKUP_DIR = os.getenv('BACKUP_DIR', os.path.join(DB_PATH, 'backups'))
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '14'))
+BACKUP_INTERVAL_HOURS = float(os.getenv('BACKUP_INTERVAL_HOURS', '0'))
+BACKUP_POLL_SECONDS = 300
+BACKUP_NAME_FORMAT = 'store_credit-%Y%m%d-%H%M%S.db.gz'
+
+def list_backups():
+    """(taken_at, path) of every backup in BACKUP_DIR, oldest first"""
+    try:
+        names = os.listdir(BACKUP_DIR)
+    except FileNotFoundError:
+        return []
+    backups = []
+    for name in names:
+        try:
+            taken_at = datetime.strptime(name, BACKUP_NAME_FORMAT)
+        except ValueError:
+            continue  # checksums, partial files and anything else
+        backups.append((taken_at, os.path.join(BACKUP_DIR, name)))
+    return sorted(backups)
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def check_integrity(path):
+    """Run PRAGMA integrity_check on a database file. Returns the problems found."""
+    connection = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(path))}?mode=ro", uri=True)
+    try:
+        problems = [row[0] for row in connection.execute("PRAGMA integrity_check")]
+    except sqlite3.DatabaseError as e:
+        return [str(e)]
+    finally:
+        connection.close()
+    return [] if problems == ['ok'] else problems
+
+def create_backup():
+    """Back up the live database into BACKUP_DIR. Returns the backup's path."""
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    path = os.path.join(BACKUP_DIR, datetime.now().strftime(BACKUP_NAME_FORMAT))
+    copy = path[:-len('.gz')] + '.partial'
+    try:
+        copy_database(copy)
+        problems = check_integrity(copy)
+        if problems:
+            raise sqlite3.DatabaseError(f"Backup copy failed its integrity check: {problems[0]}")
+        with open(copy, 'rb') as source, gzip.open(path + '.partial', 'wb', compresslevel=6) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        os.replace(path + '.partial', path)
+    finally:
+        for leftover in (copy, path + '.partial'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    
+    with open(path + '.sha256', 'w') as f:
+        f.write(f"{file_sha256(path)}  {os.path.basename(path)}\n")
+    return path
+
+def prune_backups(keep=BACKUP_KEEP):
+    """Delete all but the newest `keep` backups. Returns the paths deleted."""
+    backups = list_backups()
+    deleted = []
+    for _, path in backups[:max(0, len(backups) - keep)]:
+        for name in (path, path + '.sha256'):
+            if os.path.exists(name):
+                os.remove(name)
+        deleted.append(path)
+    return deleted
+
+def find_backup(at=None):
+    """Path of the newest backup taken at or before `at` (default: the newest), or None"""
+    backups = [path for taken_at, path in list_backups() if at is None or taken_at <= at]
+    return backups[-1] if backups else None
+
+def verify_backup(path):
+    """Check a backup's checksum and unpack it next to the database.
+
+    Returns the path of the unpacked, integrity-checked copy; raises
+    ValueError when the backup cannot be trusted.
+    """
+    try:
+        with open(path + '.sha256') as f:
+            expected = f.read().split()[0]
+    except (OSError, IndexError):
+        raise ValueError(f"No checksum found for {path}")
+    if file_sha256(path) != expected:
+        raise ValueError(f"Checksum mismatch for {path}")
+    
+    unpacked = DB_FILE + '.restore'
+    try:
+        with gzip.open(path, 'rb') as source, open(unpacked, 'wb') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        problems = check_integrity(unpacked)
+        if problems:
+            raise ValueError(f"Backup failed its integrity check: {problems[0]}")
+        connection = sqlite3.connect(unpacked)
+        version = get_schema_version(connection)
+        connection.close()
+        if version > SCHEMA_VERSION:
+            raise ValueError(f"Backup schema version {version} is newer than this code ({SCHEMA_VERSION})")
+    except Exception:
+        if os.path.exists(unpacked):
+            os.remove(unpacked)
+        raise
+    return unpacked
+
+def restore_backup(path):
+    """Replace the live database with a backup. Returns where the old one was saved.
+
+    The old database is first copied aside with copy_database(), and a
+    backup from an older schema is migrated before it goes live. It is then
+    written in through the backup API, under SQLite's own locks, so a
+    process that still has the database open never sees a torn file.
+    """
+    unpacked = verify_backup(path)
+    try:
+        connection = sqlite3.connect(unpacked)
+        connection.row_factory = sqlite3.Row
+        apply_migrations(connection)
+        connection.close()
+        
+        previous = DB_FILE + datetime.now().strftime('.before-restore-%Y%m%d-%H%M%S')
+        copy_database(previous)
+        with migration_lock():
+            source = sqlite3.connect(unpacked)
+            target = open_connection()
+            try:
+                source.backup(target)
+                # Move every version past the replaced database's, so cached
+                # fragments, ETags and offline copies all treat the restored
+                # ledger as new, and offline copies drop credits it lacks
+                target.execute("ATTACH DATABASE ? AS replaced", (previous,))
+                version = target.execute("""
+                    SELECT MAX(l.version, r.version) + 1
+                    FROM main.ledger_summary l, replaced.ledger_summary r
+                    WHERE l.id = 1 AND r.id = 1
+                """).fetchone()[0]
+                target.execute("UPDATE ledger_summary SET version = ? WHERE id = 1", (version,))
+                target.execute("UPDATE credit_totals SET version = ?", (version,))
+                target.execute("""
+                    INSERT OR REPLACE INTO deleted_credits (credit_id, version)
+                    SELECT id, ? FROM replaced.credits
+                    WHERE id NOT IN (SELECT id FROM main.credits)
+                """, (version,))
+                # Open pages listening for live updates are told to reload,
+                # under an event id past any they have seen
+                target.execute("""
+                    INSERT INTO ledger_events (id, kind, credit_id)
+                    SELECT MAX((SELECT COALESCE(MAX(id), 0) FROM main.ledger_events),
+                               (SELECT COALESCE(MAX(id), 0) FROM replaced.ledger_events)) + 1, 'reload', 0
+                """)
+                target.commit()
+                target.execute("DETACH DATABASE replaced")
+            finally:
+                target.close()
+                source.close()
+    finally:
+        os.remove(unpacked)
+    return previous
+
+def backup_if_due():
+    """Take a backup when the newest is BACKUP_INTERVAL_HOURS old. Returns its path, or None."""
+    with file_lock(DB_FILE + '.backup.lock', blocking=False) as locked:
+        if not locked:
+            return None  # another worker is backing up
+        backups = list_backups()
+        if backups and datetime.now() - backups[-1][0] < timedelta(hours=BACKUP_INTERVAL_HOURS):
+            return None
+        path = create_backup()
+        prune_backups()
+        return path
+
+def run_backups(stop_event):
+    """Take scheduled backups from this process while it holds the backup worker lock"""
+    with file_lock(DB_FILE + '.backup-worker.lock'):
+        while not stop_event.is_set():
+            try:
+                backup_if_due()
+            except Exception:
+                app.logger.exception("Backup error")
+            stop_event.wait(BACKUP_POLL_SECONDS)
+
+backup_worker = {'pid': None, 'stop': threading.Event()}
+
+def start_backup_worker():
+    """Start this process's backup thread when BACKUP_INTERVAL_HOURS is set.
+
+    Called once by the server entry points, like start_sms_worker().
+    """
+    if BACKUP_INTERVAL_HOURS <= 0 or backup_worker['pid'] == os.getpid():
+        return
+    backup_worker['pid'] = os.getpid()
+    threading.Thread(target=run_backups, args=(backup_worker['stop'],),
+                     name='backups', daemon=True).start()
+
+# ---------------------------------------------------------------------------
+# JSON API
+#
+# Mutations return only the resources they changed. GET responses carry an
+# ETag derived from ledger_summary.version, so a client polling an unchanged
+# ledger gets a 304 without any table being read.
+# ---------------------------------------------------------------------------
+
+def api_error(message, status=400):
+    return jsonify({'error': message}), status
+
+def api_input():
+    """Request fields from a JSON body or, failing that, a form post"""
+    return request.get_json(silent=True) or request.form.to_dict()
+
+def parse_due_date(value):
+    """Validate an estimated payment date; returns it as YYYY-MM-DD or raises ValueError"""
+    try:
+        return date.fromisoformat(str(value).strip()).isoformat()
+    except ValueError:
+        raise ValueError('Estimated payment date must be a date (YYYY-MM-DD)')
+
+def parse_item_fields(data):
+    """Validate product/cost/quantity/price fields; raises ValueError on bad input"""
+    for field in ('product', 'quantity', 'price', 'cost'):
+        value = data.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (str, int, float))):
+            raise ValueError(f'{field.capitalize()} must be text or a number')
+    
+    product = str(data.get('product') or '').strip()
+    if not product:
+        raise ValueError('Product is required')
+    
+    try:
+        quantity = int(data.get('quantity') or 1)
+        price = float(data.get('price') or 0)
+        cost = data.get('cost')
+        cost = float(cost) if cost not in (None, '') else quantity * price
+    except (ValueError, OverflowError):
+        raise ValueError('Quantity must be a whole number; price and cost must be numbers')
+    if not (math.isfinite(price) and math.isfinite(cost)):
+        raise ValueError('Quantity, price and cost must be finite numbers')
+    if quantity < 1 or price < 0 or cost < 0:
+        raise ValueError('Quantity, price and cost must not be negative')
+    return {'product': product, 'cost': cost, 'quantity': quantity, 'price': price}
+
+def summary_to_dict(summary):
+    return {
+        'total_pending': summary['total_pending'],
+        'total_paid': summary['total_paid'],
+        'total_all': summary['total_all'],
+        'item_count': summary['item_count'],
+        'pending_credits': summary['pending'],
+        'paid_credits': summary['paid'],
+        'total_credits': summary['total'],
+    }
+
+def ledger_response(build, scope='', report=False):
+    """Serve a GET from `build(cursor)` with ledger-version ETag handling.
+
+    `build` returns the JSON payload, or None for a 404. `scope` is mixed
+    into the ETag for responses that also depend on something other than
+    the ledger and the URL, such as today's date. Report responses read
+    from get_report_connection() and say when their data is from.
+    """
+    if report:
+        connection = get_report_connection()
+        version = get_report_version(connection)
+    else:
+        connection = get_db_connection()
+        version = get_ledger_version(connection)
+    etag = f"ledger-{version}-{zlib.crc32((request.full_path + scope).encode()):08x}"
+    
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        payload = build(connection.cursor())
+        if payload is None:
+            return api_error('Not found', 404)
+        payload['version'] = version
+        if report:
+            payload['as_of'] = report_as_of()
+        response = jsonify(payload)
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def mutation_response(cursor, payload, status=200):
+    """Attach the new ledger summary and version to a mutation's response"""
+    payload['summary'] = summary_to_dict(store.fetch_ledger_summary(cursor))
+    payload['version'] = get_ledger_version(cursor.connection)
+    return jsonify(payload), status
+
+@app.route('/api/credits')
+@login_required
+def api_list_credits():
+    """One page of credits, same cursors as the index page"""
+    per_page = request.args.get('per_page', PAGE_SIZE, type=int)
+    per_page = max(1, min(per_page, max(PAGE_SIZE_CHOICES)))
+    after = decode_cursor(request.args.get('after'))
+    before = decode_cursor(request.args.get('before')) if not after else None
+    
+    def build(cursor):
+        credits, has_newer, has_older = store.fetch_credit_page(cursor, per_page, after, before)
+        return {
+            'credits': credits,
+            'prev_cursor': encode_cursor(credits[0]) if credits and has_newer else None,
+            'next_cursor': encode_cursor(credits[-1]) if credits and has_older else None,
+            'summary': summary_to_dict(store.fetch_ledger_summary(cursor)),
+        }
+    return ledger_response(build)
+
+@app.route('/api/credits/<int:credit_id>')
+@login_required
+def api_get_credit(credit_id):
+    def build(cursor):
+        credit = store.fetch_credit(cursor, credit_id)
+        return {'credit': dict(credit)} if credit else None
+    return ledger_response(build)
+
+@app.route('/api/credits/<int:credit_id>/items')
 @login_required
-def index():
-    """Main page - display all credits"""
+def api_get_items(credit_id):
+    def build(cursor):
+        if not store.fetch_credit(cursor, credit_id):
+            return None
+        return {'credit_id': credit_id, 'items': [dict(item) for item in store.fetch_items(cursor, credit_id)]}
+    return ledger_response(build)
+
+@app.route('/api/summary')
+@login_required
+def api_summary():
+    return ledger_response(lambda cursor: {'summary': summary_to_dict(store.fetch_ledger_summary(cursor))})
+
+@app.route('/api/changes')
+@login_required
+def api_changes():
+    """Credits changed and deleted since a ledger version, for offline clients.
+
+    Changed credits come back whole, with their items, in (version, id)
+    order. When there are more than `limit`, the response has has_more set
+    and the client calls again with the returned version and after_id.
+    """
+    since = request.args.get('since', 0, type=int)
+    after_id = request.args.get('after_id', 0, type=int)
+    limit = max(1, min(request.args.get('limit', CHANGES_LIMIT, type=int), CHANGES_LIMIT))
+    
     try:
         connection = get_db_connection()
-        cursor = connection.cursor()
+        current = get_ledger_version(connection)
+        if since >= current and not after_id:
+            # Nothing changed - answered without reading any table
+            return jsonify({'credits': [], 'deleted': [], 'version': current,
+                            'after_id': 0, 'has_more': False})
         
+        cursor = connection.cursor()
+        cursor.execute("BEGIN")  # one snapshot for credits, items and tombstones
         cursor.execute("""
-            SELECT c.id, c.customer_name, c.estimated_payment_date, 
+            SELECT c.id, c.customer_name, c.phone_number, c.estimated_payment_date,
                    c.status, c.created_at, c.paid_date,
-                   COALESCE(SUM(ci.cost), 0) as total_cost,
-                   COUNT(ci.id) as item_count
-            FROM credits c
-            LEFT JOIN credit_items ci ON c.id = ci.credit_id
-            GROUP BY c.id
-            ORDER BY c.created_at DESC
-        """)
-        credits = cursor.fetchall()
+                   ct.total_cost, ct.item_count, ct.paid_amount,
+                   ct.total_cost - ct.paid_amount as balance, ct.version
+            FROM credit_totals ct
+            JOIN credits c ON c.id = ct.credit_id
+            WHERE (ct.version, ct.credit_id) > (?, ?)
+            ORDER BY ct.version, ct.credit_id
+            LIMIT ?
+        """, (since, after_id or sys.maxsize, limit + 1))  # no after_id: only versions past `since`
+        credits = [dict(row) for row in cursor.fetchall()]
         
-        # Get all items for all credits
-        cursor.execute("""
-            SELECT credit_id, id, product, cost, added_at, quantity, unit_price
-            FROM credit_items
-            ORDER BY added_at DESC
-        """)
-        all_items = cursor.fetchall()
+        has_more = len(credits) > limit
+        if has_more:
+            credits = credits[:limit]
+            upto, next_after_id = credits[-1]['version'], credits[-1]['id']
+        else:
+            upto, next_after_id = get_ledger_version(connection), 0
         
-        # Group items by credit_id
-        items_by_credit = {}
-        for item in all_items:
-            credit_id = item['credit_id']
-            if credit_id not in items_by_credit:
-                items_by_credit[credit_id] = []
-            items_by_credit[credit_id].append(item)
+        items_by_credit = store.fetch_items_by_credit(cursor, [credit['id'] for credit in credits])
+        for credit in credits:
+            credit['items'] = [dict(item) for item in items_by_credit.get(credit['id'], [])]
         
-        # Calculate totals (all items are pending since paid ones are deleted)
         cursor.execute("""
-            SELECT 
-                SUM(ci.cost) as total_pending
-            FROM credit_items ci
-        """)
-        totals = cursor.fetchone()
+            SELECT credit_id FROM deleted_credits
+            WHERE version > ? AND version <= ?
+        """, (since, upto))
+        deleted = [row[0] for row in cursor.fetchall()]
         
-        connection.close()
-        
-        return render_template('index.html', credits=credits, totals=totals, items_by_credit=items_by_credit)
+        return jsonify({
+            'credits': credits,
+            'deleted': deleted,
+            'summary': summary_to_dict(store.fetch_ledger_summary(cursor)),
+            'version': upto,
+            'after_id': next_after_id,
+            'has_more': has_more,
+        })
     except Exception as e:
-        print(f"Database error: {e}")
-        return f"Database error: {e}", 500
+        app.logger.exception("Database error")
+        return api_error(str(e), 500)
 
-@app.route('/add_credit', methods=['POST'])
+@app.route('/api/events')
 @login_required
-def add_credit():
-    """Add a new credit entry"""
-    customer_name = request.form.get('customer_name')
-    product = request.form.get('product')
-    cost = request.form.get('cost')
-    estimated_payment_date = request.form.get('estimated_payment_date')
-    quantity = request.form.get('quantity', 1)
-    price = request.form.get('price', 0)
+def api_events():
+    """Ledger events after Last-Event-ID (or ?after=), as Server-Sent Events.
+
+    This sends the events committed so far and ends the response, telling
+    the browser's EventSource to reconnect after LIVE_RETRY_SECONDS, so a
+    listening page never holds a gunicorn worker. asgi.py keeps the stream
+    open instead and sends each change as it commits.
+    """
+    after_id = request.headers.get('Last-Event-ID', type=int)
+    if after_id is None:
+        after_id = request.args.get('after', type=int)
     
-    if not all([customer_name, product, cost, estimated_payment_date]):
-        return jsonify({'error': 'All fields are required'}), 400
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        cursor.execute("BEGIN")  # one snapshot for the events and what they name
+        if after_id is None:
+            # Start from now; an id-only message sets where to resume
+            text = format_sse(None, event_id=fetch_live_position(cursor))
+        else:
+            text, _, _ = live_event_stream(cursor, after_id)
+        text = f"retry: {LIVE_RETRY_SECONDS * 1000}\n\n" + text
+        return Response(text, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+    except Exception as e:
+        app.logger.exception("Database error")
+        return api_error(str(e), 500)
+
+@app.route('/api/credits', methods=['POST'])
+@login_required
+def api_create_credit():
+    data = api_input()
+    customer_name = (data.get('customer_name') or '').strip()
+    estimated_payment_date = data.get('estimated_payment_date')
+    if not customer_name or not estimated_payment_date:
+        return api_error('Customer name and estimated payment date are required')
+    try:
+        estimated_payment_date = parse_due_date(estimated_payment_date)
+        item = parse_item_fields(data)
+    except ValueError as e:
+        return api_error(str(e))
     
     try:
         connection = get_db_connection()
         cursor = connection.cursor()
-        
-        # Insert credit record
-        cursor.execute("""
-            INSERT INTO credits (customer_name, estimated_payment_date)
-            VALUES (?, ?)
-        """, (customer_name, estimated_payment_date))
-        
-        credit_id = cursor.lastrowid
-        
-        # Insert first item
-        cursor.execute("""
-            INSERT INTO credit_items (credit_id, product, cost, quantity, unit_price)
-            VALUES (?, ?, ?, ?, ?)
-        """, (credit_id, product, float(cost), int(quantity), float(price)))
-        
+        credit_id = store.create_credit(cursor, customer_name, estimated_payment_date,
+                                        item['product'], item['cost'], item['quantity'], item['price'],
+                                        phone_number=data.get('phone_number') or None)
         connection.commit()
-        connection.close()
-        
-        return redirect(url_for('index', success='added'))
+        return mutation_response(cursor, {'credit': dict(store.fetch_credit(cursor, credit_id))}, 201)
     except Exception as e:
-        print(f"Database error: {e}")
-        return jsonify({'error': str(e)}), 500
+        app.logger.exception("Database error")
+        return api_error(str(e), 500)
 
-@app.route('/mark_paid/<int:credit_id>', methods=['POST'])
+@app.route('/api/credits/<int:credit_id>/items', methods=['POST'])
 @login_required
-def mark_paid(credit_id):
-    """Mark a credit as paid"""
+def api_add_item(credit_id):
+    try:
+        item = parse_item_fields(api_input())
+    except ValueError as e:
+        return api_error(str(e))
+    
     try:
         connection = get_db_connection()
         cursor = connection.cursor()
+        if not store.fetch_credit(cursor, credit_id):
+            return api_error('Not found', 404)
+        item_id = store.add_item(cursor, credit_id, item['product'], item['cost'], item['quantity'], item['price'])
+        connection.commit()
         
         cursor.execute("""
-            UPDATE credits 
-            SET status = 'paid', paid_date = CURRENT_TIMESTAMP
-            WHERE id = ?
-        """, (credit_id,))
-        
+            SELECT id, credit_id, product, cost, added_at, quantity, unit_price, status, paid_date
+            FROM credit_items WHERE id = ?
+        """, (item_id,))
+        return mutation_response(cursor, {
+            'item': dict(cursor.fetchone()),
+            'credit': dict(store.fetch_credit(cursor, credit_id)),
+        }, 201)
+    except Exception as e:
+        app.logger.exception("Database error")
+        return api_error(str(e), 500)
+
+@app.route('/api/credits/<int:credit_id>/items/<int:item_id>/pay', methods=['POST'])
+@login_required
+def api_pay_item(credit_id, item_id):
+    try:
+        connection = get_db_connection()
+        cursor = connection.cursor()
+        if not store.pay_item(cursor, credit_id, item_id):
+            return api_error('Not found', 404)
         connection.commit()
-        connection.close()
-        
-        return redirect(url_for('index', success='paid'))
+        return mutation_response(cursor, {
+            'paid_item_id': item_id,
+            'credit': dict(store.fetch_credit(cursor, credit_id)),
+        })
     except Exception as e:
-        print(f"Database error: {e}")
-        return jsonify({'error': str(e)}), 500
+        app.logger.exception("Database error")
+        return api_error(str(e), 500)
 
-@app.route('/add_product/<int:credit_id>', methods=['POST'])
+@app.route('/api/credits/<int:credit_id>/items/batch', methods=['POST'])
 @login_required
-def add_product(credit_id):
-    """Add a new product to an existing credit"""
-    product = request.form.get('product')
-    cost = request.form.get('cost')
-    quantity = request.form.get('quantity', 1)
-    price = request.form.get('price', 0)
+def api_add_items(credit_id):
+    """Add a whole receipt of items in one transaction"""
+    data = request.get_json(silent=True) or {}
+    raw_items = data.get('items')
+    if not isinstance(raw_items, list) or not raw_items:
+        return api_error('A non-empty list of items is required')
+    if len(raw_items) > MAX_BATCH_ITEMS:
+        return api_error(f'At most {MAX_BATCH_ITEMS} items per request')
     
-    if not all([product, cost]):
-        return jsonify({'error': 'Product and cost are required'}), 400
+    items, rejected = [], []
+    for index, raw in enumerate(raw_items):
+        try:
+            items.append(parse_item_fields(raw if isinstance(raw, dict) else {}))
+        except ValueError as e:
+            rejected.append({'index': index, 'error': str(e)})
+    if rejected:
+        # All or nothing: a receipt is entered completely or not at all
+        return jsonify({'error': 'Some items are invalid', 'rejected': rejected}), 400
     
     try:
         connection = get_db_connection()
         cursor = connection.cursor()
-        
-        # Insert the new product
-        cursor.execute("""
-            INSERT INTO credit_items (credit_id, product, cost, quantity, unit_price)
-            VALUES (?, ?, ?, ?, ?)
-        """, (credit_id, product, float(cost), int(quantity), float(price)))
-        
-        # Change status back to pending if it was paid
-        cursor.execute("""
-            UPDATE credits 
-            SET status = 'pending', paid_date = NULL
-            WHERE id = ?
-        """, (credit_id,))
-        
+        if not store.fetch_credit(cursor, credit_id):
+            return api_error('Not found', 404)
+        added = store.add_items(cursor, credit_id, items)
         connection.commit()
-        connection.close()
-        
-        return redirect(url_for('index', success='product_added'))
+        return mutation_response(cursor, {
+            'added': added,
+            'added_cost': sum(item['cost'] for item in items),
+            'credit': dict(store.fetch_credit(cursor, credit_id)),
+        }, 201)
     except Exception as e:
-        print(f"Database error: {e}")
-        return jsonify({'error': str(e)}), 500
+        app.logger.exception("Database error")
+        return api_error(str(e), 500)
 
-@app.route('/view_items/<int:credit_id>')
+@app.route('/api/credits/<int:credit_id>/items/pay', methods=['POST'])
 @login_required
-def view_items(credit_id):
-    """View all items for a specific credit"""
+def api_pay_items(credit_id):
+    """Settle several items of one credit in one transaction"""
+    data = api_input()
+    item_ids = data.get('item_ids') if request.is_json else request.form.getlist('item_ids')
+    try:
+        item_ids = sorted({int(item_id) for item_id in item_ids or []})
+    except (TypeError, ValueError):
+        return api_error('item_ids must be a list of item IDs')
+    if not item_ids:
+        return api_error('A non-empty list of item_ids is required')
+    if len(item_ids) > MAX_BATCH_ITEMS:
+        return api_error(f'At most {MAX_BATCH_ITEMS} items per request')
+    
     try:
         connection = get_db_connection()
         cursor = connection.cursor()
-        
-        # Get credit info
-        cursor.execute("""
-            SELECT c.id, c.customer_name, c.estimated_payment_date, 
-                   c.status, c.created_at
-            FROM credits c
-            WHERE c.id = ?
-        """, (credit_id,))
-        credit = cursor.fetchone()
-        
+        credit = store.fetch_credit(cursor, credit_id)
         if not credit:
-            connection.close()
-            return "Credit not found", 404
-        
-        # Get all items (only pending ones remain after payment)
-        cursor.execute("""
-            SELECT id, product, cost, added_at, quantity, unit_price
-            FROM credit_items
-            WHERE credit_id = ?
-            ORDER BY added_at DESC
-        """, (credit_id,))
-        items = cursor.fetchall()
-        
-        # Calculate total (all remaining items are pending)
-        cursor.execute("""
-            SELECT 
-                SUM(cost) as total
-            FROM credit_items
-            WHERE credit_id = ?
-        """, (credit_id,))
-        total = cursor.fetchone()
-        
-        connection.close()
+            return api_error('Not found', 404)
+        balance_before = credit['balance']
+        paid = store.pay_items(cursor, credit_id, item_ids)
+        connection.commit()
         
-        return render_template('view_items.html', credit=credit, items=items, total=total)
+        credit = store.fetch_credit(cursor, credit_id)
+        return mutation_response(cursor, {
+            'paid': paid,
+            'not_found': len(item_ids) - paid,
+            'paid_cost': balance_before - credit['balance'],
+            'credit': dict(credit),
+        })
     except Exception as e:
-        print(f"Database error: {e}")
-        return f"Database error: {e}", 500
+        app.logger.exception("Database error")
+        return api_error(str(e), 500)
 
-@app.route('/mark_item_paid/<int:credit_id>/<int:item_id>', methods=['POST'])
+@app.route('/api/credits/<int:credit_id>/pay', methods=['POST'])
 @login_required
-def mark_item_paid(credit_id, item_id):
-    """Mark a specific item as paid and remove it"""
+def api_pay_credit(credit_id):
     try:
         connection = get_db_connection()
         cursor = connection.cursor()
-        
-        # Delete the paid item
-        cursor.execute("""
-            DELETE FROM credit_items 
-            WHERE id = ? AND credit_id = ?
-        """, (item_id, credit_id))
-        
-        # Check if any items remain for this credit
-        cursor.execute("""
-            SELECT COUNT(*) as remaining_count
-            FROM credit_items
-            WHERE credit_id = ?
-        """, (credit_id,))
-        result = cursor.fetchone()
-        
-        # If no items remain, mark the whole credit as paid and delete it
-        if result['remaining_count'] == 0:
-            cursor.execute("""
-                UPDATE credits 
-                SET status = 'paid', paid_date = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (credit_id,))
-        
+        if not store.pay_credit(cursor, credit_id):
+            return api_error('Not found', 404)
         connection.commit()
-        connection.close()
-        
-        return redirect(url_for('index', success='item_paid') + '#credit-list')
+        return mutation_response(cursor, {'credit': dict(store.fetch_credit(cursor, credit_id))})
     except Exception as e:
-        print(f"Database error: {e}")
-        return jsonify({'error': str(e)}), 500
+        app.logger.exception("Database error")
+        return api_error(str(e), 500)
 
-@app.route('/delete_credit/<int:credit_id>', methods=['POST'])
+@app.route('/api/credits/<int:credit_id>/payments')
 @login_required
-def delete_credit(credit_id):
-    """Delete a credit entry and reorder IDs"""
+def api_get_payments(credit_id):
+    def build(cursor):
+        if not store.fetch_credit(cursor, credit_id):
+            return None
+        return {'credit_id': credit_id, 'payments': [dict(payment) for payment in store.fetch_payments(cursor, credit_id)]}
+    return ledger_response(build)
+
+@app.route('/api/credits/<int:credit_id>/payments', methods=['POST'])
+@login_required
+def api_add_payment(credit_id):
+    """Record a partial payment; the credit is marked paid when it reaches zero"""
+    try:
+        amount = float(api_input().get('amount') or 0)
+    except (TypeError, ValueError):
+        return api_error('Amount must be a number')
+    
     try:
         connection = get_db_connection()
         cursor = connection.cursor()
-        
-        # Delete the credit and its items
-        cursor.execute("DELETE FROM credit_items WHERE credit_id = ?", (credit_id,))
-        cursor.execute("DELETE FROM credits WHERE id = ?", (credit_id,))
-        
-        # Reorder IDs: Get all remaining credits ordered by creation date
-        cursor.execute("""
-            SELECT id FROM credits ORDER BY created_at ASC
-        """)
-        remaining_credits = cursor.fetchall()
-        
-        # Temporarily disable foreign key constraints
-        cursor.execute("PRAGMA foreign_keys = OFF")
-        
-        # Create temporary table with new sequential IDs
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS credits_temp (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                customer_name TEXT NOT NULL,
-                phone_number TEXT,
-                estimated_payment_date DATE NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'pending',
-                paid_date TIMESTAMP NULL
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS credit_items_temp (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                credit_id INTEGER NOT NULL,
-                product TEXT NOT NULL,
-                cost REAL NOT NULL,
-                quantity INTEGER DEFAULT 1,
-                unit_price REAL DEFAULT 0,
-                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'pending',
-                paid_date TIMESTAMP NULL,
-                FOREIGN KEY (credit_id) REFERENCES credits_temp(id) ON DELETE CASCADE
-            )
-        """)
-        
-        # Copy data with new sequential IDs
-        new_id = 1
-        id_mapping = {}  # Old ID -> New ID
-        
-        for old_credit in remaining_credits:
-            old_id = old_credit['id']
-            id_mapping[old_id] = new_id
-            
-            # Copy credit with new ID
-            cursor.execute("""
-                INSERT INTO credits_temp (id, customer_name, phone_number, estimated_payment_date, created_at, status, paid_date)
-                SELECT ?, customer_name, phone_number, estimated_payment_date, created_at, status, paid_date
-                FROM credits WHERE id = ?
-            """, (new_id, old_id))
-            
-            # Copy items with new credit_id
-            cursor.execute("""
-                INSERT INTO credit_items_temp (credit_id, product, cost, quantity, unit_price, added_at, status, paid_date)
-                SELECT ?, product, cost, quantity, unit_price, added_at, status, paid_date
-                FROM credit_items WHERE credit_id = ?
-            """, (new_id, old_id))
-            
-            new_id += 1
-        
-        # Drop old tables and rename temp tables
-        cursor.execute("DROP TABLE IF EXISTS credit_items")
-        cursor.execute("DROP TABLE IF EXISTS credits")
-        cursor.execute("ALTER TABLE credits_temp RENAME TO credits")
-        cursor.execute("ALTER TABLE credit_items_temp RENAME TO credit_items")
-        
-        # Reset autoincrement counter
-        cursor.execute(f"UPDATE sqlite_sequence SET seq = {new_id - 1} WHERE name = 'credits'")
-        cursor.execute(f"DELETE FROM sqlite_sequence WHERE name = 'credit_items'")
-        
-        # Re-enable foreign key constraints
-        cursor.execute("PRAGMA foreign_keys = ON")
-        
+        if store.add_payment(cursor, credit_id, amount) is None:
+            return api_error('Not found', 404)
         connection.commit()
-        connection.close()
-        
-        return redirect(url_for('index', success='deleted'))
+        return mutation_response(cursor, {'credit': dict(store.fetch_credit(cursor, credit_id))}, 201)
+    except ValueError as e:
+        return api_error(str(e))
     except Exception as e:
-        print(f"Database error: {e}")
-        return jsonify({'error': str(e)}), 500
+        app.logger.exception("Database error")
+        return api_error(str(e), 500)
 
-@app.route('/search')
+@app.route('/api/reports/balances')
 @login_required
-def search():
-    """Search credits by customer name"""
-    query = request.args.get('q', '')
+def api_report_balances():
+    """Outstanding balance per customer, largest first"""
+    limit = max(1, min(request.args.get('limit', 50, type=int), SEARCH_LIMIT))
+    return ledger_response(lambda cursor: {'customers': fetch_customer_balances(cursor, limit)}, report=True)
+
+@app.route('/api/reports/collections')
+@login_required
+def api_report_collections():
+    """Daily collections and the collection rate between two dates (default: last REPORT_DAYS days)"""
+    today = date.today()
+    try:
+        end = date.fromisoformat(request.args.get('to') or today.isoformat())
+        start = date.fromisoformat(request.args.get('from') or (end - timedelta(days=REPORT_DAYS - 1)).isoformat())
+    except ValueError:
+        return api_error('from and to must be dates (YYYY-MM-DD)')
+    if start > end:
+        return api_error('from must not be after to')
+    return ledger_response(lambda cursor: fetch_collections(cursor, start.isoformat(), end.isoformat()),
+                           scope=today.isoformat(), report=True)
+
+@app.route('/api/sms')
+@login_required
+def api_sms_stats():
+    """SMS queue counts by status and recent send errors"""
+    try:
+        connection = get_db_connection()
+        return jsonify(fetch_sms_stats(connection.cursor()))
+    except Exception as e:
+        app.logger.exception("Database error")
+        return api_error(str(e), 500)
+
+@app.route('/api/customers')
+@login_required
+def api_list_customers():
+    """One page of customers, largest balance first; follow next_after for the next page"""
+    per_page = max(1, min(request.args.get('limit', PAGE_SIZE, type=int), SEARCH_LIMIT))
+    after = decode_balance_cursor(request.args.get('after'))
+    
+    def build(cursor):
+        rows, has_more = fetch_customer_page(cursor, per_page, after)
+        return {'customers': rows,
+                'next_after': encode_balance_cursor(rows[-1]) if has_more else None}
+    return ledger_response(build)
+
+@app.route('/api/customers/<int:customer_id>')
+@login_required
+def api_get_customer(customer_id):
+    def build(cursor):
+        customer = fetch_customer(cursor, customer_id)
+        if customer is None:
+            return None
+        return {'customer': dict(customer), 'credits': fetch_customer_credits(cursor, customer_id)}
+    return ledger_response(build)
+
+@app.route('/api/customers/<int:customer_id>/merge', methods=['POST'])
+@login_required
+def api_merge_customer(customer_id):
+    """Fold a customer recorded under another spelling into the customer given as 'into'"""
+    try:
+        into_id = int(api_input().get('into'))
+    except (TypeError, ValueError):
+        return api_error('into must be a customer ID')
+    if into_id == customer_id:
+        return api_error('A customer cannot be merged into itself')
     
     try:
         connection = get_db_connection()
         cursor = connection.cursor()
-        
-        cursor.execute("""
-            SELECT c.id, c.customer_name, c.estimated_payment_date, 
-                   c.status, c.created_at, c.paid_date,
-                   COALESCE(SUM(ci.cost), 0) as total_cost,
-                   COUNT(ci.id) as item_count
-            FROM credits c
-            LEFT JOIN credit_items ci ON c.id = ci.credit_id
-            WHERE c.customer_name LIKE ?
-            GROUP BY c.id
-            ORDER BY c.created_at DESC
-        """, (f'%{query}%',))
-        credits = cursor.fetchall()
-        
-        # Get all items for searched credits
-        cursor.execute("""
-            SELECT ci.credit_id, ci.id, ci.product, ci.cost, ci.added_at, ci.quantity, ci.unit_price
-            FROM credit_items ci
-            JOIN credits c ON ci.credit_id = c.id
-            WHERE c.customer_name LIKE ?
-            ORDER BY ci.added_at DESC
-        """, (f'%{query}%',))
-        all_items = cursor.fetchall()
-        
-        # Group items by credit_id
-        items_by_credit = {}
-        for item in all_items:
-            credit_id = item['credit_id']
-            if credit_id not in items_by_credit:
-                items_by_credit[credit_id] = []
-            items_by_credit[credit_id].append(item)
-        
-        cursor.execute("""
-            SELECT 
-                SUM(CASE WHEN c.status = 'pending' THEN COALESCE(ci.cost, 0) ELSE 0 END) as total_pending,
-                SUM(CASE WHEN c.status = 'paid' THEN COALESCE(ci.cost, 0) ELSE 0 END) as total_paid,
-                SUM(COALESCE(ci.cost, 0)) as total_all
-            FROM credits c
-            LEFT JOIN credit_items ci ON c.id = ci.credit_id
-            WHERE c.customer_name LIKE ?
-        """, (f'%{query}%',))
-        totals = cursor.fetchone()
-        
-        connection.close()
-        
-        return render_template('index.html', credits=credits, totals=totals, search_query=query, items_by_credit=items_by_credit)
+        if not merge_customers(cursor, customer_id, into_id):
+            return api_error('Customer not found', 404)
+        connection.commit()
+        return jsonify({'customer': dict(fetch_customer(cursor, into_id)), 'merged_customer_id': customer_id})
     except Exception as e:
-        print(f"Database error: {e}")
-        return f"Database error: {e}", 500
+        app.logger.exception("Database error")
+        return api_error(str(e), 500)
 
-@app.route('/export_credits')
+@app.route('/api/credits/<int:credit_id>', methods=['DELETE'])
 @login_required
-def export_credits():
-    """Export credits list to a text file"""
+def api_delete_credit(credit_id):
     try:
         connection = get_db_connection()
         cursor = connection.cursor()
-        
-        # Get all credits with their items
-        cursor.execute("""
-            SELECT c.id, c.customer_name, c.estimated_payment_date, 
-                   c.status, c.created_at,
-                   COALESCE(SUM(ci.cost), 0) as total_cost
-            FROM credits c
-            LEFT JOIN credit_items ci ON c.id = ci.credit_id
-            GROUP BY c.id
-            ORDER BY c.customer_name, c.created_at DESC
-        """)
-        credits = cursor.fetchall()
-        
-        # Build the output text
-        output_lines = []
-        output_lines.append("=" * 80)
-        output_lines.append("LISTAHAN NG UTANG - TINDAHAN NI ANNIE")
-        output_lines.append("=" * 80)
-        output_lines.append(f"Petsa ng Pag-export: {datetime.now().strftime('%B %d, %Y - %I:%M %p')}")
-        output_lines.append("=" * 80)
-        output_lines.append("")
-        
-        for credit in credits:
-            # Get items for this credit
-            cursor.execute("""
-                SELECT product, cost, added_at, quantity, unit_price
-                FROM credit_items
-                WHERE credit_id = ?
-                ORDER BY added_at DESC
-            """, (credit['id'],))
-            items = cursor.fetchall()
-            
-            # Customer header
-            output_lines.append("-" * 80)
-            output_lines.append(f"KOSTUMER: {credit['customer_name']}")
-            output_lines.append(f"ID ng Utang: {credit['id']}")
-            output_lines.append(f"Katayuan: {credit['status'].upper()}")
-            output_lines.append(f"Tinantyang Petsa ng Bayad: {credit['estimated_payment_date']}")
-            output_lines.append(f"Petsa ng Paglikha: {credit['created_at']}")
-            output_lines.append("")
-            
-            # Items list
-            if items:
-                output_lines.append("  MGA PRODUKTO:")
-                output_lines.append("  " + "-" * 76)
-                for idx, item in enumerate(items, 1):
-                    output_lines.append(f"  {idx}. {item['product']}")
-                    output_lines.append(f"     Halaga: ₱{item['cost']:.2f}")
-                    output_lines.append(f"     Petsa ng Pagdagdag: {item['added_at']}")
-                    output_lines.append("")
-            else:
-                output_lines.append("  Walang mga produkto")
-                output_lines.append("")
-            
-            # Total
-            output_lines.append(f"  KABUUANG UTANG: ₱{credit['total_cost']:.2f}")
-            output_lines.append("-" * 80)
-            output_lines.append("")
-        
-        # Summary
-        cursor.execute("""
-            SELECT 
-                COUNT(DISTINCT c.id) as total_credits,
-                SUM(CASE WHEN c.status = 'pending' THEN COALESCE(ci.cost, 0) ELSE 0 END) as total_pending,
-                SUM(CASE WHEN c.status = 'paid' THEN COALESCE(ci.cost, 0) ELSE 0 END) as total_paid,
-                SUM(COALESCE(ci.cost, 0)) as total_all
-            FROM credits c
-            LEFT JOIN credit_items ci ON c.id = ci.credit_id
-        """)
-        summary = cursor.fetchone()
-        
-        output_lines.append("=" * 80)
-        output_lines.append("BUOD")
-        output_lines.append("=" * 80)
-        output_lines.append(f"Kabuuang Bilang ng Utang: {summary['total_credits']}")
-        output_lines.append(f"Kabuuang Hindi Pa Bayad: ₱{summary['total_pending']:.2f}")
-        output_lines.append(f"Kabuuang Nabayaran: ₱{summary['total_paid']:.2f}")
-        output_lines.append(f"KABUUANG LAHAT: ₱{summary['total_all']:.2f}")
-        output_lines.append("=" * 80)
-        
-        connection.close()
-        
-        # Create the file content
-        file_content = "\n".join(output_lines)
-        
-        # Generate filename with current date
-        filename = f"Listahan_ng_Utang_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-        
-        # Return as downloadable file
-        return Response(
-            file_content,
-            mimetype="text/plain",
-            headers={"Content-Disposition": f"attachment;filename={filename}"}
-        )
-        
+        if not store.remove_credit(cursor, credit_id):
+            return api_error('Not found', 404)
+        connection.commit()
+        return mutation_response(cursor, {'deleted_credit_id': credit_id})
     except Exception as e:
-        print(f"Export error: {e}")
-        return f"Export error: {e}", 500
+        app.logger.exception("Database error")
+        return api_error(str(e), 500)
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Precompress the fingerprinted CSS/JS assets"""
+    for filename in build_assets():
+        click.echo(f"  wrote static/{filename}")
+    if brotli is None:
+        click.echo("brotli is not installed; only gzip variants were written.")
+
+@app.cli.command('migrate')
+@click.option('--status', is_flag=True, help='Only show which migrations are applied.')
+def migrate_command(status):
+    """Apply pending schema migrations"""
+    connection = open_connection()
+    version = get_schema_version(connection)
+    if status:
+        for number, description, _ in MIGRATIONS:
+            click.echo(f"  {'applied' if number <= version else 'pending'}  {number}: {description}")
+    elif version >= SCHEMA_VERSION:
+        click.echo(f"Schema is current (version {version}).")
+    else:
+        for number, description in apply_migrations(connection):
+            click.echo(f"Applied migration {number}: {description}")
+    connection.close()
+
+@app.cli.command('check-totals')
+@click.option('--repair', is_flag=True, help='Rebuild the running totals if they are out of sync.')
+def check_totals_command(repair):
+    """Verify the running totals against a full recount"""
+    connection = open_connection()
+    cursor = connection.cursor()
+    problems = check_totals(cursor) + check_aging(cursor) + check_rollups(cursor) + check_customers(cursor)
+    
+    if not problems:
+        click.echo("Running totals are consistent.")
+    else:
+        for problem in problems:
+            click.echo(f"  {problem}")
+        click.echo(f"{len(problems)} mismatch(es) found.")
+        if repair:
+            rebuild_totals(cursor)
+            rebuild_aging(cursor)
+            rebuild_rollups(cursor)
+            link_customers(cursor)
+            rebuild_customers(cursor)
+            connection.commit()
+            click.echo("Running totals rebuilt.")
+    
+    connection.close()
+    if problems and not repair:
+        raise SystemExit(1)
+
+@app.cli.command('check-store')
+def check_store_command():
+    """Exercise every ledger write on a throwaway credit, then roll it back"""
+    connection = open_connection()
+    try:
+        problems = check_store(store, connection.cursor())
+    finally:
+        connection.rollback()
+        connection.close()
+
+    if not problems:
+        click.echo("Ledger store checks passed.")
+    else:
+        for problem in problems:
+            click.echo(f"  {problem}")
+        click.echo(f"{len(problems)} problem(s) found.")
+        raise SystemExit(1)
+
+@app.cli.command('refresh-snapshot')
+def refresh_snapshot_command():
+    """Copy the database to the reporting snapshot now (for cron)"""
+    with file_lock(REPORT_SNAPSHOT_FILE + '.lock'):
+        seconds = refresh_snapshot()
+    click.echo(f"Snapshot written to {REPORT_SNAPSHOT_FILE} in {seconds:.2f}s.")
+
+@app.cli.command('backup')
+@click.option('--list', 'list_only', is_flag=True, help='List the backups instead of taking one.')
+def backup_command(list_only):
+    """Back up the database into BACKUP_DIR and prune old backups"""
+    if list_only:
+        for taken_at, path in list_backups():
+            click.echo(f"  {taken_at:%Y-%m-%d %H:%M:%S}  {os.path.getsize(path):>12,}  {path}")
+        return
+    
+    started = time.perf_counter()
+    with file_lock(DB_FILE + '.backup.lock'):
+        path = create_backup()
+        deleted = prune_backups()
+    click.echo(f"Backed up to {path} ({os.path.getsize(path):,} bytes) in {time.perf_counter() - started:.1f}s.")
+    if deleted:
+        click.echo(f"Deleted {len(deleted)} old backup(s).")
+
+@app.cli.command('restore')
+@click.argument('backup_file', required=False)
+@click.option('--at', 'at', type=click.DateTime(), default=None,
+              help='Restore the newest backup taken at or before this time.')
+@click.option('--check', is_flag=True, help='Only verify the backup; do not restore it.')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+def restore_command(backup_file, at, check, yes):
+    """Verify a backup and restore it over the database (default: the newest)"""
+    path = backup_file or find_backup(at)
+    if path is None:
+        raise click.ClickException(f"No backup found in {BACKUP_DIR}.")
+    
+    try:
+        if check:
+            os.remove(verify_backup(path))
+            click.echo(f"{path} is intact.")
+            return
+        if not yes:
+            click.confirm(f"Replace {DB_FILE} with {path}? Stop the app first.", abort=True)
+        previous = restore_backup(path)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Restored {path}. The replaced database was saved as {previous}.")
+
+@app.cli.command('import-ledger')
+@click.argument('import_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'import_format', type=click.Choice(IMPORT_FORMATS), default=None,
+              help='File format (default: from the file name, else csv).')
+@click.option('--rejects', 'rejects_file', type=click.Path(dir_okay=False), default=None,
+              help='Also write every rejected record here, as JSON lines.')
+@click.option('--batch-rows', type=int, default=IMPORT_BATCH_ROWS, show_default=True,
+              help='Item rows inserted per batch.')
+def import_ledger_command(import_file, import_format, rejects_file, batch_rows):
+    """Import credits from a CSV or JSONL file in one transaction"""
+    import_format = import_format or import_format_for(import_file)
+    rejects_out = open(rejects_file, 'w', encoding='utf-8') if rejects_file else None
+    
+    def on_reject(line, error, rows):
+        if rejects_out:
+            rejects_out.write(json.dumps({'line': line, 'error': error, 'rows': rows}, ensure_ascii=False) + "\n")
+    
+    started = time.perf_counter()
+    connection = open_connection()
+    try:
+        with open(import_file, encoding='utf-8-sig', newline='') as stream:
+            records = iter_import_records(stream, import_format)
+            for event, stats in import_ledger(connection, records, max(1, batch_rows), on_reject):
+                if event == 'progress':
+                    click.echo(f"  {stats['lines']:>10,} lines  {stats['items']:>10,} items  "
+                               f"{stats['rejected']:>8,} rejected  {time.perf_counter() - started:7.1f}s")
+    except UnicodeDecodeError:
+        raise click.ClickException(f"{import_file} is not UTF-8 text.")
+    finally:
+        connection.close()
+        if rejects_out:
+            rejects_out.close()
+    
+    click.echo(f"Imported {stats['credits']:,} credits with {stats['items']:,} items and "
+               f"{stats['payments']:,} payments ({stats['settled']:,} paid in full) "
+               f"in {time.perf_counter() - started:.1f}s.")
+    if stats['rejected']:
+        for reject in stats['rejects']:
+            click.echo(f"  line {reject['line']}: {reject['error']}")
+        more = stats['rejected'] - len(stats['rejects'])
+        click.echo(f"{stats['rejected']:,} record(s) rejected" + (f", {more:,} not shown" if more else "")
+                   + (f"; all are in {rejects_file}." if rejects_file else "."))
+
+@app.cli.command('sms-remind')
+def sms_remind_command():
+    """Queue today's due-date reminders without sending them"""
+    connection = open_connection()
+    queued = enqueue_reminders(connection.cursor(), date.today())
+    connection.commit()
+    connection.close()
+    click.echo(f"{queued} reminder(s) queued.")
+
+@app.cli.command('sms-worker')
+@click.option('--once', is_flag=True, help='Send what is due and exit (for cron) instead of polling.')
+@click.option('--provider', type=click.Choice(sorted(SMS_PROVIDERS)), default=None,
+              help='Override SMS_PROVIDER.')
+def sms_worker_command(once, provider):
+    """Send queued SMS jobs, queueing each day's reminders"""
+    dispatcher = SMSDispatcher(get_sms_provider(provider))
+    if once:
+        click.echo(f"{dispatcher.run_once()} message(s) sent.")
+        return
+    
+    click.echo(f"SMS worker started ({provider or SMS_PROVIDER}, {SMS_RATE_PER_MINUTE}/min).")
+    try:
+        dispatcher.run_forever(sms_worker['stop'])
+    except KeyboardInterrupt:
+        sms_worker['stop'].set()
 
 if __name__ == '__main__':
     # Initialize database on startup
     init_db()
+    start_sms_worker()
+    start_backup_worker()
     print("=" * 50)
     print("🚀 Utang Record System")
     print("=" * 50)
@@ -0,0 +1,404 @@
+"""ASGI entry point for app_sqlite, for one process serving many clients.
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT --timeout-graceful-shutdown 5
+
+Every route is still the Flask app in app_sqlite.py, served through
+asgiref's WsgiToAsgi on a bounded pool of ASGI_THREADS threads, so a slow
+export or SMS send occupies one thread instead of a whole gunicorn worker.
+Requests beyond ASGI_MAX_PENDING get a 503 instead of queueing without
+limit. Only the two endpoints below are handled on the event loop.
+
+GET /api/changes also accepts ?wait=<seconds> here. When nothing changed
+since `since`, the request is parked on the event loop, without a thread,
+until the ledger changes or the wait runs out, and is then answered by
+the Flask route as usual. A single LedgerWatcher per process polls the
+ledger version, so hundreds of waiting phones cost one PRAGMA per interval,
+and the phones woken by one change, asking the same question, share one
+answer instead of all queueing for the thread pool at once.
+
+GET /api/events stays open here: each batch of ledger events is sent as
+soon as the watcher sees it committed, read once per process for all the
+pages listening from the same point.
+"""
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from itsdangerous import BadSignature
+
+import app_sqlite
+
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', '16'))
+ASGI_MAX_PENDING = int(os.getenv('ASGI_MAX_PENDING', '256'))
+ASGI_MAX_WAIT = float(os.getenv('ASGI_MAX_WAIT', '30'))
+ASGI_WATCH_INTERVAL = float(os.getenv('ASGI_WATCH_INTERVAL', '0.25'))
+ASGI_MAX_WAITERS = int(os.getenv('ASGI_MAX_WAITERS', '2000'))
+
+# A comment line is sent on quiet event streams this often, so proxies
+# and phones do not drop them as idle
+LIVE_PING_SECONDS = 15
+
+
+class PooledWsgiInstance(WsgiToAsgiInstance):
+    """asgiref's adapter for one request, run on our thread pool.
+
+    WsgiToAsgi runs every request on one shared thread unless told
+    otherwise, which would queue a quick page behind a slow export.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        run = sync_to_async(WsgiToAsgiInstance.run_wsgi_app.__wrapped__, thread_sensitive=False,
+                            executor=self.executor)
+        await run(self, body)
+
+
+class FlaskRoutes:
+    """The Flask app as an ASGI app, with at most `max_pending` requests running or queued"""
+
+    def __init__(self, wsgi_app, threads, max_pending):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='wsgi')
+        self.max_pending = max_pending
+        self.pending = 0
+
+    async def __call__(self, scope, receive, send):
+        if self.pending >= self.max_pending:
+            await send_text(send, 503, b'Server busy, try again\n', [(b'retry-after', b'1')])
+            return
+        self.pending += 1
+        try:
+            await PooledWsgiInstance(self.wsgi_app, self.executor)(scope, receive, send)
+        finally:
+            self.pending -= 1
+
+
+async def skip_body(receive):
+    """Read and drop a GET's request body; False if the client went away first"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return False
+        if not message.get('more_body'):
+            return True
+
+
+def body_skipped(receive):
+    """`receive` for a request whose body skip_body() has read: an empty body, then the client's messages"""
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        return await receive()
+
+    return replay
+
+
+async def send_text(send, status, text, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8'), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': text})
+
+
+class LedgerWatcher:
+    """Polls ledger_summary.version and wakes the requests waiting for a change.
+
+    It reads on a thread of its own, so it keeps up while every request
+    thread is busy.
+    """
+
+    def __init__(self, interval):
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='ledger-watcher')
+        self.interval = interval
+        self.version = None
+        self.connection = None
+        self._changed = asyncio.Event()
+        self._task = None
+
+    def read_version(self):
+        if self.connection is None:
+            self.connection = app_sqlite.open_connection()
+        return app_sqlite.get_ledger_version(self.connection)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                version = await loop.run_in_executor(self.executor, self.read_version)
+            except Exception:
+                app_sqlite.app.logger.exception("Ledger watcher error")
+            else:
+                if version != self.version:
+                    self.version = version
+                    changed, self._changed = self._changed, asyncio.Event()
+                    changed.set()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def wait_for_change(self, since, timeout):
+        """Return once the ledger version passes `since`, or after `timeout` seconds"""
+        deadline = asyncio.get_running_loop().time() + timeout
+        while self.version is None or self.version <= since:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
+
+
+def read_live_events(after_id):
+    """Run app_sqlite.live_event_stream() on a pooled connection, from a worker thread"""
+    connection = app_sqlite.db_pool.acquire()
+    try:
+        with app_sqlite.app.app_context():
+            cursor = connection.cursor()
+            cursor.execute("BEGIN")
+            if after_id is None:
+                return None, app_sqlite.fetch_live_position(cursor), False
+            return app_sqlite.live_event_stream(cursor, after_id)
+    finally:
+        app_sqlite.db_pool.release(connection)
+
+
+def logged_in(scope):
+    """Whether the request carries a valid session cookie for a logged-in user"""
+    flask_app = app_sqlite.app
+    cookies = SimpleCookie()
+    for name, value in scope['headers']:
+        if name == b'cookie':
+            cookies.load(value.decode('latin1'))
+    morsel = cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if morsel is None or serializer is None:
+        return False
+    try:
+        session = serializer.loads(morsel.value,
+                                   max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return False
+    return bool(session.get('logged_in'))
+
+
+class App:
+    """The ASGI application: long polls for /api/changes, Flask for the rest"""
+
+    def __init__(self):
+        self.flask = FlaskRoutes(app_sqlite.app, ASGI_THREADS, ASGI_MAX_PENDING)
+        self.watcher = None
+        self.waiters = 0
+        # (query string, ledger version) -> future of the recorded response
+        self.shared = {}
+        # (event id, ledger version) -> future of read_live_events()
+        self.event_reads = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] != 'http':
+            return
+        elif scope['method'] == 'GET' and scope['path'] == '/api/changes':
+            await self.changes(scope, receive, send)
+        elif scope['method'] == 'GET' and scope['path'] == '/api/events':
+            await self.events(scope, receive, send)
+        else:
+            await self.flask(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start_watcher()
+                app_sqlite.start_sms_worker()
+                app_sqlite.start_backup_worker()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.watcher:
+                    self.watcher.stop()
+                self.flask.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def start_watcher(self):
+        if self.watcher is None:
+            self.watcher = LedgerWatcher(ASGI_WATCH_INTERVAL)
+            self.watcher.start()
+
+    async def changes(self, scope, receive, send):
+        """GET /api/changes, holding the request while nothing has changed when ?wait= is given"""
+        query = parse_qs(scope['query_string'].decode('latin1'))
+        try:
+            wait = min(float(query.get('wait', ['0'])[0]), ASGI_MAX_WAIT)
+            since = int(query.get('since', ['0'])[0])
+            after_id = int(query.get('after_id', ['0'])[0])
+        except ValueError:
+            wait = since = after_id = 0
+        # Continuation pages (after_id) have changes waiting by definition
+        if wait <= 0 or after_id or not logged_in(scope):
+            await self.flask(scope, receive, send)
+            return
+        if not await skip_body(receive):
+            return
+        if self.waiters >= ASGI_MAX_WAITERS:
+            await send_text(send, 503, b'Too many waiting clients\n', [(b'retry-after', b'5')])
+            return
+
+        self.start_watcher()  # servers without lifespan support
+        self.waiters += 1
+        try:
+            waiting = asyncio.create_task(self.watcher.wait_for_change(since, wait))
+            disconnected = asyncio.create_task(receive())
+            await asyncio.wait([waiting, disconnected], return_when=asyncio.FIRST_COMPLETED)
+            waiting.cancel()
+        finally:
+            self.waiters -= 1
+        if disconnected.done():
+            return
+        disconnected.cancel()
+        await self.shared_response((scope['query_string'], self.watcher.version), scope, body_skipped(receive), send)
+
+    async def shared_response(self, key, scope, receive, send):
+        """Answer from Flask once per key, replaying that response to the others.
+
+        Only logged-in long polls come here, and their answer depends on
+        nothing but the query and the ledger version.
+        """
+        future = self.shared.get(key)
+        if future is not None:
+            try:
+                messages = await asyncio.shield(future)
+            except Exception:
+                messages = None
+            if messages is not None:
+                for message in messages:
+                    await send(message)
+                return
+            await self.flask(scope, receive, send)  # the first request failed; ask Flask ourselves
+            return
+
+        # Answers for older versions are never asked for again
+        for stale in [k for k in self.shared if k[1] != key[1]]:
+            del self.shared[stale]
+        future = self.shared[key] = asyncio.get_running_loop().create_future()
+        messages = []
+
+        async def record(message):
+            messages.append(message)
+            await send(message)
+
+        try:
+            await self.flask(scope, receive, record)
+        except BaseException:
+            self.shared.pop(key, None)
+            future.set_result(None)
+            raise
+        complete = messages and messages[0]['status'] == 200 and not messages[-1].get('more_body')
+        if not complete:
+            self.shared.pop(key, None)
+        future.set_result(messages if complete else None)
+
+    async def events(self, scope, receive, send):
+        """GET /api/events as one open stream of Server-Sent Events"""
+        if not logged_in(scope):
+            await self.flask(scope, receive, send)  # the usual 401
+            return
+        if not await skip_body(receive):
+            return
+        if self.waiters >= ASGI_MAX_WAITERS:
+            await send_text(send, 503, b'Too many waiting clients\n', [(b'retry-after', b'5')])
+            return
+
+        after_id = None
+        for name, value in scope['headers']:
+            if name == b'last-event-id' and value.strip().isdigit():
+                after_id = int(value)
+        if after_id is None:
+            after = parse_qs(scope['query_string'].decode('latin1')).get('after', [''])[0]
+            after_id = int(after) if after.isdigit() else None
+
+        self.start_watcher()
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+                        (b'x-accel-buffering', b'no')],
+        })
+        await send({'type': 'http.response.body', 'more_body': True,
+                    'body': f"retry: {app_sqlite.LIVE_RETRY_SECONDS * 1000}\n\n".encode()})
+
+        self.waiters += 1
+        disconnected = asyncio.create_task(receive())
+        try:
+            seen = None
+            while True:
+                version = self.watcher.version
+                if version is None or version != seen:
+                    try:
+                        text, after_id, has_more = await self.read_events(after_id, version)
+                    except Exception:
+                        app_sqlite.app.logger.exception("Database error")
+                        break  # the browser reconnects and resumes
+                    if text:
+                        await send({'type': 'http.response.body', 'body': text.encode(), 'more_body': True})
+                    if has_more:
+                        continue
+                    seen = version
+                else:
+                    await send({'type': 'http.response.body', 'body': b': ping\n\n', 'more_body': True})
+                waiting = asyncio.create_task(self.watcher.wait_for_change(-1 if seen is None else seen,
+                                                                           LIVE_PING_SECONDS))
+                await asyncio.wait([waiting, disconnected], return_when=asyncio.FIRST_COMPLETED)
+                waiting.cancel()
+                if disconnected.done():
+                    return
+            await send({'type': 'http.response.body', 'body': b''})
+        except asyncio.CancelledError:
+            # Streams never end on their own, so a server shutting down
+            # cancels them (--timeout-graceful-shutdown); end this one cleanly
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            self.waiters -= 1
+            disconnected.cancel()
+
+    async def read_events(self, after_id, version):
+        """read_live_events(), run once per event id and ledger version for every stream"""
+        key = (after_id, version)
+        future = self.event_reads.get(key)
+        if future is None:
+            # Positions at older versions are never asked for again
+            for stale in [k for k in self.event_reads if k[1] != version]:
+                del self.event_reads[stale]
+            loop = asyncio.get_running_loop()
+            future = asyncio.ensure_future(loop.run_in_executor(self.flask.executor, read_live_events, after_id))
+            self.event_reads[key] = future
+            future.add_done_callback(
+                lambda done: (done.cancelled() or done.exception()) and self.event_reads.pop(key, None))
+        text, last_id, has_more = await asyncio.shield(future)
+        if text is None:
+            # Starting from now: an id-only message sets where to resume
+            text = app_sqlite.format_sse(None, event_id=last_id)
+        return text, last_id, has_more
+
+
+app = App()
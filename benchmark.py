@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+"""Measure route latency, query counts and memory against a ledger.
+
+    python generate_ledger.py --items 100k --db-path /tmp/bench
+    python benchmark.py --db-path /tmp/bench --output bench-100k.json
+    python benchmark.py --db-path /tmp/bench --compare bench-100k.json
+
+The database is copied first, so delete_credit never touches the
+original. Each route is timed through the Flask test client for
+--iterations requests after --warmup untimed ones; a separate pass under
+tracemalloc records the peak Python memory of a single request.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-pct * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def copy_database(source_dir):
+    """Copy store_credit.db into a fresh directory with the SQLite backup API"""
+    target_dir = tempfile.mkdtemp(prefix='utang-bench-')
+    source = sqlite3.connect(os.path.join(source_dir, 'store_credit.db'))
+    target = sqlite3.connect(os.path.join(target_dir, 'store_credit.db'))
+    source.backup(target)
+    source.close()
+    target.close()
+    return target_dir
+
+
+class CountingCursor:
+    """Cursor wrapper that counts execute() and executemany() calls"""
+
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def execute(self, *args):
+        self._counter.count += 1
+        return self._cursor.execute(*args)
+
+    def executemany(self, *args):
+        self._counter.count += 1
+        return self._cursor.executemany(*args)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class CountingConnection:
+    """Connection wrapper whose cursors count the statements the app runs.
+
+    A trace callback would also see the statements run by triggers and by
+    FTS5 internally, which are not the app's queries.
+    """
+
+    def __init__(self, connection, counter):
+        self._connection = connection
+        self._counter = counter
+
+    def cursor(self):
+        return CountingCursor(self._connection.cursor(), self._counter)
+
+    def execute(self, *args):
+        self._counter.count += 1
+        return self._connection.execute(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class QueryCounter:
+    """Counts the statements run on every connection the app opens"""
+
+    def __init__(self, app_module):
+        self.count = 0
+        open_connection = app_module.open_connection
+        app_module.open_connection = lambda: CountingConnection(open_connection(), self)
+        app_module.db_pool.close_all()
+
+
+def build_routes(cursor, rng):
+    """(name, method, path factory) for every route measured"""
+    cursor.execute("SELECT id FROM credits ORDER BY id")
+    credit_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT customer_name FROM credits ORDER BY RANDOM() LIMIT 50")
+    names = [row[0] for row in cursor.fetchall()]
+    deletable = rng.sample(credit_ids, len(credit_ids))
+
+    return [
+        ('index', 'GET', lambda: '/'),
+        ('index_overdue', 'GET', lambda: '/?filter=overdue'),
+        ('search', 'GET', lambda: '/search?q=' + rng.choice(names).split()[0]),
+        ('search_prefix', 'GET', lambda: '/search?q=' + rng.choice(names)[:3]),
+        ('view_items', 'GET', lambda: f'/view_items/{rng.choice(credit_ids)}'),
+        ('api_credits', 'GET', lambda: '/api/credits'),
+        ('customers', 'GET', lambda: '/customers'),
+        ('export_credits', 'GET', lambda: '/export_credits'),
+        ('export_csv', 'GET', lambda: '/export_credits?format=csv'),
+        ('delete_credit', 'POST', lambda: f'/delete_credit/{deletable.pop()}'),
+    ]
+
+
+def request_once(client, method, path):
+    response = client.open(path, method=method)
+    size = len(response.get_data())  # drains streamed exports
+    response.close()
+    if response.status_code >= 400:
+        raise RuntimeError(f"{method} {path} returned {response.status_code}")
+    return size
+
+
+def measure(client, counter, method, make_path, iterations, warmup):
+    for _ in range(warmup):
+        request_once(client, method, make_path())
+
+    timings, queries, sizes = [], [], []
+    for _ in range(iterations):
+        path = make_path()
+        before = counter.count
+        started = time.perf_counter()
+        sizes.append(request_once(client, method, path))
+        timings.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count - before)
+
+    tracemalloc.start()
+    request_once(client, method, make_path())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    result = {f'p{pct}_ms': round(percentile(timings, pct), 3) for pct in PERCENTILES}
+    result.update({
+        'min_ms': round(timings[0], 3),
+        'max_ms': round(timings[-1], 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries': round(sum(queries) / len(queries), 2),
+        'max_queries': max(queries),
+        'response_bytes': round(sum(sizes) / len(sizes)),
+        'peak_memory_kb': round(peak / 1024, 1),
+    })
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print the change against an earlier run; returns the regressed routes"""
+    regressions = []
+    print(f"\n{'route':<16}{'p50 ms':>18}{'p95 ms':>18}{'queries':>14}")
+    for name, now in results['routes'].items():
+        before = baseline.get('routes', {}).get(name)
+        if before is None:
+            print(f"{name:<16}{'(new)':>18}")
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms'):
+            change = (now[key] - before[key]) / before[key] * 100 if before[key] else 0
+            cells.append(f"{before[key]:.1f}->{now[key]:.1f} {change:+.0f}%")
+            if key == 'p95_ms' and change > threshold:
+                regressions.append(name)
+        print(f"{name:<16}{cells[0]:>18}{cells[1]:>18}{before['queries']:>7}->{now['queries']:<6}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db-path', default=os.environ.get('DB_PATH', '.'),
+                        help='Directory holding the store_credit.db to benchmark')
+    parser.add_argument('--iterations', type=int, default=50, help='Timed requests per route')
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per route first')
+    parser.add_argument('--routes', help='Comma-separated subset of routes to run')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=20.0,
+                        help='p95 slowdown in percent that counts as a regression (default 20)')
+    args = parser.parse_args(argv)
+
+    os.environ['DB_PATH'] = copy_database(args.db_path)
+    import app_sqlite
+
+    counter = QueryCounter(app_sqlite)
+    client = app_sqlite.app.test_client()
+    with client.session_transaction() as session:
+        session['logged_in'] = True
+
+    connection = app_sqlite.open_connection()
+    cursor = connection.cursor()
+    cursor.execute("SELECT (SELECT COUNT(*) FROM credits), (SELECT COUNT(*) FROM credit_items)")
+    credits, items = cursor.fetchone()
+    rng = random.Random(args.seed)
+    routes = build_routes(cursor, rng)
+    connection.close()
+    if args.routes:
+        wanted = set(args.routes.split(','))
+        routes = [route for route in routes if route[0] in wanted]
+
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'run_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'credits': credits,
+            'items': items,
+            'iterations': args.iterations,
+        },
+        'routes': {},
+    }
+    print(f"{credits:,} credits, {items:,} items; {args.iterations} requests per route")
+    print(f"{'route':<16}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}{'peak KB':>10}")
+    for name, method, make_path in routes:
+        result = measure(client, counter, method, make_path, args.iterations, args.warmup)
+        results['routes'][name] = result
+        print(f"{name:<16}{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+              f"{result['queries']:>9}{result['peak_memory_kb']:>10,.0f}")
+
+    # ru_maxrss is KB on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results['meta']['max_rss_kb'] = max_rss // 1024 if sys.platform == 'darwin' else max_rss
+    print(f"Peak RSS: {results['meta']['max_rss_kb']:,} KB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\np95 regressed more than {args.threshold:.0f}%: {', '.join(regressions)}")
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
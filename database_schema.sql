@@ -1,20 +1,261 @@
+-- MySQL schema for app.py (MySQL 8.0.16 or later).
+-- The tables are the same as in the SQLite database of app_sqlite.py, so
+-- both apps run the queries in ledger_store.py.
+--
+--   mysql -u root -p < database_schema.sql
+
 -- Create database
-CREATE DATABASE IF NOT EXISTS store_credit_system;
+CREATE DATABASE IF NOT EXISTS store_credit_system
+    CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
 USE store_credit_system;
 
--- Create credits table
+-- One credit per customer visit; its products are in credit_items
 CREATE TABLE IF NOT EXISTS credits (
     id INT AUTO_INCREMENT PRIMARY KEY,
     customer_name VARCHAR(255) NOT NULL,
+    phone_number VARCHAR(32) NULL,
+    estimated_payment_date DATE NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    status ENUM('pending', 'paid') NOT NULL DEFAULT 'pending',
+    paid_date TIMESTAMP NULL,
+    INDEX idx_credits_created (created_at, id),
+    INDEX idx_customer_name (customer_name),
+    INDEX idx_status (status),
+    INDEX idx_payment_date (estimated_payment_date)
+);
+
+CREATE TABLE IF NOT EXISTS credit_items (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    credit_id INT NOT NULL,
     product VARCHAR(255) NOT NULL,
     cost DECIMAL(10, 2) NOT NULL,
-    estimated_payment_date DATE NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    status ENUM('pending', 'paid') DEFAULT 'pending',
-    paid_date TIMESTAMP NULL
+    quantity INT NOT NULL DEFAULT 1,
+    unit_price DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    added_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    status ENUM('pending', 'paid') NOT NULL DEFAULT 'pending',
+    paid_date TIMESTAMP NULL,
+    INDEX idx_items_credit_added (credit_id, added_at),
+    FOREIGN KEY (credit_id) REFERENCES credits(id) ON DELETE CASCADE
+);
+
+-- No foreign key: the payment history outlives a deleted credit
+CREATE TABLE IF NOT EXISTS payments (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    credit_id INT NOT NULL,
+    item_id INT NULL,
+    amount DECIMAL(10, 2) NOT NULL CHECK (amount > 0),
+    paid_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_payments_credit (credit_id, amount),
+    INDEX idx_payments_paid_at (paid_at, amount)
+);
+
+-- Running totals, kept by the triggers below
+CREATE TABLE IF NOT EXISTS credit_totals (
+    credit_id INT PRIMARY KEY,
+    total_cost DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    item_count INT NOT NULL DEFAULT 0,
+    paid_amount DECIMAL(12, 2) NOT NULL DEFAULT 0,
+    version BIGINT NOT NULL DEFAULT 0,
+    INDEX idx_credit_totals_version (version, credit_id)
 );
 
--- Create index for better performance
-CREATE INDEX idx_customer_name ON credits(customer_name);
-CREATE INDEX idx_status ON credits(status);
-CREATE INDEX idx_payment_date ON credits(estimated_payment_date);
+CREATE TABLE IF NOT EXISTS ledger_summary (
+    id INT PRIMARY KEY CHECK (id = 1),
+    pending_total DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    paid_total DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    total_cost DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    item_count INT NOT NULL DEFAULT 0,
+    pending_credits INT NOT NULL DEFAULT 0,
+    paid_credits INT NOT NULL DEFAULT 0,
+    total_credits INT NOT NULL DEFAULT 0,
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT IGNORE INTO ledger_summary (id) VALUES (1);
+
+CREATE TABLE IF NOT EXISTS deleted_credits (
+    credit_id INT PRIMARY KEY,
+    version BIGINT NOT NULL,
+    INDEX idx_deleted_credits_version (version)
+);
+
+-- Triggers that keep credit_totals and ledger_summary in step with credits,
+-- credit_items and payments - the same as TOTALS_TRIGGERS in app_sqlite.py.
+-- Every change bumps ledger_summary.version and stamps the credit's
+-- credit_totals.version with it. MySQL does not run triggers for rows
+-- removed by ON DELETE CASCADE; trg_credits_delete subtracts the credit's
+-- whole total instead, as on SQLite.
+DROP TRIGGER IF EXISTS trg_credits_insert;
+DROP TRIGGER IF EXISTS trg_credits_update;
+DROP TRIGGER IF EXISTS trg_credits_delete;
+DROP TRIGGER IF EXISTS trg_items_insert;
+DROP TRIGGER IF EXISTS trg_items_update;
+DROP TRIGGER IF EXISTS trg_items_delete;
+DROP TRIGGER IF EXISTS trg_payments_insert;
+DROP TRIGGER IF EXISTS trg_payments_no_update;
+DROP TRIGGER IF EXISTS trg_payments_no_delete;
+
+DELIMITER //
+
+CREATE TRIGGER trg_credits_insert AFTER INSERT ON credits
+FOR EACH ROW
+BEGIN
+    UPDATE ledger_summary SET
+        version = version + 1,
+        total_credits = total_credits + 1,
+        pending_credits = pending_credits + (NEW.status = 'pending'),
+        paid_credits = paid_credits + (NEW.status = 'paid')
+    WHERE id = 1;
+    INSERT IGNORE INTO credit_totals (credit_id, version)
+    SELECT NEW.id, version FROM ledger_summary WHERE id = 1;
+END//
+
+CREATE TRIGGER trg_credits_update AFTER UPDATE ON credits
+FOR EACH ROW
+BEGIN
+    UPDATE ledger_summary SET
+        version = version + 1,
+        pending_credits = pending_credits - (OLD.status = 'pending') + (NEW.status = 'pending'),
+        paid_credits = paid_credits - (OLD.status = 'paid') + (NEW.status = 'paid')
+    WHERE id = 1;
+    UPDATE credit_totals SET version = (SELECT version FROM ledger_summary WHERE id = 1)
+    WHERE credit_id = NEW.id;
+END//
+
+CREATE TRIGGER trg_credits_delete AFTER DELETE ON credits
+FOR EACH ROW
+BEGIN
+    UPDATE ledger_summary SET
+        version = version + 1,
+        total_credits = total_credits - 1,
+        pending_credits = pending_credits - (OLD.status = 'pending'),
+        paid_credits = paid_credits - (OLD.status = 'paid'),
+        item_count = item_count - COALESCE((SELECT item_count FROM credit_totals WHERE credit_id = OLD.id), 0),
+        total_cost = total_cost - COALESCE((SELECT total_cost FROM credit_totals WHERE credit_id = OLD.id), 0),
+        paid_total = paid_total - COALESCE((SELECT paid_amount FROM credit_totals WHERE credit_id = OLD.id), 0),
+        pending_total = pending_total - COALESCE((SELECT total_cost - paid_amount FROM credit_totals WHERE credit_id = OLD.id), 0)
+    WHERE id = 1;
+    DELETE FROM credit_totals WHERE credit_id = OLD.id;
+    REPLACE INTO deleted_credits (credit_id, version)
+    SELECT OLD.id, version FROM ledger_summary WHERE id = 1;
+END//
+
+CREATE TRIGGER trg_items_insert AFTER INSERT ON credit_items
+FOR EACH ROW
+BEGIN
+    UPDATE ledger_summary SET
+        version = version + 1,
+        item_count = item_count + 1,
+        total_cost = total_cost + NEW.cost,
+        pending_total = pending_total + NEW.cost
+    WHERE id = 1 AND EXISTS (SELECT 1 FROM credit_totals WHERE credit_id = NEW.credit_id);
+    UPDATE credit_totals SET
+        total_cost = total_cost + NEW.cost,
+        item_count = item_count + 1,
+        version = (SELECT version FROM ledger_summary WHERE id = 1)
+    WHERE credit_id = NEW.credit_id;
+END//
+
+-- Paying an item only changes its status, which leaves the totals alone
+CREATE TRIGGER trg_items_update AFTER UPDATE ON credit_items
+FOR EACH ROW
+BEGIN
+    IF OLD.cost <> NEW.cost OR OLD.credit_id <> NEW.credit_id THEN
+        UPDATE ledger_summary SET
+            version = version + 1,
+            item_count = item_count - 1,
+            total_cost = total_cost - OLD.cost,
+            pending_total = pending_total - OLD.cost
+        WHERE id = 1 AND EXISTS (SELECT 1 FROM credit_totals WHERE credit_id = OLD.credit_id);
+        UPDATE credit_totals SET
+            total_cost = total_cost - OLD.cost,
+            item_count = item_count - 1,
+            version = (SELECT version FROM ledger_summary WHERE id = 1)
+        WHERE credit_id = OLD.credit_id;
+        UPDATE ledger_summary SET
+            version = version + 1,
+            item_count = item_count + 1,
+            total_cost = total_cost + NEW.cost,
+            pending_total = pending_total + NEW.cost
+        WHERE id = 1 AND EXISTS (SELECT 1 FROM credit_totals WHERE credit_id = NEW.credit_id);
+        UPDATE credit_totals SET
+            total_cost = total_cost + NEW.cost,
+            item_count = item_count + 1,
+            version = (SELECT version FROM ledger_summary WHERE id = 1)
+        WHERE credit_id = NEW.credit_id;
+    END IF;
+END//
+
+CREATE TRIGGER trg_items_delete AFTER DELETE ON credit_items
+FOR EACH ROW
+BEGIN
+    UPDATE ledger_summary SET
+        version = version + 1,
+        item_count = item_count - 1,
+        total_cost = total_cost - OLD.cost,
+        pending_total = pending_total - OLD.cost
+    WHERE id = 1 AND EXISTS (SELECT 1 FROM credit_totals WHERE credit_id = OLD.credit_id)
+      AND EXISTS (SELECT 1 FROM credits WHERE id = OLD.credit_id);
+    UPDATE credit_totals SET
+        total_cost = total_cost - OLD.cost,
+        item_count = item_count - 1,
+        version = (SELECT version FROM ledger_summary WHERE id = 1)
+    WHERE credit_id = OLD.credit_id AND EXISTS (SELECT 1 FROM credits WHERE id = OLD.credit_id);
+END//
+
+CREATE TRIGGER trg_payments_insert AFTER INSERT ON payments
+FOR EACH ROW
+BEGIN
+    UPDATE ledger_summary SET
+        version = version + 1,
+        paid_total = paid_total + NEW.amount,
+        pending_total = pending_total - NEW.amount
+    WHERE id = 1 AND EXISTS (SELECT 1 FROM credit_totals WHERE credit_id = NEW.credit_id);
+    UPDATE credit_totals SET
+        paid_amount = paid_amount + NEW.amount,
+        version = (SELECT version FROM ledger_summary WHERE id = 1)
+    WHERE credit_id = NEW.credit_id;
+END//
+
+CREATE TRIGGER trg_payments_no_update BEFORE UPDATE ON payments
+FOR EACH ROW
+BEGIN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'payments are append-only';
+END//
+
+CREATE TRIGGER trg_payments_no_delete BEFORE DELETE ON payments
+FOR EACH ROW
+BEGIN
+    SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'payments are append-only';
+END//
+
+DELIMITER ;
+
+-- Upgrading a database made by the old single-table schema (credits with
+-- product and cost columns): run this file, then move each credit's product
+-- into credit_items and rebuild the running totals:
+--
+--   ALTER TABLE credits ADD COLUMN phone_number VARCHAR(32) NULL AFTER customer_name;
+--   INSERT INTO credit_items (credit_id, product, cost, unit_price, added_at, status, paid_date)
+--   SELECT id, product, cost, cost, created_at, status, paid_date FROM credits;
+--   INSERT INTO payments (credit_id, amount, paid_at)
+--   SELECT id, cost, COALESCE(paid_date, created_at) FROM credits WHERE status = 'paid' AND cost > 0;
+--   ALTER TABLE credits DROP COLUMN product, DROP COLUMN cost;
+--   ALTER TABLE credits ADD INDEX idx_credits_created (created_at, id);
+--   DELETE FROM credit_totals;
+--   INSERT INTO credit_totals (credit_id, total_cost, item_count, paid_amount, version)
+--   SELECT c.id,
+--          (SELECT COALESCE(SUM(cost), 0) FROM credit_items WHERE credit_id = c.id),
+--          (SELECT COUNT(*) FROM credit_items WHERE credit_id = c.id),
+--          (SELECT COALESCE(SUM(amount), 0) FROM payments WHERE credit_id = c.id),
+--          1
+--   FROM credits c;
+--   UPDATE ledger_summary SET
+--       total_cost = (SELECT COALESCE(SUM(total_cost), 0) FROM credit_totals),
+--       paid_total = (SELECT COALESCE(SUM(paid_amount), 0) FROM credit_totals),
+--       pending_total = total_cost - paid_total,
+--       item_count = (SELECT COALESCE(SUM(item_count), 0) FROM credit_totals),
+--       total_credits = (SELECT COUNT(*) FROM credits),
+--       pending_credits = (SELECT COUNT(*) FROM credits WHERE status = 'pending'),
+--       paid_credits = (SELECT COUNT(*) FROM credits WHERE status = 'paid'),
+--       version = version + 1
+--   WHERE id = 1;
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""Fill store_credit.db with a synthetic ledger for benchmarking.
+
+    python generate_ledger.py --items 100k --db-path /tmp/bench
+
+Credits get 1-12 items each, dates spread over the past --days days and
+a mix of paid, partly paid and pending balances. Rows go through the
+normal tables, so the running totals, aging index, rollups and search
+index are maintained by their triggers exactly as in production.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+FIRST_NAMES = [
+    'Juan', 'Maria', 'Jose', 'Ana', 'Pedro', 'Rosa', 'Carlos', 'Elena', 'Ramon', 'Luz',
+    'Antonio', 'Teresa', 'Manuel', 'Carmen', 'Ricardo', 'Gloria', 'Fernando', 'Lourdes',
+    'Eduardo', 'Cristina', 'Roberto', 'Josefina', 'Danilo', 'Marites', 'Rodel', 'Jocelyn',
+]
+LAST_NAMES = [
+    'Dela Cruz', 'Santos', 'Reyes', 'Garcia', 'Mendoza', 'Bautista', 'Villanueva', 'Ramos',
+    'Aquino', 'Castillo', 'Rivera', 'Flores', 'Torres', 'Gonzales', 'Lopez', 'Navarro',
+    'Obando', 'Bañez', 'Nuñez', 'Peñafiel', 'Llorin', 'Bicol', 'Mabini', 'Sarmiento',
+]
+# (product, lowest and highest unit price)
+PRODUCTS = [
+    ('Bugas (1 kilo)', 48, 62), ('Sardinas', 22, 28), ('Corned Beef', 35, 55),
+    ('Kape 3-in-1', 8, 12), ('Asukar (1/4 kilo)', 18, 25), ('Mantika', 20, 65),
+    ('Noodles', 12, 18), ('Sabon', 15, 30), ('Shampoo sachet', 7, 10),
+    ('Itlog', 8, 10), ('Tinapay', 5, 60), ('Softdrinks 1.5L', 70, 85),
+    ('Gatas', 25, 95), ('Toyo', 15, 30), ('Suka', 15, 28), ('Load', 20, 100),
+    ('Sigarilyo', 8, 160), ('Gaas', 30, 60), ('Kandila', 5, 12), ('Biskwit', 8, 15),
+]
+
+SCALES = {'k': 1000, 'm': 1000000}
+
+
+def parse_count(value):
+    """'1k' -> 1000, '1M' -> 1000000, '2500' -> 2500"""
+    value = value.strip().lower()
+    if value and value[-1] in SCALES:
+        return int(float(value[:-1]) * SCALES[value[-1]])
+    return int(value)
+
+
+def timestamp(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def generate_credit(rng, credit_id, now, days, max_items):
+    """Return the credit row, its item rows, any payment rows and when it was settled"""
+    created = now - timedelta(days=rng.uniform(0, days), seconds=rng.randrange(86400))
+    due = (created + timedelta(days=rng.choice((3, 7, 7, 14, 15, 30)))).date()
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    phone = f"09{rng.randrange(10**9):09d}" if rng.random() < 0.5 else None
+
+    items = []
+    added = created
+    for _ in range(min(12, max_items, max(1, int(rng.expovariate(1 / 4))))):
+        product, low, high = rng.choice(PRODUCTS)
+        quantity = rng.choice((1, 1, 1, 2, 3, 5))
+        price = round(rng.uniform(low, high), 2)
+        items.append((credit_id, product, round(price * quantity, 2), quantity, price, timestamp(added)))
+        added = min(now, added + timedelta(hours=rng.uniform(0, 72)))
+
+    total = sum(item[2] for item in items)
+    payments = []
+    paid_at = None
+    outcome = rng.random()
+    if outcome < 0.55 and due < now.date():
+        # Settled in full some time after the last item
+        paid_at = min(now, added + timedelta(days=rng.uniform(0, 20)))
+        payments.append((credit_id, round(total, 2), timestamp(paid_at)))
+    elif outcome < 0.75:
+        amount = round(total * rng.uniform(0.1, 0.8), 2)
+        if amount > 0:
+            payments.append((credit_id, amount, timestamp(min(now, added + timedelta(days=rng.uniform(0, 10))))))
+
+    credit = (credit_id, name, phone, due.isoformat(), timestamp(created))
+    return credit, items, payments, paid_at
+
+
+def generate(cursor, items_wanted, days, seed, batch_credits=2000, progress=None):
+    """Insert credits until items_wanted items exist; returns (credits, items)"""
+    import app_sqlite
+    customers = {}
+    rng = random.Random(seed)
+    now = datetime.now()
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM credits")
+    next_id = cursor.fetchone()[0] + 1
+    credits_made = items_made = 0
+
+    while items_made < items_wanted:
+        credits, items, payments, settled = [], [], [], []
+        while len(credits) < batch_credits and items_made + len(items) < items_wanted:
+            credit, credit_items, credit_payments, paid_at = generate_credit(
+                rng, next_id, now, days, items_wanted - items_made - len(items))
+            name = credit[1]
+            if name not in customers:
+                customers[name] = app_sqlite.find_or_create_customer(cursor, name)
+            credits.append((customers[name],) + credit)
+            items.extend(credit_items)
+            payments.extend(credit_payments)
+            if paid_at is not None:
+                settled.append((timestamp(paid_at), next_id))
+            next_id += 1
+
+        cursor.executemany("""
+            INSERT INTO credits (customer_id, id, customer_name, phone_number, estimated_payment_date, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, credits)
+        cursor.executemany("""
+            INSERT INTO credit_items (credit_id, product, cost, quantity, unit_price, added_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, items)
+        cursor.executemany("INSERT INTO payments (credit_id, amount, paid_at) VALUES (?, ?, ?)", payments)
+        cursor.executemany("""
+            UPDATE credit_items SET status = 'paid', paid_date = ? WHERE credit_id = ?
+        """, settled)
+        cursor.executemany("UPDATE credits SET status = 'paid', paid_date = ? WHERE id = ?", settled)
+        cursor.connection.commit()
+
+        credits_made += len(credits)
+        items_made += len(items)
+        if progress:
+            progress(credits_made, items_made)
+    return credits_made, items_made
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', default='1k', help='Items to generate, e.g. 1k, 100k, 1M (default 1k)')
+    parser.add_argument('--days', type=int, default=365, help='Spread credits over this many past days')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed, for repeatable ledgers')
+    parser.add_argument('--db-path', default=None, help='Directory for store_credit.db (default: DB_PATH or .)')
+    parser.add_argument('--reset', action='store_true', help='Delete the existing database first')
+    parser.add_argument('--check', action='store_true', help='Verify the running totals afterwards')
+    args = parser.parse_args(argv)
+
+    if args.db_path:
+        os.makedirs(args.db_path, exist_ok=True)
+        os.environ['DB_PATH'] = args.db_path
+    db_file = os.path.join(os.environ.get('DB_PATH', '.'), 'store_credit.db')
+    if args.reset:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_file + suffix):
+                os.remove(db_file + suffix)
+
+    import app_sqlite  # creates the schema in DB_PATH
+
+    items_wanted = parse_count(args.items)
+    connection = app_sqlite.open_connection()
+    cursor = connection.cursor()
+    started = time.perf_counter()
+
+    def progress(credits, items):
+        rate = items / (time.perf_counter() - started)
+        print(f"\r  {items:,}/{items_wanted:,} items in {credits:,} credits ({rate:,.0f} items/s)",
+              end='', file=sys.stderr, flush=True)
+
+    credits, items = generate(cursor, items_wanted, args.days, args.seed, progress=progress)
+    print(file=sys.stderr)
+    cursor.execute("PRAGMA optimize")
+    print(f"Generated {credits:,} credits and {items:,} items in {app_sqlite.DB_FILE} "
+          f"({time.perf_counter() - started:.1f}s)")
+
+    if args.check:
+        problems = (app_sqlite.check_totals(cursor) + app_sqlite.check_aging(cursor)
+                    + app_sqlite.check_rollups(cursor) + app_sqlite.check_customers(cursor))
+        for problem in problems:
+            print(f"  {problem}")
+        print("Running totals are consistent." if not problems else f"{len(problems)} mismatch(es) found.")
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
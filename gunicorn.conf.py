@@ -0,0 +1,13 @@
+"""Gunicorn settings, read automatically from the working directory.
+
+Background threads are started here, once per worker process after it
+has loaded the app, rather than from a request hook. Each takes a lock
+file next to the database before doing any work, so only one worker runs
+it at a time however many workers there are.
+"""
+
+
+def post_worker_init(worker):
+    import app_sqlite
+    app_sqlite.start_sms_worker()
+    app_sqlite.start_backup_worker()
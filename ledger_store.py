@@ -0,0 +1,535 @@
+"""Ledger data layer shared by app_sqlite.py (SQLite) and app.py (MySQL).
+
+Both databases hold the same two-table ledger - credits and credit_items,
+with payments and the trigger-maintained credit_totals, ledger_summary and
+deleted_credits next to them (TOTALS_TRIGGERS in app_sqlite.py, and
+database_schema.sql for MySQL) - and every read and write of those tables
+goes through a LedgerStore, so the SQL is written once. Statements use ?
+placeholders; each store adapts them to its driver.
+
+Methods take the cursor of the caller's transaction and leave the commit
+to the caller. MySQL refuses a statement whose trigger changes a table the
+statement itself reads (error 1442), so writes never read credit_totals in
+the same statement: the balance is read first, locked by lock_credit(), and
+the rows to write are built from it and sent with executemany().
+"""
+import math
+from contextlib import contextmanager
+
+try:
+    from mysql.connector import pooling as mysql_pooling  # only app.py needs it
+except ImportError:
+    mysql_pooling = None
+
+
+# Columns of a credit with its running totals, as the list templates use them
+CREDIT_COLUMNS = """
+    SELECT c.id, c.customer_name, c.phone_number, c.estimated_payment_date,
+           c.status, c.created_at, c.paid_date,
+           COALESCE(ct.total_cost, 0) as total_cost,
+           COALESCE(ct.item_count, 0) as item_count,
+           COALESCE(ct.paid_amount, 0) as paid_amount,
+           COALESCE(ct.total_cost - ct.paid_amount, 0) as balance,
+           COALESCE(ct.version, 0) as version
+    FROM credits c
+    LEFT JOIN credit_totals ct ON ct.credit_id = c.id
+"""
+
+ITEM_COLUMNS = "id, credit_id, product, cost, added_at, quantity, unit_price, status, paid_date"
+
+
+class LedgerStore:
+    """Reads and writes of the ledger tables, independent of the database.
+    
+    on_change(credit_id) is called after a write changed a credit, and
+    find_customer(cursor, name, phone_number), when given, returns the
+    customer_id stored on new credits.
+    """
+    placeholder = '?'
+    for_update = ''
+    
+    def __init__(self, on_change=None, find_customer=None):
+        self.on_change = on_change
+        self.find_customer = find_customer
+        self._statements = {}
+    
+    def sql(self, statement):
+        """Adapt a statement written with ? placeholders to this database"""
+        adapted = self._statements.get(statement)
+        if adapted is None:
+            adapted = self._statements[statement] = statement.replace('?', self.placeholder)
+        return adapted
+    
+    def execute(self, cursor, statement, params=()):
+        cursor.execute(self.sql(statement), params)
+        return cursor
+    
+    def executemany(self, cursor, statement, rows):
+        if rows:
+            cursor.executemany(self.sql(statement), rows)
+        return cursor
+    
+    def changed(self, credit_id):
+        if self.on_change is not None:
+            self.on_change(credit_id)
+    
+    # --- connections ---------------------------------------------------
+    
+    def connect(self):
+        raise NotImplementedError
+    
+    def cursor(self, connection):
+        return connection.cursor()
+    
+    @contextmanager
+    def transaction(self):
+        """A cursor on a connection of its own, committed if the block succeeds"""
+        connection = self.connect()
+        try:
+            yield self.cursor(connection)
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+    
+    def lock_credit(self, cursor, credit_id):
+        """Read what is owed on a credit, locked until the transaction ends. None if it does not exist."""
+        self.execute(cursor, """
+            SELECT total_cost - paid_amount as balance FROM credit_totals WHERE credit_id = ?
+        """ + self.for_update, (credit_id,))
+        row = cursor.fetchone()
+        return None if row is None else float(row['balance'])
+    
+    # --- reads ---------------------------------------------------------
+    
+    def fetch_credit(self, cursor, credit_id):
+        """Fetch one credit with its running totals, or None"""
+        self.execute(cursor, CREDIT_COLUMNS + "WHERE c.id = ?", (credit_id,))
+        return cursor.fetchone()
+    
+    def fetch_credits(self, cursor, credit_ids):
+        """Fetch the given credits as dicts, in the order of credit_ids"""
+        if not credit_ids:
+            return []
+        
+        placeholders = ','.join('?' * len(credit_ids))
+        self.execute(cursor, CREDIT_COLUMNS + f"WHERE c.id IN ({placeholders})", list(credit_ids))
+        by_id = {credit['id']: dict(credit) for credit in cursor.fetchall()}
+        return [by_id[credit_id] for credit_id in credit_ids if credit_id in by_id]
+    
+    def fetch_credit_page(self, cursor, per_page, after=None, before=None):
+        """Fetch one page of credits, newest first, using a (created_at, id) keyset cursor.
+        
+        Returns (credits, has_newer, has_older). Only the requested page is read,
+        so the cost does not grow with the size of the ledger. Each credit gets a
+        display_no: its position counting from the oldest credit, which stays
+        sequential after deletions without renumbering primary keys.
+        """
+        if before:
+            # Walk forward (towards newer credits) from the cursor, then flip the page
+            self.execute(cursor, CREDIT_COLUMNS + """
+                WHERE (c.created_at, c.id) > (?, ?)
+                ORDER BY c.created_at ASC, c.id ASC
+                LIMIT ?
+            """, (before[0], before[1], per_page + 1))
+            rows = cursor.fetchall()
+            has_newer = len(rows) > per_page
+            return self.number_credits(cursor, list(reversed(rows[:per_page]))), has_newer, True
+        
+        if after:
+            self.execute(cursor, CREDIT_COLUMNS + """
+                WHERE (c.created_at, c.id) < (?, ?)
+                ORDER BY c.created_at DESC, c.id DESC
+                LIMIT ?
+            """, (after[0], after[1], per_page + 1))
+        else:
+            self.execute(cursor, CREDIT_COLUMNS + """
+                ORDER BY c.created_at DESC, c.id DESC
+                LIMIT ?
+            """, (per_page + 1,))
+        rows = cursor.fetchall()
+        return self.number_credits(cursor, rows[:per_page]), after is not None, len(rows) > per_page
+    
+    def number_credits(self, cursor, rows):
+        """Attach display numbers to a newest-first page of credits.
+        
+        One COUNT over the (created_at, id) index gives the position of the
+        newest credit on the page; the rest follow by counting down.
+        """
+        if not rows:
+            return []
+        
+        self.execute(cursor, """
+            SELECT COUNT(*) as position FROM credits
+            WHERE (created_at, id) <= (?, ?)
+        """, (rows[0]['created_at'], rows[0]['id']))
+        position = cursor.fetchone()['position']
+        
+        credits = []
+        for offset, row in enumerate(rows):
+            credit = dict(row)
+            credit['display_no'] = position - offset
+            credits.append(credit)
+        return credits
+    
+    def fetch_items(self, cursor, credit_id):
+        """Fetch the items of one credit, newest first"""
+        self.execute(cursor, f"""
+            SELECT {ITEM_COLUMNS}
+            FROM credit_items
+            WHERE credit_id = ?
+            ORDER BY added_at DESC
+        """, (credit_id,))
+        return cursor.fetchall()
+    
+    def fetch_items_by_credit(self, cursor, credit_ids):
+        """Load the items of the given credits only, grouped by credit_id"""
+        items_by_credit = {}
+        if not credit_ids:
+            return items_by_credit
+        
+        placeholders = ','.join('?' * len(credit_ids))
+        self.execute(cursor, f"""
+            SELECT {ITEM_COLUMNS}
+            FROM credit_items
+            WHERE credit_id IN ({placeholders})
+            ORDER BY credit_id, added_at DESC
+        """, list(credit_ids))
+        for item in cursor.fetchall():
+            items_by_credit.setdefault(item['credit_id'], []).append(item)
+        return items_by_credit
+    
+    def fetch_ledger_summary(self, cursor):
+        """Read the dashboard totals and credit counts from the running-totals row"""
+        self.execute(cursor, """
+            SELECT pending_total as total_pending,
+                   paid_total as total_paid,
+                   total_cost as total_all,
+                   item_count,
+                   pending_credits as pending,
+                   paid_credits as paid,
+                   total_credits as total,
+                   version
+            FROM ledger_summary
+            WHERE id = 1
+        """)
+        return cursor.fetchone()
+    
+    def fetch_payments(self, cursor, credit_id):
+        """Payment history of one credit, newest first"""
+        self.execute(cursor, """
+            SELECT id, credit_id, item_id, amount, paid_at
+            FROM payments
+            WHERE credit_id = ?
+            ORDER BY paid_at DESC, id DESC
+        """, (credit_id,))
+        return cursor.fetchall()
+    
+    def search_credit_ids(self, cursor, text, limit):
+        """IDs of credits whose customer name or phone number contains the text, newest first"""
+        self.execute(cursor, """
+            SELECT id FROM credits
+            WHERE customer_name LIKE ? OR phone_number LIKE ?
+            ORDER BY created_at DESC
+            LIMIT ?
+        """, (f'%{text}%', f'%{text}%', limit))
+        return [row['id'] for row in cursor.fetchall()]
+    
+    # --- writes --------------------------------------------------------
+    
+    def create_credit(self, cursor, customer_name, estimated_payment_date, product, cost,
+                      quantity=1, price=0, phone_number=None):
+        """Insert a credit with its first item and return the new credit ID"""
+        if self.find_customer is not None:
+            customer_id = self.find_customer(cursor, customer_name, phone_number)
+            self.execute(cursor, """
+                INSERT INTO credits (customer_id, customer_name, phone_number, estimated_payment_date)
+                VALUES (?, ?, ?, ?)
+            """, (customer_id, customer_name, phone_number, estimated_payment_date))
+        else:
+            self.execute(cursor, """
+                INSERT INTO credits (customer_name, phone_number, estimated_payment_date)
+                VALUES (?, ?, ?)
+            """, (customer_name, phone_number, estimated_payment_date))
+        
+        credit_id = cursor.lastrowid
+        self.insert_item(cursor, credit_id, product, cost, quantity, price)
+        return credit_id
+    
+    def insert_item(self, cursor, credit_id, product, cost, quantity=1, price=0):
+        """Insert one item row and return its ID"""
+        self.execute(cursor, """
+            INSERT INTO credit_items (credit_id, product, cost, quantity, unit_price)
+            VALUES (?, ?, ?, ?, ?)
+        """, (credit_id, product, float(cost), int(quantity), float(price)))
+        return cursor.lastrowid
+    
+    def reopen_credit(self, cursor, credit_id):
+        """Change a credit's status back to pending if it was paid"""
+        self.execute(cursor, """
+            UPDATE credits
+            SET status = 'pending', paid_date = NULL
+            WHERE id = ? AND status != 'pending'
+        """, (credit_id,))
+    
+    def add_item(self, cursor, credit_id, product, cost, quantity=1, price=0):
+        """Add an item to an existing credit, reopening the credit if it was paid"""
+        item_id = self.insert_item(cursor, credit_id, product, cost, quantity, price)
+        self.reopen_credit(cursor, credit_id)
+        self.changed(credit_id)
+        return item_id
+    
+    def add_items(self, cursor, credit_id, items):
+        """Add several parsed items to a credit with one executemany. Returns the count."""
+        self.executemany(cursor, """
+            INSERT INTO credit_items (credit_id, product, cost, quantity, unit_price)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(credit_id, item['product'], item['cost'], item['quantity'], item['price']) for item in items])
+        self.reopen_credit(cursor, credit_id)
+        self.changed(credit_id)
+        return len(items)
+    
+    def settle_credit(self, cursor, credit_id, balance):
+        """Mark a credit and its remaining items paid once nothing is owed on it"""
+        if balance > 0.005:
+            return
+        self.execute(cursor, """
+            UPDATE credits
+            SET status = 'paid', paid_date = CURRENT_TIMESTAMP
+            WHERE id = ? AND status != 'paid'
+        """, (credit_id,))
+        if cursor.rowcount:
+            self.execute(cursor, """
+                UPDATE credit_items
+                SET status = 'paid', paid_date = CURRENT_TIMESTAMP
+                WHERE credit_id = ? AND status != 'paid'
+            """, (credit_id,))
+    
+    def pay_items(self, cursor, credit_id, item_ids):
+        """Pay off items of one credit; the credit is marked paid once nothing is owed.
+        
+        Each item is recorded as a payment of its cost, capped at what is still
+        owed on the credit after earlier partial payments. The payments go in
+        with one executemany. Returns the number of items actually paid.
+        """
+        balance = self.lock_credit(cursor, credit_id)
+        if balance is None or not item_ids:
+            return 0
+        
+        placeholders = ','.join('?' * len(item_ids))
+        self.execute(cursor, f"""
+            SELECT id, cost FROM credit_items
+            WHERE credit_id = ? AND id IN ({placeholders}) AND status != 'paid'
+        """, [credit_id, *item_ids])
+        costs = {row['id']: float(row['cost']) for row in cursor.fetchall()}
+        if not costs:
+            return 0
+        
+        payments = []
+        for item_id in dict.fromkeys(item_ids):
+            amount = min(costs.get(item_id, 0), balance)
+            if amount > 0:
+                payments.append((credit_id, item_id, amount))
+                balance -= amount
+        self.executemany(cursor, "INSERT INTO payments (credit_id, item_id, amount) VALUES (?, ?, ?)", payments)
+        
+        placeholders = ','.join('?' * len(costs))
+        self.execute(cursor, f"""
+            UPDATE credit_items
+            SET status = 'paid', paid_date = CURRENT_TIMESTAMP
+            WHERE id IN ({placeholders})
+        """, list(costs))
+        self.changed(credit_id)
+        self.settle_credit(cursor, credit_id, balance)
+        return len(costs)
+    
+    def pay_item(self, cursor, credit_id, item_id):
+        """Pay off one item. Returns False if there is no unpaid item with that ID."""
+        return self.pay_items(cursor, credit_id, [item_id]) > 0
+    
+    def add_payment(self, cursor, credit_id, amount):
+        """Record a partial payment on a credit and return the remaining balance.
+        
+        Returns None if the credit does not exist; raises ValueError when the
+        amount is not a finite positive number or is more than what is owed.
+        """
+        balance = self.lock_credit(cursor, credit_id)
+        if balance is None:
+            return None
+        if not math.isfinite(amount):
+            raise ValueError('Amount must be a finite number')
+        if amount <= 0:
+            raise ValueError('Amount must be greater than zero')
+        if amount > balance + 0.005:
+            raise ValueError(f'Amount is more than the balance of {balance:.2f}')
+        
+        self.execute(cursor, "INSERT INTO payments (credit_id, amount) VALUES (?, ?)", (credit_id, amount))
+        self.settle_credit(cursor, credit_id, balance - amount)
+        self.changed(credit_id)
+        return balance - amount
+    
+    def pay_credit(self, cursor, credit_id):
+        """Pay off whatever is still owed on a credit. Returns False if it does not exist."""
+        balance = self.lock_credit(cursor, credit_id)
+        if balance is None:
+            return False
+        
+        if balance > 0:
+            self.execute(cursor, "INSERT INTO payments (credit_id, amount) VALUES (?, ?)", (credit_id, balance))
+        self.execute(cursor, """
+            UPDATE credits
+            SET status = 'paid', paid_date = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (credit_id,))
+        self.execute(cursor, """
+            UPDATE credit_items
+            SET status = 'paid', paid_date = CURRENT_TIMESTAMP
+            WHERE credit_id = ? AND status != 'paid'
+        """, (credit_id,))
+        self.changed(credit_id)
+        return True
+    
+    def remove_credit(self, cursor, credit_id):
+        """Delete a credit and its items. Returns False if it does not exist."""
+        self.changed(credit_id)
+        self.execute(cursor, "DELETE FROM credit_items WHERE credit_id = ?", (credit_id,))
+        self.execute(cursor, "DELETE FROM credits WHERE id = ?", (credit_id,))
+        return cursor.rowcount > 0
+
+
+class SQLiteLedgerStore(LedgerStore):
+    """The ledger in SQLite; connect() opens a connection with Row results"""
+    
+    def __init__(self, connect, **kwargs):
+        super().__init__(**kwargs)
+        self.connect = connect
+    
+    def lock_credit(self, cursor, credit_id):
+        # SQLite locks the whole database, not rows: take the write lock
+        # before reading the balance so no other payment lands in between
+        if not cursor.connection.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+        return super().lock_credit(cursor, credit_id)
+
+
+class MySQLLedgerStore(LedgerStore):
+    """The ledger in MySQL, on connections from a mysql.connector pool"""
+    placeholder = '%s'
+    for_update = ' FOR UPDATE'
+    
+    def __init__(self, config, pool_size=5, pool_name='store_credit', **kwargs):
+        super().__init__(**kwargs)
+        if mysql_pooling is None:
+            raise RuntimeError('MySQL support needs mysql-connector-python (pip install -r requirements.txt)')
+        self.pool = mysql_pooling.MySQLConnectionPool(pool_name=pool_name, pool_size=pool_size,
+                                                      pool_reset_session=True, **config)
+    
+    def connect(self):
+        """Borrow a pooled connection; close() hands it back"""
+        return self.pool.get_connection()
+    
+    def cursor(self, connection):
+        return connection.cursor(dictionary=True)
+
+
+def check_store(store, cursor):
+    """Run every write of the store on a throwaway credit and check the results.
+    
+    The running totals of the credit and of the ledger are compared with a
+    recount after each step. Returns a list of problems (empty when all is
+    well); the caller rolls the transaction back afterwards.
+    """
+    problems = []
+    
+    def expect(label, actual, wanted):
+        if isinstance(wanted, float) or isinstance(actual, float):
+            ok = actual is not None and abs(float(actual) - wanted) < 0.005
+        else:
+            ok = actual == wanted
+        if not ok:
+            problems.append(f"{label}: expected {wanted!r}, got {actual!r}")
+    
+    def recount(label, credit_id):
+        store.execute(cursor, """
+            SELECT ct.total_cost, ct.item_count, ct.paid_amount,
+                   (SELECT COALESCE(SUM(cost), 0) FROM credit_items WHERE credit_id = ?) as actual_cost,
+                   (SELECT COUNT(*) FROM credit_items WHERE credit_id = ?) as actual_count,
+                   (SELECT COALESCE(SUM(amount), 0) FROM payments WHERE credit_id = ?) as actual_paid
+            FROM credit_totals ct
+            WHERE ct.credit_id = ?
+        """, (credit_id, credit_id, credit_id, credit_id))
+        row = cursor.fetchone()
+        if row is None:
+            problems.append(f"{label}: no credit_totals row for credit {credit_id}")
+            return
+        expect(f"{label}: credit total", float(row['total_cost']), float(row['actual_cost']))
+        expect(f"{label}: item count", int(row['item_count']), int(row['actual_count']))
+        expect(f"{label}: paid amount", float(row['paid_amount']), float(row['actual_paid']))
+        
+        summary = store.fetch_ledger_summary(cursor)
+        store.execute(cursor, """
+            SELECT (SELECT COALESCE(SUM(cost), 0) FROM credit_items
+                    WHERE credit_id IN (SELECT id FROM credits)) as total_all,
+                   (SELECT COALESCE(SUM(amount), 0) FROM payments
+                    WHERE credit_id IN (SELECT id FROM credits)) as total_paid,
+                   (SELECT COUNT(*) FROM credits) as total,
+                   (SELECT COUNT(*) FROM credits WHERE status = 'pending') as pending
+        """)
+        actual = cursor.fetchone()
+        expect(f"{label}: ledger total", float(summary['total_all']), float(actual['total_all']))
+        expect(f"{label}: ledger paid", float(summary['total_paid']), float(actual['total_paid']))
+        expect(f"{label}: credit count", int(summary['total']), int(actual['total']))
+        expect(f"{label}: pending count", int(summary['pending']), int(actual['pending']))
+    
+    credit_id = store.create_credit(cursor, 'Store Check', '2000-01-01', 'Bugas', 50.0, 1, 50.0)
+    expect('create: credit', store.fetch_credit(cursor, credit_id) is not None, True)
+    recount('create', credit_id)
+    
+    store.add_items(cursor, credit_id, [
+        {'product': 'Kape', 'cost': 12.0, 'quantity': 2, 'price': 6.0},
+        {'product': 'Asukar', 'cost': 20.0, 'quantity': 1, 'price': 20.0},
+    ])
+    items = store.fetch_items(cursor, credit_id)
+    expect('add items: item count', len(items), 3)
+    expect('add items: balance', float(store.fetch_credit(cursor, credit_id)['balance']), 82.0)
+    recount('add items', credit_id)
+    
+    rice = [item['id'] for item in items if item['product'] == 'Bugas']
+    expect('pay item: paid', store.pay_items(cursor, credit_id, rice), 1)
+    expect('pay item: again', store.pay_items(cursor, credit_id, rice), 0)
+    expect('pay item: balance', float(store.fetch_credit(cursor, credit_id)['balance']), 32.0)
+    recount('pay item', credit_id)
+    
+    expect('add payment: remaining', store.add_payment(cursor, credit_id, 10.0), 22.0)
+    try:
+        store.add_payment(cursor, credit_id, 100.0)
+        problems.append('add payment: an overpayment was accepted')
+    except ValueError:
+        pass
+    recount('add payment', credit_id)
+    
+    expect('pay credit: found', store.pay_credit(cursor, credit_id), True)
+    credit = store.fetch_credit(cursor, credit_id)
+    expect('pay credit: status', credit['status'], 'paid')
+    expect('pay credit: balance', float(credit['balance']), 0.0)
+    expect('pay credit: payments', len(store.fetch_payments(cursor, credit_id)), 3)
+    recount('pay credit', credit_id)
+    
+    store.add_item(cursor, credit_id, 'Sardinas', 25.0, 1, 25.0)
+    expect('reopen: status', store.fetch_credit(cursor, credit_id)['status'], 'pending')
+    expect('reopen: settle with payment', store.add_payment(cursor, credit_id, 25.0), 0.0)
+    expect('reopen: settled', store.fetch_credit(cursor, credit_id)['status'], 'paid')
+    recount('reopen', credit_id)
+    
+    page, _, _ = store.fetch_credit_page(cursor, 100)
+    expect('page: lists the credit', any(credit['id'] == credit_id for credit in page), True)
+    expect('search: finds the credit', credit_id in store.search_credit_ids(cursor, 'Store Check', 100), True)
+    
+    expect('remove: found', store.remove_credit(cursor, credit_id), True)
+    expect('remove: gone', store.fetch_credit(cursor, credit_id), None)
+    store.execute(cursor, "SELECT credit_id FROM deleted_credits WHERE credit_id = ?", (credit_id,))
+    expect('remove: tombstone', cursor.fetchone() is not None, True)
+    expect('remove: again', store.remove_credit(cursor, credit_id), False)
+    return problems
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+"""Compare gunicorn (as in start.sh) with the ASGI server under many polling clients.
+
+    python generate_ledger.py --items 100k --db-path /tmp/bench
+    python loadtest.py --db-path /tmp/bench --clients 200 --exporters 2
+    python loadtest.py --db-path /tmp/bench --servers asgi --long-poll
+
+Each server is started on its own copy of the database. --clients phones
+poll /api/changes every --interval seconds (with --long-poll, the ASGI
+server's clients hold a ?wait= request open instead), --exporters clients
+download the CSV export back to back, and --writers clients add a credit
+every second so there are changes to pick up. Poll latency percentiles,
+throughput and errors are reported per server.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+from benchmark import copy_database, percentile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PERCENTILES = (50, 90, 95, 99)
+
+SERVERS = {
+    # The same command as start.sh
+    'gunicorn': lambda port: [sys.executable, '-m', 'gunicorn', 'app_sqlite:app', '--bind', f'127.0.0.1:{port}',
+                              '--workers', '2', '--timeout', '120'],
+    'asgi': lambda port: [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+                          '--log-level', 'warning', '--timeout-graceful-shutdown', '5'],
+}
+
+
+class HTTPConnection:
+    """A minimal keep-alive HTTP/1.1 client connection"""
+
+    def __init__(self, port, cookie=None):
+        self.port = port
+        self.cookie = cookie
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', headers=None):
+        """Returns (status, headers, body)"""
+        lines = [f"{method} {path} HTTP/1.1", "Host: 127.0.0.1", f"Content-Length: {len(body)}"]
+        if self.cookie:
+            lines.append(f"Cookie: {self.cookie}")
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        message = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin1') + body
+
+        for attempt in (1, 2):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+            try:
+                self.writer.write(message)
+                await self.writer.drain()
+                return await self.read_response()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if not reused or attempt == 2:
+                    raise  # only a stale keep-alive connection is retried
+
+    async def read_response(self):
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode('latin1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                chunks.append(await self.reader.readexactly(size + 2))
+                if size == 0:
+                    break
+            body = b''.join(chunk[:-2] for chunk in chunks)
+        else:
+            body = await self.reader.read()
+            self.close()
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, headers, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def wait_for_server(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not start in time")
+
+
+async def login(port):
+    import app_sqlite  # for the configured credentials
+    connection = HTTPConnection(port)
+    _, headers, _ = await connection.request(
+        'POST', '/login', urlencode({'email': app_sqlite.LOGIN_EMAIL, 'password': app_sqlite.LOGIN_PASSWORD}).encode(),
+        {'Content-Type': 'application/x-www-form-urlencoded'})
+    connection.close()
+    return headers['set-cookie'].split(';')[0]
+
+
+async def current_version(port, cookie):
+    """The ledger version now, so clients start as already-synced phones would"""
+    connection = HTTPConnection(port, cookie)
+    _, _, body = await connection.request('GET', f'/api/changes?since={2 ** 62}')
+    connection.close()
+    return json.loads(body)['version']
+
+
+async def poller(port, cookie, stats, stop, interval, wait, version):
+    """One phone: poll /api/changes from the version it last saw"""
+    connection = HTTPConnection(port, cookie)
+    await asyncio.sleep(random.uniform(0, interval))
+    while not stop.is_set():
+        params = {'since': version, 'after_id': 0}
+        if wait:
+            params['wait'] = wait
+        started = time.perf_counter()
+        try:
+            status, _, body = await connection.request('GET', '/api/changes?' + urlencode(params))
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            stats['errors'] += 1
+            connection.close()
+            await asyncio.sleep(interval)
+            continue
+        elapsed = time.perf_counter() - started
+        if status == 200:
+            data = json.loads(body)
+            version = data['version']
+            if not wait:
+                stats['latencies'].append(elapsed * 1000)
+            stats['changes'] += len(data['credits'])
+        else:
+            stats['errors'] += 1
+        stats['polls'] += 1
+        if not wait or status != 200:
+            await asyncio.sleep(max(0, interval - elapsed))
+    connection.close()
+
+
+async def exporter(port, cookie, stats, stop):
+    connection = HTTPConnection(port, cookie)
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            status, _, body = await connection.request('GET', '/export_credits?format=csv')
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            stats['errors'] += 1
+            connection.close()
+            continue
+        if status == 200:
+            stats['exports'].append(time.perf_counter() - started)
+        else:
+            stats['errors'] += 1
+    connection.close()
+
+
+async def writer(port, cookie, stats, stop):
+    """Add a credit every second and time how long the write takes"""
+    connection = HTTPConnection(port, cookie)
+    number = 0
+    while not stop.is_set():
+        number += 1
+        body = json.dumps({'customer_name': f'Load Test {number}', 'product': 'Kape', 'cost': 10,
+                           'estimated_payment_date': '2030-01-01'}).encode()
+        started = time.perf_counter()
+        try:
+            status, _, _ = await connection.request('POST', '/api/credits', body,
+                                                    {'Content-Type': 'application/json'})
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            status = None
+            connection.close()
+        elapsed = time.perf_counter() - started
+        if status == 201:
+            stats['writes'].append(elapsed * 1000)
+        else:
+            stats['errors'] += 1
+        await asyncio.sleep(max(0, 1 - elapsed))
+    connection.close()
+
+
+async def run_load(port, args, long_poll):
+    cookie = await login(port)
+    version = await current_version(port, cookie)
+    stats = {'latencies': [], 'polls': 0, 'changes': 0, 'errors': 0, 'exports': [], 'writes': []}
+    stop = asyncio.Event()
+    wait = args.wait if long_poll else 0
+    tasks = [asyncio.create_task(poller(port, cookie, stats, stop, args.interval, wait, version))
+             for _ in range(args.clients)]
+    tasks += [asyncio.create_task(exporter(port, cookie, stats, stop)) for _ in range(args.exporters)]
+    tasks += [asyncio.create_task(writer(port, cookie, stats, stop)) for _ in range(args.writers)]
+
+    await asyncio.sleep(args.duration)
+    stop.set()
+    # Pending long polls return within --wait seconds; do not wait for them
+    await asyncio.wait(tasks, timeout=5)
+    for task in tasks:
+        task.cancel()
+    return stats
+
+
+def summarize(stats, duration):
+    latencies = sorted(stats['latencies'])
+    writes = sorted(stats['writes'])
+    result = {
+        'polls': stats['polls'],
+        'polls_per_second': round(stats['polls'] / duration, 1),
+        'changes_received': stats['changes'],
+        'errors': stats['errors'],
+        'exports': len(stats['exports']),
+        'export_mean_s': round(sum(stats['exports']) / len(stats['exports']), 2) if stats['exports'] else None,
+        'write_p95_ms': round(percentile(writes, 95), 1) if writes else None,
+    }
+    for pct in PERCENTILES:
+        result[f'poll_p{pct}_ms'] = round(percentile(latencies, pct), 1) if latencies else None
+    return result
+
+
+def run_server(name, args):
+    db_path = copy_database(args.db_path)
+    os.environ['DB_PATH'] = db_path  # importing app_sqlite for login() opens this copy
+    port = free_port()
+    env = dict(os.environ)
+    process = subprocess.Popen(SERVERS[name](port), cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+    try:
+        asyncio.run(wait_for_server(port, process))
+        long_poll = args.long_poll and name == 'asgi'
+        stats = asyncio.run(run_load(port, args, long_poll))
+        result = summarize(stats, args.duration)
+        result['long_poll'] = long_poll
+        return result
+    finally:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+        shutil.rmtree(db_path, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db-path', default=os.environ.get('DB_PATH', '.'),
+                        help='Directory holding the store_credit.db to load-test (it is copied)')
+    parser.add_argument('--servers', default='gunicorn,asgi', help='Comma-separated: gunicorn, asgi')
+    parser.add_argument('--clients', type=int, default=200, help='Polling phones (default 200)')
+    parser.add_argument('--interval', type=float, default=2.0, help='Seconds between polls (default 2)')
+    parser.add_argument('--long-poll', action='store_true', help='ASGI clients wait for changes with ?wait=')
+    parser.add_argument('--wait', type=float, default=25, help='Long-poll wait in seconds (default 25)')
+    parser.add_argument('--exporters', type=int, default=1, help='Clients downloading exports back to back')
+    parser.add_argument('--writers', type=int, default=1, help='Clients adding a credit every second')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run each server (default 30)')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name in args.servers.split(','):
+        print(f"{name}: {args.clients} clients, {args.exporters} exporter(s), {args.writers} writer(s), "
+              f"{args.duration:.0f}s ...", flush=True)
+        results[name] = run_server(name, args)
+
+    keys = ['polls_per_second', 'poll_p50_ms', 'poll_p95_ms', 'poll_p99_ms', 'write_p95_ms',
+            'changes_received', 'exports', 'export_mean_s', 'errors']
+    print(f"\n{'':<20}" + ''.join(f"{name:>14}" for name in results))
+    for key in keys:
+        cells = ''.join(f"{'-' if result[key] is None else result[key]:>14}" for result in results.values())
+        print(f"{key:<20}{cells}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
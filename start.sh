@@ -10,5 +10,11 @@ export PORT=${PORT:-10000}
 # Ensure DB directory exists
 mkdir -p /opt/render/project/src
 
-# Start the application
+# Precompress the fingerprinted CSS/JS assets
+flask --app app_sqlite build-assets
+
+# Start the application (SERVER=asgi: one uvicorn process, see asgi.py)
+if [ "$SERVER" = "asgi" ]; then
+    exec uvicorn asgi:app --host 0.0.0.0 --port $PORT --timeout-graceful-shutdown 5
+fi
 exec gunicorn app_sqlite:app --bind 0.0.0.0:$PORT --workers 2 --timeout 120
@@ -0,0 +1,651 @@
+// Utang Record System - page behaviour for index.html
+
+// Set current date
+const dateElement = document.getElementById('currentDate');
+const options = { weekday: 'long', year: 'numeric', month: 'long', day: 'numeric' };
+dateElement.textContent = new Date().toLocaleDateString('bcl-PH', options);
+
+// Calculate Total Cost (Quantity × Price)
+function calculateTotal() {
+    const quantity = parseFloat(document.getElementById('quantity').value) || 0;
+    const price = parseFloat(document.getElementById('price').value) || 0;
+    const total = quantity * price;
+    document.getElementById('cost').value = total.toFixed(2);
+    document.getElementById('totalDisplay').textContent = '₱' + total.toFixed(2);
+}
+
+// Calculate Modal Total Cost (Quantity × Price)
+function calculateModalTotal() {
+    const quantity = parseFloat(document.getElementById('modal_quantity').value) || 0;
+    const price = parseFloat(document.getElementById('modal_price').value) || 0;
+    const total = quantity * price;
+    document.getElementById('modal_cost').value = total.toFixed(2);
+    document.getElementById('modalTotalDisplay').textContent = '₱' + total.toFixed(2);
+}
+
+// Toggle Credit Details
+function toggleCreditDetails(creditId) {
+    // Check if we're on mobile (table is hidden)
+    const table = document.querySelector('.table-wrapper table');
+    const isMobile = window.getComputedStyle(table).display === 'none';
+
+    if (isMobile) {
+        // On mobile, show a modal with details
+        showCreditDetailsModal(creditId);
+    } else {
+        // On desktop, toggle the details row
+        const detailsRow = document.getElementById('details-' + creditId);
+        if (detailsRow) {
+            detailsRow.classList.toggle('active');
+        }
+    }
+}
+
+function showCreditDetailsModal(creditId) {
+    // Find the details content from the hidden table
+    const detailsRow = document.getElementById('details-' + creditId);
+    if (!detailsRow) return;
+
+    const detailsContent = detailsRow.querySelector('.details-content');
+    if (!detailsContent) return;
+
+    // Create modal
+    const modal = document.createElement('div');
+    modal.className = 'modal active';
+    modal.id = 'credit-details-modal';
+    modal.style.cssText = 'display: flex; align-items: center; justify-content: center;';
+    modal.innerHTML = `
+        <div class="modal-content" style="max-width: 95%; width: 90%; max-height: 85vh; margin: 20px; display: flex; flex-direction: column; overflow: hidden;">
+            <div style="position: sticky; top: 0; background: white; z-index: 100; padding: 15px 20px; border-bottom: 2px solid #e0e0e0; display: flex; justify-content: space-between; align-items: center;">
+                <h2 style="margin: 0; color: #1e3c72;">📋 Detalye nin Utang</h2>
+                <span class="close" onclick="document.getElementById('credit-details-modal').remove()" style="position: static; margin: 0; font-size: 2em; color: #999; cursor: pointer;">&times;</span>
+            </div>
+            <div style="overflow-y: auto; padding: 20px;">
+                ${detailsContent.innerHTML}
+            </div>
+        </div>
+    `;
+
+    // Add to body
+    document.body.appendChild(modal);
+
+    // Close on overlay click
+    modal.addEventListener('click', function(e) {
+        if (e.target === modal) {
+            modal.remove();
+        }
+    });
+
+    // Reattach event listeners for buttons in modal
+    const addProductBtn = modal.querySelector('.btn-add-product');
+    if (addProductBtn) {
+        addProductBtn.addEventListener('click', function() {
+            const creditId = this.getAttribute('data-credit-id');
+            const customerName = this.getAttribute('data-customer-name');
+            showAddProductModal(creditId, customerName);
+            modal.remove();
+        });
+    }
+}
+
+// Success Notification Functions
+function showSuccessNotification(message) {
+    const notification = document.getElementById('successNotification');
+    const messageElement = document.getElementById('successMessage');
+    messageElement.textContent = message;
+    notification.classList.add('show');
+
+    // Auto hide after 5 seconds
+    setTimeout(function() {
+        hideSuccessNotification();
+    }, 5000);
+}
+
+function hideSuccessNotification() {
+    const notification = document.getElementById('successNotification');
+    notification.classList.add('hiding');
+
+    setTimeout(function() {
+        notification.classList.remove('show', 'hiding');
+    }, 500);
+}
+
+// Check for success parameter in URL
+const urlParams = new URLSearchParams(window.location.search);
+if (urlParams.get('success') === 'added') {
+    showSuccessNotification('Malinog na naidugang an utang!');
+    // Remove the parameter from URL without reloading
+    window.history.replaceState({}, document.title, window.location.pathname);
+} else if (urlParams.get('success') === 'paid') {
+    showSuccessNotification('Naimarka na bilang nabayadan!');
+    window.history.replaceState({}, document.title, window.location.pathname);
+} else if (urlParams.get('success') === 'deleted') {
+    showSuccessNotification('Malinog na napara an utang!');
+    window.history.replaceState({}, document.title, window.location.pathname);
+} else if (urlParams.get('success') === 'product_added') {
+    showSuccessNotification('Naidugang na an utang!');
+    window.history.replaceState({}, document.title, window.location.pathname);
+} else if (urlParams.get('success') === 'item_paid') {
+    showSuccessNotification('Malinog na nabayadan an aytem!');
+    window.history.replaceState({}, document.title, window.location.pathname + window.location.hash);
+} else if (urlParams.get('success') === 'payment_added') {
+    showSuccessNotification('Naitala an bayad!');
+    window.history.replaceState({}, document.title, window.location.pathname + window.location.hash);
+} else if (urlParams.get('success') === 'queued') {
+    showSuccessNotification('Mayong koneksyon - ipapadara ini pag may internet na.');
+    window.history.replaceState({}, document.title, window.location.pathname + window.location.hash);
+}
+
+// Check for hash to navigate to section
+if (window.location.hash === '#credit-list') {
+    showSection('credit-list');
+}
+
+// Search and overdue results - show credit list
+if (document.body.dataset.view) {
+    showSection('credit-list');
+}
+
+// Event delegation for action buttons
+document.addEventListener('click', function(e) {
+    // Add Product button
+    if (e.target.closest('.btn-add-product')) {
+        const btn = e.target.closest('.btn-add-product');
+        const creditId = btn.dataset.creditId;
+        const customerName = btn.dataset.customerName;
+        showAddProductModal(creditId, customerName);
+    }
+});
+
+// Pay single items through the JSON API and patch the page in place
+function formatPeso(amount) {
+    return '₱' + Number(amount || 0).toFixed(2);
+}
+
+function statusBadge(status) {
+    return status === 'pending'
+        ? '<span class="status-badge status-pending">Nag-aabang</span>'
+        : '<span class="status-badge status-paid">Nabayadan Na</span>';
+}
+
+function applySummary(summary) {
+    // Search and overdue results show totals for the matches only
+    if (document.body.dataset.view) return;
+    document.querySelectorAll('[data-summary]').forEach(el => {
+        const key = el.dataset.summary;
+        el.textContent = key.endsWith('_credits') ? summary[key] : formatPeso(summary[key]);
+    });
+}
+
+function applyCreditUpdate(credit) {
+    document.querySelectorAll(`[data-credit-total="${credit.id}"]`).forEach(el => {
+        el.textContent = formatPeso(credit.total_cost);
+    });
+    document.querySelectorAll(`[data-credit-items="${credit.id}"]`).forEach(el => {
+        el.textContent = credit.item_count + ' aytem';
+    });
+    document.querySelectorAll(`[data-credit-status="${credit.id}"]`).forEach(el => {
+        el.innerHTML = statusBadge(credit.status);
+    });
+    document.querySelectorAll(`[data-credit-balance="${credit.id}"]`).forEach(el => {
+        el.textContent = formatPeso(credit.balance);
+    });
+    document.querySelectorAll(`[data-credit-paid="${credit.id}"]`).forEach(el => {
+        el.textContent = formatPeso(credit.paid_amount);
+    });
+}
+
+// Paid items stay listed, without their checkbox and pay button
+function markItemPaid(itemId) {
+    document.querySelectorAll(`.item-row[data-item-id="${itemId}"]`).forEach(row => {
+        if (row.classList.contains('item-paid')) return;
+        row.classList.add('item-paid');
+        row.querySelectorAll('.item-select, .item-pay-form').forEach(el => el.remove());
+        const badge = document.createElement('span');
+        badge.className = 'item-paid-badge';
+        badge.textContent = '✓ Nabayadan';
+        row.appendChild(badge);
+    });
+}
+
+document.addEventListener('submit', async function(e) {
+    const form = e.target.closest('.item-pay-form');
+    if (!form) return;
+    e.preventDefault();
+
+    try {
+        const response = await fetch(`/api/credits/${form.dataset.creditId}/items/${form.dataset.itemId}/pay`, {
+            method: 'POST',
+            headers: { 'Accept': 'application/json' }
+        });
+        if (!response.ok) throw new Error('HTTP ' + response.status);
+        const data = await response.json();
+
+        markItemPaid(form.dataset.itemId);
+        applyCreditUpdate(data.credit);
+        applySummary(data.summary);
+        showSuccessNotification('Malinog na nabayadan an aytem!');
+    } catch (error) {
+        // Fall back to the regular form post
+        form.submit();
+    }
+});
+
+// Pay all checked items of a credit in one batch request
+document.addEventListener('click', async function(e) {
+    const btn = e.target.closest('.btn-pay-selected');
+    if (!btn) return;
+
+    const container = btn.closest('.details-content') || btn.closest('.modal-content');
+    const itemIds = Array.from(container.querySelectorAll('.item-select:checked')).map(box => Number(box.value));
+    if (itemIds.length === 0) return;
+
+    btn.disabled = true;
+    try {
+        const response = await fetch(`/api/credits/${btn.dataset.creditId}/items/pay`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Accept': 'application/json' },
+            body: JSON.stringify({ item_ids: itemIds })
+        });
+        if (!response.ok) throw new Error('HTTP ' + response.status);
+        const data = await response.json();
+
+        itemIds.forEach(markItemPaid);
+        applyCreditUpdate(data.credit);
+        applySummary(data.summary);
+        showSuccessNotification(`Malinog na nabayadan an ${data.paid} aytem!`);
+    } catch (error) {
+        window.location.reload();
+    } finally {
+        btn.disabled = false;
+    }
+});
+
+// Delete form confirmation
+let deleteFormToSubmit = null;
+
+document.addEventListener('submit', function(e) {
+    if (e.target.classList.contains('delete-form')) {
+        e.preventDefault();
+        deleteFormToSubmit = e.target;
+        showDeleteConfirm();
+    }
+});
+
+function showDeleteConfirm() {
+    document.getElementById('deleteConfirmModal').classList.add('active');
+}
+
+function closeDeleteConfirm() {
+    document.getElementById('deleteConfirmModal').classList.remove('active');
+    deleteFormToSubmit = null;
+}
+
+function confirmDelete() {
+    if (deleteFormToSubmit) {
+        closeDeleteConfirm();
+        deleteFormToSubmit.submit();
+    }
+}
+
+// Close confirmation modal on overlay click
+document.getElementById('deleteConfirmModal').addEventListener('click', function(e) {
+    if (e.target === this) {
+        closeDeleteConfirm();
+    }
+});
+
+// Toggle sidebar for mobile
+function toggleSidebar() {
+    const sidebar = document.getElementById('sidebar');
+    const overlay = document.getElementById('overlay');
+    sidebar.classList.toggle('active');
+    overlay.classList.toggle('active');
+}
+
+// Logout function
+function logout() {
+    if (confirm('Sigurado ka na boot mong mag-logout?')) {
+        window.location.href = '/logout';
+    }
+}
+
+// Show specific section
+function showSection(sectionName) {
+    console.log('Switching to section:', sectionName);
+
+    // Close mobile sidebar when navigation item is clicked
+    if (window.innerWidth <= 1024) {
+        const sidebar = document.getElementById('sidebar');
+        const overlay = document.getElementById('overlay');
+        sidebar.classList.remove('active');
+        overlay.classList.remove('active');
+    }
+
+    // Hide all sections
+    const sections = ['dashboard-section', 'add-credit-section', 'credit-list-section', 'reports-section', 'calculator-section'];
+    sections.forEach(id => {
+        const section = document.getElementById(id);
+        if (section) {
+            section.style.display = 'none';
+        }
+    });
+
+    // Remove active class from all nav items
+    const navItems = document.querySelectorAll('.nav-item');
+    navItems.forEach(item => item.classList.remove('active'));
+
+    // Show selected section and update title
+    let sectionToShow = null;
+    let activeIndex = 0;
+
+    switch(sectionName) {
+        case 'dashboard':
+            sectionToShow = document.getElementById('dashboard-section');
+            document.getElementById('pageTitle').textContent = 'Dashboard';
+            activeIndex = 0;
+            break;
+        case 'add-credit':
+            sectionToShow = document.getElementById('add-credit-section');
+            document.getElementById('pageTitle').textContent = 'Magdugang nin Utang';
+            activeIndex = 1;
+            break;
+        case 'credit-list':
+            sectionToShow = document.getElementById('credit-list-section');
+            document.getElementById('pageTitle').textContent = 'Listahan nin Utang';
+            activeIndex = 2;
+            break;
+        case 'reports':
+            sectionToShow = document.getElementById('reports-section');
+            document.getElementById('pageTitle').textContent = 'Mga Report';
+            activeIndex = 3;
+            break;
+        case 'calculator':
+            sectionToShow = document.getElementById('calculator-section');
+            document.getElementById('pageTitle').textContent = 'Kalkulador';
+            activeIndex = 4;
+            break;
+    }
+
+    if (sectionToShow) {
+        sectionToShow.style.display = 'block';
+        navItems[activeIndex].classList.add('active');
+        console.log('Section displayed:', sectionName);
+    }
+
+    // Close sidebar on mobile after clicking
+    if (window.innerWidth <= 1024) {
+        const sidebar = document.getElementById('sidebar');
+        const overlay = document.getElementById('overlay');
+        if (sidebar.classList.contains('active')) {
+            sidebar.classList.remove('active');
+            overlay.classList.remove('active');
+        }
+    }
+
+    // Scroll to top
+    window.scrollTo({ top: 0, behavior: 'smooth' });
+}
+
+// Smooth scroll to section (deprecated, kept for compatibility)
+function scrollToSection(sectionId) {
+    const element = document.getElementById(sectionId);
+    if (element) {
+        element.scrollIntoView({ behavior: 'smooth', block: 'start' });
+        // Close sidebar on mobile after clicking
+        if (window.innerWidth <= 1024) {
+            toggleSidebar();
+        }
+    }
+}
+
+// Set minimum date to today for payment date input
+const dateInput = document.getElementById('estimated_payment_date');
+if (dateInput) {
+    const today = new Date().toISOString().split('T')[0];
+    dateInput.setAttribute('min', today);
+}
+
+// Set minimum date for credit again modal
+const creditAgainDateInput = document.getElementById('credit_again_date');
+if (creditAgainDateInput) {
+    const today = new Date().toISOString().split('T')[0];
+    creditAgainDateInput.setAttribute('min', today);
+}
+
+// Add Product Modal functions
+function showAddProductModal(creditId, customerName) {
+    const modal = document.getElementById('addProductModal');
+    const form = document.getElementById('addProductForm');
+    document.getElementById('modal_credit_id').value = creditId;
+    document.getElementById('modal_customer_name').value = customerName;
+    document.getElementById('modal_product').value = '';
+    document.getElementById('modal_quantity').value = '1';
+    document.getElementById('modal_price').value = '';
+    document.getElementById('modal_cost').value = '0';
+    document.getElementById('modalTotalDisplay').textContent = '₱0.00';
+    form.action = '/add_product/' + creditId;
+    modal.classList.add('active');
+}
+
+function closeAddProductModal() {
+    const modal = document.getElementById('addProductModal');
+    modal.classList.remove('active');
+}
+
+// Close modal when clicking outside
+document.getElementById('addProductModal').addEventListener('click', function(e) {
+    if (e.target === this) {
+        closeAddProductModal();
+    }
+});
+
+// Calculator Functions
+let calcCurrentValue = '0';
+let calcPreviousValue = '';
+let calcOperation = '';
+let calcShouldResetDisplay = false;
+
+function updateCalcDisplay() {
+    const display = document.getElementById('calcDisplay');
+    display.value = calcCurrentValue;
+
+    const history = document.getElementById('calcHistory');
+    if (calcPreviousValue && calcOperation) {
+        history.textContent = `${calcPreviousValue} ${calcOperation}`;
+    } else {
+        history.textContent = '';
+    }
+}
+
+function calcNumber(num) {
+    if (calcCurrentValue === '0' || calcShouldResetDisplay) {
+        calcCurrentValue = num;
+        calcShouldResetDisplay = false;
+    } else {
+        calcCurrentValue += num;
+    }
+    updateCalcDisplay();
+}
+
+function calcDecimal() {
+    if (calcShouldResetDisplay) {
+        calcCurrentValue = '0';
+        calcShouldResetDisplay = false;
+    }
+    if (!calcCurrentValue.includes('.')) {
+        calcCurrentValue += '.';
+    }
+    updateCalcDisplay();
+}
+
+function calcSetOperation(op) {
+    if (calcPreviousValue && calcOperation && !calcShouldResetDisplay) {
+        calcEquals();
+    }
+    calcPreviousValue = calcCurrentValue;
+    calcOperation = op;
+    calcShouldResetDisplay = true;
+}
+
+function calcEquals() {
+    if (!calcPreviousValue || !calcOperation) return;
+
+    const prev = parseFloat(calcPreviousValue);
+    const current = parseFloat(calcCurrentValue);
+    let result = 0;
+
+    switch (calcOperation) {
+        case '+':
+            result = prev + current;
+            break;
+        case '-':
+            result = prev - current;
+            break;
+        case '*':
+            result = prev * current;
+            break;
+        case '/':
+            result = current !== 0 ? prev / current : 'Error';
+            break;
+        case '%':
+            result = prev % current;
+            break;
+    }
+
+    calcCurrentValue = result.toString();
+    calcPreviousValue = '';
+    calcOperation = '';
+    calcShouldResetDisplay = true;
+    updateCalcDisplay();
+}
+
+function calcClear() {
+    calcCurrentValue = '0';
+    calcPreviousValue = '';
+    calcOperation = '';
+    calcShouldResetDisplay = false;
+    updateCalcDisplay();
+}
+
+function calcBackspace() {
+    if (calcCurrentValue.length > 1) {
+        calcCurrentValue = calcCurrentValue.slice(0, -1);
+    } else {
+        calcCurrentValue = '0';
+    }
+    updateCalcDisplay();
+}
+
+// Keyboard support for calculator
+document.addEventListener('keydown', function(e) {
+    // Only handle keys when calculator section is visible
+    if (document.getElementById('calculator-section').style.display === 'none') return;
+
+    if (e.key >= '0' && e.key <= '9') {
+        calcNumber(e.key);
+    } else if (e.key === '.') {
+        calcDecimal();
+    } else if (e.key === '+' || e.key === '-' || e.key === '*' || e.key === '/') {
+        calcSetOperation(e.key);
+    } else if (e.key === 'Enter' || e.key === '=') {
+        e.preventDefault();
+        calcEquals();
+    } else if (e.key === 'Escape' || e.key === 'c' || e.key === 'C') {
+        calcClear();
+    } else if (e.key === 'Backspace') {
+        e.preventDefault();
+        calcBackspace();
+    }
+});
+
+// PWA Service Worker Registration
+if ('serviceWorker' in navigator) {
+    window.addEventListener('load', () => {
+        navigator.serviceWorker.register('/sw.js')
+            .then(registration => {
+                console.log('Service Worker registered successfully:', registration.scope);
+            })
+            .catch(error => {
+                console.log('Service Worker registration failed:', error);
+            });
+    });
+}
+
+// PWA Install Prompt
+let deferredPrompt;
+let installButton = null;
+
+// Create install button
+function createInstallButton() {
+    if (installButton) return;
+
+    installButton = document.createElement('button');
+    installButton.className = 'pwa-install-btn';
+    installButton.innerHTML = '📱 I-install an App';
+    installButton.style.cssText = `
+        position: fixed;
+        bottom: 20px;
+        right: 20px;
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        color: white;
+        border: none;
+        padding: 15px 25px;
+        border-radius: 50px;
+        font-size: 16px;
+        font-weight: bold;
+        cursor: pointer;
+        box-shadow: 0 4px 15px rgba(0, 0, 0, 0.2);
+        z-index: 9999;
+        animation: pulse 2s infinite;
+    `;
+
+    installButton.addEventListener('click', async () => {
+        if (!deferredPrompt) return;
+
+        deferredPrompt.prompt();
+        const { outcome } = await deferredPrompt.userChoice;
+
+        if (outcome === 'accepted') {
+            console.log('User accepted the install prompt');
+        } else {
+            console.log('User dismissed the install prompt');
+        }
+
+        deferredPrompt = null;
+        installButton.remove();
+        installButton = null;
+    });
+
+    document.body.appendChild(installButton);
+}
+
+// Listen for install prompt
+window.addEventListener('beforeinstallprompt', (e) => {
+    e.preventDefault();
+    deferredPrompt = e;
+    createInstallButton();
+});
+
+// Handle app installed
+window.addEventListener('appinstalled', () => {
+    console.log('PWA was installed');
+    if (installButton) {
+        installButton.remove();
+        installButton = null;
+    }
+});
+
+// Add pulse animation
+const style = document.createElement('style');
+style.textContent = `
+    @keyframes pulse {
+        0%, 100% {
+            transform: scale(1);
+        }
+        50% {
+            transform: scale(1.05);
+        }
+    }
+`;
+document.head.appendChild(style);
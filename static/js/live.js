@@ -0,0 +1,88 @@
+// Live updates: changes made on another phone are patched into this page
+// as they happen, from the Server-Sent Events of /api/events, instead of
+// waiting for a reload.
+
+function firstListPage() {
+    const params = new URLSearchParams(window.location.search);
+    return !document.body.dataset.view && !params.has('after') && !params.has('before');
+}
+
+function parseFragment(html) {
+    const template = document.createElement('template');
+    template.innerHTML = html.trim();
+    return template.content;
+}
+
+// Swap in the credit's freshly rendered card and rows, or put them at the
+// top of the list for a credit this page has not shown yet
+function renderCredit(creditId, html) {
+    const card = parseFragment(html.card).querySelector('.mobile-credit-card');
+    const rows = parseFragment(html.row);
+    const row = rows.querySelector('.credit-row');
+    const details = rows.querySelector('.credit-details');
+
+    const oldCard = Array.from(document.querySelectorAll('.mobile-credit-card'))
+        .find(el => el.querySelector(`[data-credit-total="${creditId}"]`));
+    const oldRow = Array.from(document.querySelectorAll('tr.credit-row'))
+        .find(el => el.querySelector(`[data-credit-total="${creditId}"]`));
+    const oldDetails = document.getElementById('details-' + creditId);
+
+    if (oldCard || oldRow) {
+        if (oldCard) oldCard.replaceWith(card);
+        if (oldRow) oldRow.replaceWith(row);
+        if (oldDetails) {
+            if (oldDetails.classList.contains('active')) details.classList.add('active');
+            oldDetails.replaceWith(details);
+        }
+        return true;
+    }
+
+    const cards = document.querySelector('.mobile-credits-container');
+    const body = document.querySelector('.table-wrapper tbody');
+    if (!cards || !body) return false;
+    cards.prepend(card);
+    body.prepend(row, details);
+    return true;
+}
+
+function applyLiveEvent(kind, data) {
+    if (kind === 'credit_deleted') {
+        removeCredit(data.credit_id);
+        return;
+    }
+    if (!data.credit) return;  // deleted since; its deletion follows
+
+    if (data.html) {
+        if (creditOnPage(data.credit.id)) {
+            renderCredit(data.credit.id, data.html);
+        } else if (kind === 'credit_added' && firstListPage() && !renderCredit(data.credit.id, data.html)) {
+            showLedgerNotice('May mga bagong utang.');
+        }
+        return;
+    }
+    if (kind === 'item_paid' && data.item) markItemPaid(data.item.id);
+    applyCreditUpdate(data.credit);
+}
+
+function startLiveUpdates() {
+    if (!('EventSource' in window) || document.body.dataset.liveAfter === undefined) return;
+
+    const source = new EventSource('/api/events?after=' + document.body.dataset.liveAfter);
+    ['credit_added', 'credit_updated', 'credit_deleted', 'item_added', 'item_paid', 'payment_added'].forEach(kind => {
+        source.addEventListener(kind, event => applyLiveEvent(kind, JSON.parse(event.data)));
+    });
+    source.addEventListener('summary', event => {
+        const data = JSON.parse(event.data);
+        if (data.version > Number(document.body.dataset.ledgerVersion || 0)) {
+            applySummary(data.summary);
+            document.body.dataset.ledgerVersion = data.version;
+        }
+    });
+    // The ledger was restored, or this page fell too far behind
+    source.addEventListener('reload', () => {
+        source.close();
+        showLedgerNotice('Nabago an listahan.');
+    });
+}
+
+startLiveUpdates();
@@ -0,0 +1,215 @@
+// Offline ledger: a local IndexedDB copy of the credits, kept current with
+// /api/changes, so the cached page can be brought up to date without
+// reloading and the ledger stays readable while offline.
+const LEDGER_DB = 'utang-ledger';
+
+function openLedger() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(LEDGER_DB, 2);
+        request.onupgradeneeded = event => {
+            const db = request.result;
+            if (event.oldVersion < 1) {
+                db.createObjectStore('credits', { keyPath: 'id' });
+                db.createObjectStore('meta', { keyPath: 'key' });
+            }
+            if (event.oldVersion < 2) {
+                // Lets a page read just the credits changed since it was rendered
+                request.transaction.objectStore('credits').createIndex('version', 'version');
+            }
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function ledgerTransaction(db, stores, mode, action) {
+    return new Promise((resolve, reject) => {
+        const tx = db.transaction(stores, mode);
+        const result = action(tx);
+        tx.oncomplete = () => resolve(result && 'result' in result ? result.result : result);
+        tx.onerror = () => reject(tx.error);
+    });
+}
+
+async function getSyncState(db) {
+    const state = await ledgerTransaction(db, 'meta', 'readonly', tx => tx.objectStore('meta').get('sync'));
+    return state || { key: 'sync', version: 0, after_id: 0 };
+}
+
+// Pull every change since the stored version, one page at a time. Each
+// page and the position after it are written in one transaction, so an
+// interrupted sync resumes where it stopped.
+async function syncLedger(db) {
+    const state = await getSyncState(db);
+    let summary = null;
+
+    while (true) {
+        const params = new URLSearchParams({ since: state.version, after_id: state.after_id });
+        const response = await fetch('/api/changes?' + params, {
+            headers: { 'Accept': 'application/json' },
+            credentials: 'same-origin'
+        });
+        if (!response.ok) throw new Error('HTTP ' + response.status);
+        const data = await response.json();
+
+        state.version = data.version;
+        state.after_id = data.after_id;
+        await ledgerTransaction(db, ['credits', 'meta'], 'readwrite', tx => {
+            const credits = tx.objectStore('credits');
+            data.credits.forEach(credit => credits.put(credit));
+            data.deleted.forEach(creditId => credits.delete(creditId));
+            tx.objectStore('meta').put(state);
+        });
+
+        if (data.summary) summary = data.summary;
+        if (!data.has_more) break;
+    }
+    return { summary, version: state.version };
+}
+
+function creditOnPage(creditId) {
+    return document.querySelector(`[data-credit-total="${creditId}"]`) !== null;
+}
+
+function removeCredit(creditId) {
+    document.querySelectorAll(`[data-credit-total="${creditId}"]`).forEach(el => {
+        const card = el.closest('.mobile-credit-card, tr');
+        if (card) card.remove();
+    });
+    const details = document.getElementById('details-' + creditId);
+    if (details) details.remove();
+}
+
+function patchItems(credit) {
+    const items = new Map(credit.items.map(item => [String(item.id), item]));
+    document.querySelectorAll(`.item-row[data-item-id]`).forEach(row => {
+        const form = row.querySelector(`.item-pay-form[data-credit-id="${credit.id}"]`);
+        if (!form) return;
+        const item = items.get(row.dataset.itemId);
+        if (!item) row.remove();
+        else if (item.status === 'paid') markItemPaid(row.dataset.itemId);
+    });
+    // Items added elsewhere cannot be rendered here
+    const shown = new Set(Array.from(document.querySelectorAll(`.item-row[data-item-id]`), row => row.dataset.itemId));
+    return credit.items.some(item => !shown.has(String(item.id)));
+}
+
+function showLedgerNotice(message) {
+    let notice = document.getElementById('ledgerNotice');
+    if (!notice) {
+        notice = document.createElement('div');
+        notice.id = 'ledgerNotice';
+        notice.className = 'ledger-notice';
+        document.body.appendChild(notice);
+    }
+    notice.innerHTML = '';
+    notice.appendChild(document.createTextNode(message + ' '));
+    const link = document.createElement('a');
+    link.href = window.location.pathname + window.location.search;
+    link.textContent = 'I-refresh';
+    notice.appendChild(link);
+}
+
+// Credits in the local copy changed after `version`, read through the
+// version index so the cost follows the changes, not the ledger size
+function changedSince(db, version) {
+    return ledgerTransaction(db, 'credits', 'readonly', tx => {
+        const changed = [];
+        const range = IDBKeyRange.lowerBound(version, true);
+        tx.objectStore('credits').index('version').openCursor(range).onsuccess = event => {
+            const cursor = event.target.result;
+            if (!cursor) return;
+            changed.push(cursor.value);
+            cursor.continue();
+        };
+        return changed;
+    });
+}
+
+// Which of `creditIds` the local copy still holds
+function stillInLedger(db, creditIds) {
+    return ledgerTransaction(db, 'credits', 'readonly', tx => {
+        const found = new Set();
+        const credits = tx.objectStore('credits');
+        creditIds.forEach(creditId => {
+            credits.getKey(creditId).onsuccess = event => {
+                if (event.target.result !== undefined) found.add(creditId);
+            };
+        });
+        return found;
+    });
+}
+
+// Bring the rendered page up to the local copy: patch credits already on
+// the page, drop ones that no longer exist, and offer a refresh for
+// anything the page cannot show without rendering it. Only credits changed
+// since the page was rendered and the credits shown on it are read.
+async function refreshPage(db, result) {
+    const pageVersion = Number(document.body.dataset.ledgerVersion || 0);
+    let needsReload = false;
+
+    (await changedSince(db, pageVersion)).forEach(credit => {
+        if (!creditOnPage(credit.id)) {
+            // Filtered lists only show some credits; the full list is missing it
+            if (!document.body.dataset.view) needsReload = true;
+            return;
+        }
+        applyCreditUpdate(credit);
+        if (patchItems(credit)) needsReload = true;
+    });
+    // A sync has just completed, so the local copy holds the whole ledger
+    // and a credit shown here but missing from it has been deleted
+    const shown = Array.from(new Set(Array.from(document.querySelectorAll('[data-credit-total]'),
+                                                el => Number(el.dataset.creditTotal))));
+    const kept = await stillInLedger(db, shown);
+    shown.forEach(creditId => {
+        if (!kept.has(creditId)) removeCredit(creditId);
+    });
+
+    if (result.summary && result.version > pageVersion) applySummary(result.summary);
+    document.body.dataset.ledgerVersion = Math.max(pageVersion, result.version);
+    if (needsReload) showLedgerNotice('May mga bagong utang.');
+}
+
+async function startOfflineLedger() {
+    if (!('indexedDB' in window) || document.body.dataset.ledgerVersion === undefined) return;
+
+    let db;
+    try {
+        db = await openLedger();
+    } catch (error) {
+        console.log('Offline ledger unavailable:', error);
+        return;
+    }
+
+    const sync = async () => {
+        try {
+            await refreshPage(db, await syncLedger(db));
+        } catch (error) {
+            // Offline: the page and local copy stay as they are
+        }
+    };
+    const flushOutbox = () => {
+        if (navigator.serviceWorker && navigator.serviceWorker.controller) {
+            navigator.serviceWorker.controller.postMessage({ type: 'flush-outbox' });
+        }
+    };
+
+    if (navigator.serviceWorker) {
+        navigator.serviceWorker.addEventListener('message', event => {
+            if (event.data && event.data.type === 'outbox-flushed') {
+                if (event.data.sent) showSuccessNotification(`Naipadara na an ${event.data.sent} naka-lista na pagbabago!`);
+                sync();
+            }
+        });
+    }
+    window.addEventListener('online', () => {
+        flushOutbox();
+        sync();
+    });
+
+    flushOutbox();
+    await sync();
+}
+
+startOfflineLedger();
@@ -1,10 +1,15 @@
 // Service Worker for PWA
-const CACHE_NAME = 'utang-system-v1';
+const CACHE_NAME = 'utang-system-v3';
 const urlsToCache = [
   '/',
   '/static/manifest.json'
 ];
 
+// Form posts made while offline wait here until they can be replayed
+const OUTBOX_DB = 'utang-outbox';
+const OUTBOX_STORE = 'requests';
+const SYNC_TAG = 'utang-outbox';
+
 // Install Service Worker
 self.addEventListener('install', (event) => {
   event.waitUntil(
@@ -17,27 +22,195 @@ self.addEventListener('install', (event) => {
   self.skipWaiting();
 });
 
-// Fetch from network first, fallback to cache
-self.addEventListener('fetch', (event) => {
-  event.respondWith(
-    fetch(event.request)
-      .then((response) => {
+function openOutbox() {
+  return new Promise((resolve, reject) => {
+    const request = indexedDB.open(OUTBOX_DB, 1);
+    request.onupgradeneeded = () => {
+      request.result.createObjectStore(OUTBOX_STORE, { keyPath: 'id', autoIncrement: true });
+    };
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+}
+
+function outboxRequest(db, mode, action) {
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(OUTBOX_STORE, mode);
+    const request = action(tx.objectStore(OUTBOX_STORE));
+    tx.oncomplete = () => resolve(request.result);
+    tx.onerror = () => reject(tx.error);
+  });
+}
+
+async function queueRequest(request) {
+  const entry = {
+    url: request.url,
+    contentType: request.headers.get('Content-Type'),
+    body: await request.clone().text(),
+    queuedAt: Date.now()
+  };
+  const db = await openOutbox();
+  await outboxRequest(db, 'readwrite', (store) => store.add(entry));
+  if (self.registration.sync) {
+    self.registration.sync.register(SYNC_TAG).catch(() => {});
+  }
+}
+
+// Replay queued posts oldest first. A network failure stops the run so
+// the order is kept; a rejected post is dropped so it cannot block the rest.
+let flushing = null;
+
+function flushOutbox() {
+  if (!flushing) {
+    flushing = replayOutbox().finally(() => { flushing = null; });
+  }
+  return flushing;
+}
+
+async function replayOutbox() {
+  const db = await openOutbox();
+  const queued = await outboxRequest(db, 'readonly', (store) => store.getAll());
+  let sent = 0;
+  let dropped = 0;
+
+  for (const entry of queued) {
+    let response;
+    try {
+      response = await fetch(entry.url, {
+        method: 'POST',
+        headers: entry.contentType ? { 'Content-Type': entry.contentType } : {},
+        body: entry.body,
+        credentials: 'same-origin',
+        redirect: 'manual'
+      });
+    } catch (error) {
+      break;  // still offline
+    }
+    if (response.status >= 500) {
+      break;
+    }
+
+    if (response.type === 'opaqueredirect' || response.ok) {
+      sent++;
+    } else {
+      dropped++;
+    }
+    await outboxRequest(db, 'readwrite', (store) => store.delete(entry.id));
+  }
+
+  if (sent || dropped) {
+    const clients = await self.clients.matchAll({ type: 'window' });
+    clients.forEach((client) => client.postMessage({ type: 'outbox-flushed', sent, dropped }));
+  }
+}
+
+async function postOrQueue(request) {
+  try {
+    return await fetch(request.clone());
+  } catch (error) {
+    await queueRequest(request);
+    return Response.redirect('/?success=queued#credit-list', 303);
+  }
+}
+
+// Serve the cached page at once and refresh the cache in the background;
+// the page then pulls the ledger changes it missed from /api/changes
+function staleWhileRevalidate(request) {
+  return caches.open(CACHE_NAME).then((cache) => {
+    return cache.match(request).then((cached) => {
+      const network = fetch(request).then((response) => {
+        if (response.ok && !response.redirected) {
+          cache.put(request, response.clone());
+        }
+        return response;
+      });
+      if (cached) {
+        network.catch(() => {});
+        return cached;
+      }
+      return network.catch(() => caches.match('/'));
+    });
+  });
+}
+
+function networkFirst(request) {
+  return fetch(request)
+    .then((response) => {
+      if (response.ok) {
         // Clone the response
         const responseClone = response.clone();
-        
+
         // Cache the fetched response
         caches.open(CACHE_NAME)
           .then((cache) => {
-            cache.put(event.request, responseClone);
+            cache.put(request, responseClone);
           });
-        
-        return response;
-      })
-      .catch(() => {
-        // If fetch fails, try to get from cache
-        return caches.match(event.request);
+      }
+
+      return response;
+    })
+    .catch(() => {
+      // If fetch fails, try to get from cache; pages fall back to the shell
+      return caches.match(request).then((cached) => {
+        return cached || (request.mode === 'navigate' ? caches.match('/', { ignoreSearch: true }) : undefined);
+      });
+    });
+}
+
+self.addEventListener('fetch', (event) => {
+  const request = event.request;
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin) {
+    return;
+  }
+
+  // Plain form posts are queued when offline; API calls fail through to
+  // the page, which falls back to posting the form
+  if (request.method === 'POST') {
+    if (request.mode === 'navigate' && !url.pathname.startsWith('/api/') && url.pathname !== '/login') {
+      event.respondWith(postOrQueue(request));
+    }
+    return;
+  }
+  if (request.method !== 'GET' || url.pathname.startsWith('/api/')) {
+    return;
+  }
+
+  // Fingerprinted assets never change, so serve them from cache first
+  if (url.pathname.startsWith('/assets/')) {
+    event.respondWith(
+      caches.match(request).then((cached) => {
+        return cached || fetch(request).then((response) => {
+          const responseClone = response.clone();
+          caches.open(CACHE_NAME).then((cache) => cache.put(request, responseClone));
+          return response;
+        });
       })
-  );
+    );
+    return;
+  }
+
+  // The ledger page is the app shell; pages shown right after a change
+  // (?success=...) must be fresh, so they go to the network first
+  if (request.mode === 'navigate' && url.pathname === '/' && !url.searchParams.has('success')) {
+    event.respondWith(staleWhileRevalidate(request));
+    return;
+  }
+
+  event.respondWith(networkFirst(request));
+});
+
+self.addEventListener('sync', (event) => {
+  if (event.tag === SYNC_TAG) {
+    event.waitUntil(flushOutbox());
+  }
+});
+
+// Pages ask for a flush on load and when the browser comes back online
+self.addEventListener('message', (event) => {
+  if (event.data && event.data.type === 'flush-outbox') {
+    event.waitUntil(flushOutbox());
+  }
 });
 
 // Clean up old caches
@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# app_sqlite opens the database under DB_PATH when it is imported, so the
+# tests point it at a scratch directory first and never touch store_credit.db
+os.environ['DB_PATH'] = tempfile.mkdtemp(prefix='utang-tests-')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app_sqlite  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    """A test client with a logged-in session"""
+    client = app_sqlite.app.test_client()
+    with client.session_transaction() as client_session:
+        client_session['logged_in'] = True
+    return client
+
+
+@pytest.fixture
+def credit_id(client):
+    """A fresh credit with one item"""
+    response = client.post('/api/credits', json={'customer_name': 'Test Customer', 'product': 'Sardinas',
+                                                 'cost': 25, 'estimated_payment_date': '2026-01-15'})
+    assert response.status_code == 201
+    return response.get_json()['credit']['id']
@@ -0,0 +1,92 @@
+"""A MySQL-protocol server in front of a SQLite database, for tests.
+
+Lets MySQLLedgerStore run its real driver path (the mysql.connector pool,
+%s placeholders, dictionary cursors, executemany and transactions)
+without a MySQL server. Statements are translated from MySQL to SQLite
+with sqlglot, so the tables and triggers are app_sqlite.py's; the MySQL
+ones in database_schema.sql are tested against a real server (see
+test_mysql_store.py).
+
+Needs mysql-mimic and sqlglot (requirements-dev.txt):
+
+    python tests/mysql_standin.py <sqlite file> <port>
+"""
+import asyncio
+import sqlite3
+import sys
+
+import sqlglot
+from mysql_mimic import MysqlServer, Session, packets
+from mysql_mimic import connection as mimic_connection
+
+
+class SQLiteSession(Session):
+    """One client connection, backed by its own SQLite connection"""
+    
+    def __init__(self, db_file):
+        super().__init__()
+        self.db = sqlite3.connect(db_file, isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.rowcount = 0
+        self.lastrowid = 0
+        # Transactions go to SQLite instead of being acknowledged and ignored
+        self.middlewares = [middleware for middleware in self.middlewares
+                            if middleware.__name__ not in ('_begin_middleware', '_commit_middleware',
+                                                           '_rollback_middleware')]
+    
+    async def _static_query_middleware(self, q):
+        # Only SELECTs without a FROM (SELECT @@version and the like) are answered here
+        if q.expression.find(sqlglot.exp.From):
+            return await q.next()
+        return await super()._static_query_middleware(q)
+    
+    async def query(self, expression, sql, attrs):
+        if expression.key in ('commit', 'rollback'):
+            if self.db.in_transaction:
+                self.db.execute(expression.key.upper())
+            return [], []
+        if expression.key == 'transaction':
+            return [], []
+        
+        # Like InnoDB, every statement runs in a transaction until COMMIT;
+        # BEGIN IMMEDIATE stands in for the row locks of SELECT ... FOR UPDATE
+        statement = sqlglot.transpile(expression.sql(dialect='mysql'), read='mysql', write='sqlite')[0]
+        if not self.db.in_transaction:
+            self.db.execute("BEGIN IMMEDIATE")
+        cursor = self.db.execute(statement)
+        if cursor.description:
+            return cursor.fetchall(), [column[0] for column in cursor.description]
+        self.rowcount = cursor.rowcount
+        self.lastrowid = cursor.lastrowid or 0
+        return None
+    
+    async def reset(self):
+        if self.db.in_transaction:
+            self.db.execute("ROLLBACK")
+    
+    async def close(self):
+        await self.reset()
+        self.db.close()
+        await super().close()
+
+
+async def handle_query(self, data):
+    """COM_QUERY that reports the statement's affected rows and insert id"""
+    com_query = packets.parse_com_query(capabilities=self.capabilities, client_charset=self.client_charset,
+                                        data=data)
+    result_set = await self.query(com_query.sql, com_query.query_attrs)
+    if not result_set:
+        await self.stream.write(self.ok(affected_rows=max(self.session.rowcount, 0),
+                                        last_insert_id=self.session.lastrowid))
+        return
+    await self.write_text_resultset(result_set)
+
+
+def serve(db_file, port):
+    mimic_connection.Connection.handle_query = handle_query
+    server = MysqlServer(session_factory=lambda: SQLiteSession(db_file), port=port)
+    asyncio.run(server.serve_forever())
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1], int(sys.argv[2]))
@@ -0,0 +1,121 @@
+import json
+import sqlite3
+
+import pytest
+
+import app_sqlite
+
+
+def post_raw_json(client, path, body):
+    """POST a JSON body as text, so it can hold NaN and Infinity"""
+    return client.post(path, data=body, content_type='application/json')
+
+
+def item_count(client, credit_id):
+    return client.get(f'/api/credits/{credit_id}').get_json()['credit']['item_count']
+
+
+def test_add_item(client, credit_id):
+    response = client.post(f'/api/credits/{credit_id}/items', json={'product': 'Kape', 'quantity': 2, 'price': 6})
+    assert response.status_code == 201
+    assert response.get_json()['item']['cost'] == 12
+    assert item_count(client, credit_id) == 2
+
+
+def test_add_item_accepts_a_numeric_product(client, credit_id):
+    response = client.post(f'/api/credits/{credit_id}/items', json={'product': 555, 'cost': 40})
+    assert response.status_code == 201
+    assert response.get_json()['item']['product'] == '555'
+
+
+@pytest.mark.parametrize('field, value', [
+    ('product', ['Kape']),
+    ('product', {'name': 'Kape'}),
+    ('cost', [12]),
+    ('quantity', True),
+    ('price', {'value': 1}),
+])
+def test_add_item_rejects_fields_that_are_not_text_or_numbers(client, credit_id, field, value):
+    body = dict({'product': 'Kape', 'cost': 12}, **{field: value})
+    response = client.post(f'/api/credits/{credit_id}/items', json=body)
+    assert response.status_code == 400
+    assert 'must be text or a number' in response.get_json()['error']
+    assert item_count(client, credit_id) == 1
+
+
+@pytest.mark.parametrize('fields', [
+    '"cost": NaN',
+    '"cost": Infinity',
+    '"cost": -Infinity',
+    '"price": NaN',
+    '"quantity": Infinity',
+    '"cost": "nan"',
+    '"price": "inf"',
+])
+def test_add_item_rejects_non_finite_numbers(client, credit_id, fields):
+    response = post_raw_json(client, f'/api/credits/{credit_id}/items', '{"product": "Kape", %s}' % fields)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+    assert item_count(client, credit_id) == 1
+
+
+def test_batch_rejects_non_text_and_non_finite_items(client, credit_id):
+    body = '{"items": [{"product": "Itlog", "cost": 9}, {"product": ["Tinapay"], "cost": 5}, ' \
+           '{"product": "Gatas", "cost": NaN}]}'
+    response = post_raw_json(client, f'/api/credits/{credit_id}/items/batch', body)
+    assert response.status_code == 400
+    assert [rejected['index'] for rejected in response.get_json()['rejected']] == [1, 2]
+    assert item_count(client, credit_id) == 1
+
+
+def test_create_credit_rejects_non_finite_cost(client):
+    before = client.get('/api/summary').get_json()['summary']
+    body = json.dumps({'customer_name': 'Test Customer', 'product': 'Kape', 'estimated_payment_date': '2026-01-15'})
+    response = post_raw_json(client, '/api/credits', body[:-1] + ', "cost": Infinity}')
+    assert response.status_code == 400
+    assert client.get('/api/summary').get_json()['summary'] == before
+
+
+
+def paid_amount(client, credit_id):
+    return client.get(f'/api/credits/{credit_id}').get_json()['credit']['paid_amount']
+
+
+@pytest.mark.parametrize('amount', ['nan', 'inf', '-inf', 'NaN'])
+def test_api_payment_rejects_non_finite_amount(client, credit_id, amount):
+    response = client.post(f'/api/credits/{credit_id}/payments', json={'amount': amount})
+    assert response.status_code == 400
+    assert 'finite' in response.get_json()['error']
+    assert paid_amount(client, credit_id) == 0
+
+
+@pytest.mark.parametrize('amount', ['nan', 'inf'])
+def test_form_payment_rejects_non_finite_amount(client, credit_id, amount):
+    response = client.post(f'/add_payment/{credit_id}', data={'amount': amount})
+    assert response.status_code == 400
+    assert 'finite' in response.get_json()['error']
+    assert paid_amount(client, credit_id) == 0
+
+
+def test_mark_paid_missing_credit_is_not_found(client):
+    before = client.get('/api/summary').get_json()['summary']
+    assert client.post('/mark_paid/99999').status_code == 404
+    assert client.get('/api/summary').get_json()['summary'] == before
+
+
+def test_mark_paid(client, credit_id):
+    response = client.post(f'/mark_paid/{credit_id}')
+    assert response.status_code == 302
+    assert client.get(f'/api/credits/{credit_id}').get_json()['credit']['status'] == 'paid'
+
+def test_database_error_is_logged_with_traceback(client, monkeypatch, caplog):
+    def fail(*args, **kwargs):
+        raise sqlite3.OperationalError('disk I/O error')
+    
+    monkeypatch.setattr(app_sqlite.store, 'create_credit', fail)
+    response = client.post('/api/credits', json={'customer_name': 'Test Customer', 'product': 'Sardinas',
+                                                 'cost': 25, 'estimated_payment_date': '2026-01-15'})
+    assert response.status_code == 500
+    [record] = [record for record in caplog.records if record.getMessage() == 'Database error']
+    assert record.levelname == 'ERROR'
+    assert record.exc_info[0] is sqlite3.OperationalError
@@ -0,0 +1,134 @@
+"""check_store() through MySQLLedgerStore.
+
+test_check_store_mysql_server loads database_schema.sql - the MySQL tables
+and triggers - into a scratch database on a real MySQL server and runs
+check_store() against it. It needs a server to use, named by MYSQL_TEST_HOST
+(and MYSQL_TEST_PORT, MYSQL_TEST_USER, MYSQL_TEST_PASSWORD); the CI
+workflow starts one. The database MYSQL_TEST_DATABASE (store_credit_test)
+is dropped and recreated, so never point it at a real ledger.
+
+test_check_store_mysql_protocol runs without a server: mysql_standin.py
+answers the MySQL protocol from the SQLite test database, which covers the
+driver path (the pool, %s placeholders, dictionary cursors, executemany)
+but runs app_sqlite.py's triggers, not the MySQL ones.
+"""
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+mysql_connector = pytest.importorskip('mysql.connector')
+
+import app_sqlite  # noqa: E402
+from ledger_store import MySQLLedgerStore, check_store  # noqa: E402
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+STANDIN = os.path.join(TESTS_DIR, 'mysql_standin.py')
+SCHEMA_FILE = os.path.join(os.path.dirname(TESTS_DIR), 'database_schema.sql')
+
+MYSQL_TEST_CONFIG = {
+    'host': os.getenv('MYSQL_TEST_HOST'),
+    'port': int(os.getenv('MYSQL_TEST_PORT', '3306')),
+    'user': os.getenv('MYSQL_TEST_USER', 'root'),
+    'password': os.getenv('MYSQL_TEST_PASSWORD', ''),
+}
+MYSQL_TEST_DATABASE = os.getenv('MYSQL_TEST_DATABASE', 'store_credit_test')
+
+
+def schema_statements(text, database):
+    """Split database_schema.sql into statements, as the mysql client would.
+    
+    Follows its DELIMITER lines, so each trigger arrives whole, and puts
+    the schema in `database` instead of store_credit_system.
+    """
+    delimiter, lines = ';', []
+    for line in text.replace('store_credit_system', database).splitlines():
+        stripped = line.strip()
+        if not lines and (not stripped or stripped.startswith('--')):
+            continue
+        if stripped.upper().startswith('DELIMITER '):
+            delimiter = stripped.split()[1]
+            continue
+        lines.append(line)
+        if stripped.endswith(delimiter):
+            lines[-1] = line.rstrip()[:-len(delimiter)]
+            yield '\n'.join(lines)
+            lines = []
+
+
+def check(store):
+    connection = store.connect()
+    try:
+        return check_store(store, store.cursor(connection))
+    finally:
+        connection.rollback()
+        connection.close()
+
+
+@pytest.fixture(scope='module')
+def mysql_server_store():
+    """A MySQLLedgerStore on a fresh copy of database_schema.sql in a real server"""
+    if not MYSQL_TEST_CONFIG['host']:
+        pytest.skip('set MYSQL_TEST_HOST to run against a MySQL server')
+    connection = mysql_connector.connect(**MYSQL_TEST_CONFIG)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS {MYSQL_TEST_DATABASE}")
+        with open(SCHEMA_FILE, encoding='utf-8') as schema:
+            for statement in schema_statements(schema.read(), MYSQL_TEST_DATABASE):
+                cursor.execute(statement)
+        connection.commit()
+    finally:
+        connection.close()
+    return MySQLLedgerStore(dict(MYSQL_TEST_CONFIG, database=MYSQL_TEST_DATABASE),
+                            pool_size=2, pool_name='tests_server')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def mysql_standin_store():
+    """A MySQLLedgerStore talking to the stand-in server over the test database"""
+    pytest.importorskip('mysql_mimic')
+    port = free_port()
+    server = subprocess.Popen([sys.executable, STANDIN, app_sqlite.DB_FILE, str(port)])
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    pytest.fail('The MySQL stand-in did not start')
+                time.sleep(0.05)
+        yield MySQLLedgerStore({'host': '127.0.0.1', 'port': port, 'user': 'root', 'password': '',
+                                'database': 'store_credit_system'}, pool_size=2, pool_name='tests_standin')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def test_schema_statements_keep_triggers_whole():
+    with open(SCHEMA_FILE, encoding='utf-8') as schema:
+        statements = list(schema_statements(schema.read(), 'store_credit_test'))
+    triggers = [statement for statement in statements if statement.startswith('CREATE TRIGGER')]
+    assert len(triggers) == 9
+    assert all(trigger.rstrip().endswith('END') for trigger in triggers)
+    assert 'USE store_credit_test' in statements
+    assert not any('store_credit_system' in statement or 'DELIMITER' in statement for statement in statements)
+
+
+def test_check_store_mysql_server(mysql_server_store):
+    assert check(mysql_server_store) == []
+
+
+def test_check_store_mysql_protocol(mysql_standin_store):
+    assert check(mysql_standin_store) == []
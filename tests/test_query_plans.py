@@ -0,0 +1,230 @@
+"""Fail when a route's SQL reads a whole table.
+
+Every route in ROUTES is driven through the test client against a copy of
+the test database (or of QUERY_PLAN_DB, e.g. a ledger made by
+generate_ledger.py), the statements it ran are collected from the query
+profile, and EXPLAIN QUERY PLAN must not show any of them scanning a table.
+Add new routes here, and run it after changing a query or an index:
+
+    QUERY_PLAN_DB=/tmp/bench/store_credit.db python -m pytest -q tests/test_query_plans.py
+"""
+import os
+import re
+import shutil
+import tempfile
+
+import pytest
+from flask import g
+
+import app_sqlite
+
+# (method, path, body) - bodies go as JSON to /api/ paths and as forms
+# elsewhere. Paths are filled in from the credit the first request adds.
+ROUTES = [
+    ('POST', '/add_credit', {'customer_name': 'Plan Check', 'product': 'Sardinas', 'cost': '25',
+                             'estimated_payment_date': '2000-01-01', 'phone_number': '09171234567'}),
+    ('POST', '/add_product/{credit_id}', {'product': 'Kape', 'cost': '12'}),
+    ('GET', '/', None),
+    ('GET', '/?filter=overdue', None),
+    ('GET', '/?customer={customer_id}', None),
+    ('GET', '/customers', None),
+    ('GET', '/search?q=Plan', None),
+    ('GET', '/search?q=Pl', None),
+    ('GET', '/view_items/{credit_id}', None),
+    ('GET', '/export_credits?format=csv', None),
+    ('GET', '/api/credits', None),
+    ('GET', '/api/credits/{credit_id}', None),
+    ('GET', '/api/credits/{credit_id}/items', None),
+    ('GET', '/api/credits/{credit_id}/payments', None),
+    ('GET', '/api/summary', None),
+    ('GET', '/api/changes?since=0', None),
+    ('GET', '/api/events?after=0', None),
+    ('GET', '/api/reports/balances', None),
+    ('GET', '/api/reports/collections', None),
+    ('GET', '/api/sms', None),
+    ('GET', '/api/customers', None),
+    ('GET', '/api/customers/{customer_id}', None),
+    ('POST', '/api/credits', {'customer_name': 'Plan Check', 'product': 'Bugas', 'cost': 50,
+                              'estimated_payment_date': '2000-01-01'}),
+    ('POST', '/api/credits/{credit_id}/items', {'product': 'Asukar', 'cost': 20}),
+    ('POST', '/api/credits/{credit_id}/items/batch', {'items': [{'product': 'Itlog', 'cost': 9},
+                                                                {'product': 'Tinapay', 'cost': 5}]}),
+    ('POST', '/mark_item_paid/{credit_id}/{item_id}', None),
+    ('POST', '/api/credits/{credit_id}/items/pay', {'item_ids': ['{item_id}']}),
+    ('POST', '/add_payment/{credit_id}', {'amount': '5'}),
+    ('POST', '/api/credits/{credit_id}/payments', {'amount': 5}),
+    ('POST', '/mark_paid/{credit_id}', None),
+    ('POST', '/api/credits/{credit_id}/pay', None),
+    ('POST', '/delete_credit/{credit_id}', None),
+]
+
+# Endpoints allowed to read a whole table, and why
+FULL_READS = {
+    'export_credits': 'an export is the whole ledger by definition',
+    'api_sms_stats': 'counts every SMS job by status; the queue is pruned to recent jobs',
+}
+
+# Summary tables that stay small however large the ledger grows
+SMALL_TABLES = {'ledger_summary', 'due_date_totals'}
+
+SCAN_PATTERN = re.compile(r'^SCAN (\S+)(?: USING (?:COVERING )?INDEX \S+)?$')
+
+# Plan steps that start a query of their own inside the statement
+SUBQUERY_PATTERN = re.compile(r'SUBQUERY|CO-ROUTINE|MATERIALIZE|COMPOUND|UNION|EXCEPT|INTERSECT')
+
+
+def outer_limit(sql):
+    """Whether the outermost SELECT has a LIMIT, not counting parenthesised subqueries"""
+    depth, outer = 0, []
+    for char in sql:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif depth == 0:
+            outer.append(char)
+    return re.search(r'\bLIMIT\b', ''.join(outer), re.IGNORECASE) is not None
+
+
+def full_scans(plan, sql):
+    """Plan steps that read a whole table or index.
+    
+    `plan` is the (id, parent, detail) rows of EXPLAIN QUERY PLAN. Virtual
+    tables (FTS5), subqueries and small summary tables are left out. So is
+    the outer loop of the outermost SELECT when it walks an index in order
+    under that SELECT's own LIMIT with no sort, which stops early. A LIMIT
+    in a subquery or a compound branch exempts nothing, since its plan
+    steps cannot be matched back to the SQL text.
+    """
+    steps = {row_id: (parent, detail) for row_id, parent, detail in plan}
+    
+    def nested(parent):
+        while parent in steps:
+            parent, detail = steps[parent]
+            if SUBQUERY_PATTERN.search(detail):
+                return True
+        return False
+    
+    outer = [(row_id, detail) for row_id, parent, detail in plan if not nested(parent)]
+    loops = [row_id for row_id, detail in outer if detail.startswith(('SCAN ', 'SEARCH '))]
+    bounded = (outer_limit(sql) and loops
+               and not any(detail.startswith('USE TEMP B-TREE') for row_id, detail in outer))
+    
+    scans = []
+    for row_id, parent, detail in plan:
+        match = SCAN_PATTERN.match(detail)
+        if not match or match.group(1).startswith('(') or match.group(1) in SMALL_TABLES:
+            continue
+        if bounded and row_id == loops[0] and 'INDEX' in detail:
+            continue
+        scans.append(detail)
+    return scans
+
+
+def fill_placeholders(value, ids):
+    """Fill {credit_id}-style placeholders in a request body; a bare placeholder becomes a number"""
+    if isinstance(value, dict):
+        return {key: fill_placeholders(item, ids) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fill_placeholders(item, ids) for item in value]
+    if isinstance(value, str) and value.startswith('{'):
+        return int(value.format(**ids))
+    return value
+
+
+def collect_route_queries():
+    """Run ROUTES and return (endpoint, status, statements) for each"""
+    client = app_sqlite.app.test_client()
+    with client.session_transaction() as client_session:
+        client_session['logged_in'] = True
+    
+    ids = {}
+    results = []
+    for method, path, body in ROUTES:
+        path, body = path.format(**ids), fill_placeholders(body, ids)
+        options = {'json': body} if path.startswith('/api/') else {'data': body}
+        with client:
+            response = client.open(path, method=method, **options)
+            response.get_data()  # runs a streamed response's queries
+            results.append((g.route, response.status_code, list(g.queries)))
+        
+        if not ids:
+            connection = app_sqlite.open_connection()
+            ids = dict(connection.execute("""
+                SELECT c.id as credit_id, c.customer_id, MIN(ci.id) as item_id
+                FROM credits c JOIN credit_items ci ON ci.credit_id = c.id
+                WHERE c.id = (SELECT MAX(id) FROM credits)
+            """).fetchone())
+            connection.close()
+    return results
+
+
+@pytest.fixture(scope='module')
+def route_plans():
+    """(endpoint, status, [(sql, plan)]) for each of ROUTES, run on a copy of the database"""
+    live_db_file = app_sqlite.DB_FILE
+    workdir = tempfile.mkdtemp(prefix='utang-plans-')
+    app_sqlite.DB_FILE = os.getenv('QUERY_PLAN_DB', live_db_file)
+    app_sqlite.copy_database(os.path.join(workdir, 'store_credit.db'))
+    app_sqlite.DB_FILE = os.path.join(workdir, 'store_credit.db')
+    app_sqlite.db_pool.close_all()
+    try:
+        app_sqlite.init_db()
+        results = []
+        connection = app_sqlite.open_connection()
+        for endpoint, status, queries in collect_route_queries():
+            plans = []
+            for query in queries:
+                if query['params'] is None:
+                    continue  # executemany
+                plan = [(row['id'], row['parent'], row['detail'])
+                        for row in connection.execute(f"EXPLAIN QUERY PLAN {query['sql']}", query['params'])]
+                plans.append((' '.join(query['sql'].split()), plan))
+            results.append((endpoint, status, plans))
+        connection.close()
+        yield results
+    finally:
+        app_sqlite.db_pool.close_all()
+        app_sqlite.DB_FILE = live_db_file
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+@pytest.mark.parametrize('index', range(len(ROUTES)), ids=[f"{method} {path}" for method, path, body in ROUTES])
+def test_route_reads_no_whole_table(route_plans, index):
+    endpoint, status, plans = route_plans[index]
+    assert status < 400
+    assert plans, 'the route ran no SQL; is query profiling on?'
+    if endpoint in FULL_READS:
+        pytest.skip(FULL_READS[endpoint])
+    problems = [f"{'; '.join(scans)}: {sql[:200]}" for sql, plan in plans if (scans := full_scans(plan, sql))]
+    assert problems == []
+
+
+@pytest.mark.parametrize('sql, plan, scans', [
+    # The outer SELECT's LIMIT stops an index walk early
+    ("SELECT * FROM credits ORDER BY created_at DESC LIMIT 10",
+     [(2, 0, 'SCAN credits USING INDEX idx_created')], []),
+    # ...but not one that has to be sorted first
+    ("SELECT * FROM credits ORDER BY customer_name LIMIT 10",
+     [(2, 0, 'SCAN credits USING INDEX idx_status'), (9, 0, 'USE TEMP B-TREE FOR ORDER BY')],
+     ['SCAN credits USING INDEX idx_status']),
+    # ...nor the inner loop of a join
+    ("SELECT * FROM credits c JOIN payments p ON p.amount = c.id ORDER BY c.created_at LIMIT 10",
+     [(2, 0, 'SCAN c USING INDEX idx_created'), (3, 0, 'SCAN p USING INDEX idx_payments')],
+     ['SCAN p USING INDEX idx_payments']),
+    # A LIMIT in a subquery does not bound the outer query; the subquery's
+    # own steps are reported too, as its plan cannot be matched to its SQL
+    ("SELECT id FROM credits WHERE id IN (SELECT credit_id FROM credit_items ORDER BY id LIMIT 5)",
+     [(2, 0, 'SCAN credits USING COVERING INDEX idx_status'), (4, 0, 'LIST SUBQUERY 1'),
+      (6, 4, 'SCAN credit_items USING INDEX idx_items')],
+     ['SCAN credits USING COVERING INDEX idx_status', 'SCAN credit_items USING INDEX idx_items']),
+    # Nor does a LIMIT on one branch of a compound query
+    ("SELECT id FROM credits UNION ALL SELECT id FROM (SELECT id FROM payments LIMIT 5)",
+     [(1, 0, 'COMPOUND QUERY'), (2, 1, 'LEFT-MOST SUBQUERY'), (5, 2, 'SCAN credits USING COVERING INDEX idx_status'),
+      (7, 1, 'UNION ALL'), (10, 7, 'SCAN payments USING COVERING INDEX idx_payments')],
+     ['SCAN credits USING COVERING INDEX idx_status', 'SCAN payments USING COVERING INDEX idx_payments']),
+    ("SELECT id FROM credits ORDER BY id LIMIT 5",
+     [(2, 0, 'SCAN credits')], ['SCAN credits']),
+])
+def test_full_scans_only_exempts_the_loop_a_limit_bounds(sql, plan, scans):
+    assert full_scans(plan, sql) == scans
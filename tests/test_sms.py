@@ -0,0 +1,167 @@
+import threading
+import time
+from datetime import date, datetime
+
+import pytest
+
+import app_sqlite
+from app_sqlite import FakeProvider, SMSDispatcher, SMSError
+
+
+@pytest.fixture
+def connection():
+    """A connection to the test database with an empty SMS queue"""
+    connection = app_sqlite.open_connection()
+    connection.execute("DELETE FROM sms_jobs")
+    connection.commit()
+    yield connection
+    connection.close()
+
+
+def queue_job(connection, phone_number, message='Paalala'):
+    connection.execute("""
+        INSERT INTO sms_jobs (phone_number, message, credit_ids, dedupe_key, next_attempt_at)
+        VALUES (?, ?, '', ?, ?)
+    """, (phone_number, message, f"{phone_number}:{message}", datetime.now().timestamp()))
+    connection.commit()
+
+
+def fetch_job(connection, phone_number):
+    return connection.execute("SELECT * FROM sms_jobs WHERE phone_number = ?", (phone_number,)).fetchone()
+
+
+def make_due(connection):
+    """Pretend every retry delay has passed"""
+    connection.execute("UPDATE sms_jobs SET next_attempt_at = 0 WHERE status = 'queued'")
+    connection.commit()
+
+
+def dispatcher(provider, **kwargs):
+    sms = SMSDispatcher(provider, rate_per_minute=0, **kwargs)
+    sms.reminders_queued_on = date.today()  # only send what the test queued
+    return sms
+
+
+def test_send_queued_job(connection):
+    queue_job(connection, '09170000001')
+    provider = FakeProvider()
+    assert dispatcher(provider).run_once() == 1
+    assert provider.sent == [('09170000001', 'Paalala')]
+    job = fetch_job(connection, '09170000001')
+    assert (job['status'], job['attempts'], job['provider_id']) == ('sent', 1, 'fake-1')
+
+
+def test_failed_send_retries_with_backoff(connection, monkeypatch):
+    monkeypatch.setattr(app_sqlite, 'SMS_RETRY_SECONDS', 60)
+    queue_job(connection, '09170000002')
+    provider = FakeProvider(failures={'09170000002': 2})
+    sms = dispatcher(provider)
+    
+    started = datetime.now().timestamp()
+    assert sms.run_once() == 0
+    job = fetch_job(connection, '09170000002')
+    assert (job['status'], job['attempts'], job['last_error']) == ('queued', 1, 'Simulated failure')
+    assert job['next_attempt_at'] == pytest.approx(started + 60, abs=5)
+    # Not due again until the delay has passed
+    assert sms.run_once() == 0
+    assert fetch_job(connection, '09170000002')['attempts'] == 1
+    
+    make_due(connection)
+    started = datetime.now().timestamp()
+    assert sms.run_once() == 0
+    job = fetch_job(connection, '09170000002')
+    assert job['attempts'] == 2
+    assert job['next_attempt_at'] == pytest.approx(started + 120, abs=5)
+    
+    make_due(connection)
+    assert sms.run_once() == 1
+    job = fetch_job(connection, '09170000002')
+    assert (job['status'], job['attempts'], job['last_error']) == ('sent', 3, None)
+    assert provider.sent == [('09170000002', 'Paalala')]
+
+
+def test_job_fails_after_max_attempts(connection, monkeypatch):
+    monkeypatch.setattr(app_sqlite, 'SMS_MAX_ATTEMPTS', 2)
+    queue_job(connection, '09170000003')
+    sms = dispatcher(FakeProvider(failures={'09170000003': 5}))
+    sms.run_once()
+    make_due(connection)
+    sms.run_once()
+    make_due(connection)
+    assert sms.run_once() == 0
+    job = fetch_job(connection, '09170000003')
+    assert (job['status'], job['attempts']) == ('failed', 2)
+
+
+def test_rejected_send_is_not_retried(connection):
+    class RejectingProvider:
+        def send(self, phone_number, message):
+            raise SMSError('HTTP 400', retryable=False)
+    
+    queue_job(connection, '09170000004')
+    assert dispatcher(RejectingProvider()).run_once() == 0
+    job = fetch_job(connection, '09170000004')
+    assert (job['status'], job['attempts'], job['last_error']) == ('failed', 1, 'HTTP 400')
+
+
+def test_sends_are_rate_limited(connection):
+    class TimedProvider(FakeProvider):
+        def __init__(self):
+            super().__init__()
+            self.times = []
+        
+        def send(self, phone_number, message):
+            self.times.append(time.monotonic())
+            return super().send(phone_number, message)
+    
+    for number in ('09170000005', '09170000006', '09170000007'):
+        queue_job(connection, number)
+    provider = TimedProvider()
+    sms = SMSDispatcher(provider, rate_per_minute=600)  # one send every 0.1 s
+    sms.reminders_queued_on = date.today()
+    assert sms.run_once() == 3
+    gaps = [later - earlier for earlier, later in zip(provider.times, provider.times[1:])]
+    assert all(gap >= 0.09 for gap in gaps)
+
+
+def test_reminders_are_sent_once_a_day_per_phone(client, connection, monkeypatch):
+    monkeypatch.setattr(app_sqlite, 'SMS_REMINDER_HOUR', 0)
+    today = date.today().isoformat()
+    for product, cost in (('Bugas', 50), ('Kape', 12)):
+        response = client.post('/api/credits', json={'customer_name': 'Maria Santos', 'product': product,
+                                                     'cost': cost, 'estimated_payment_date': today,
+                                                     'phone_number': '0917 000 0008'})
+        assert response.status_code == 201
+    
+    # Two dispatchers, as in two worker processes, each queue and send
+    provider = FakeProvider()
+    sent = [SMSDispatcher(provider, rate_per_minute=0).run_once() for _ in range(2)]
+    assert sorted(sent) == [0, 1]
+    [(phone_number, message)] = provider.sent
+    assert phone_number == '09170000008'
+    assert '₱62.00' in message
+    assert app_sqlite.enqueue_reminders(connection.cursor(), date.today()) == 0
+
+
+def test_web_workers_take_turns_dispatching(connection):
+    queue_job(connection, '09170000009')
+    stop = threading.Event()
+    # Another worker process holds the SMS lock and is dispatching
+    with app_sqlite.file_lock(app_sqlite.DB_FILE + '.sms.lock'):
+        worker = threading.Thread(target=app_sqlite.run_sms_worker, args=(stop,))
+        worker.start()
+        time.sleep(0.2)
+        assert fetch_job(connection, '09170000009')['status'] == 'queued'
+        stop.set()
+    worker.join(5)
+    assert not worker.is_alive()
+    assert fetch_job(connection, '09170000009')['status'] == 'queued'
+
+
+def test_requests_do_not_start_background_threads(client, monkeypatch):
+    monkeypatch.setattr(app_sqlite, 'SMS_WORKER', True)
+    monkeypatch.setattr(app_sqlite, 'BACKUP_INTERVAL_HOURS', 1)
+    client.get('/api/summary')
+    names = [thread.name for thread in threading.enumerate()]
+    assert 'sms-dispatcher' not in names
+    assert 'backups' not in names
@@ -0,0 +1,35 @@
+import re
+
+import pytest
+from flask import render_template
+
+import app as mysql_app
+
+# Pages index.html links to that only app_sqlite.py serves
+SQLITE_ONLY = ['/customers', '/export_credits', 'js/offline.', 'js/live.', 'logout()']
+
+
+def render_mysql_index():
+    """index.html as app.py renders it, without a MySQL server behind it"""
+    pagination = {'per_page': 25, 'choices': [25], 'prev_url': None, 'next_url': None}
+    with mysql_app.app.test_request_context('/'):
+        return render_template('index.html', credits=[], fragments={}, summary_html='',
+                               pagination=pagination, ledger_version=0)
+
+
+@pytest.mark.parametrize('link', SQLITE_ONLY)
+def test_mysql_index_leaves_out_pages_it_does_not_serve(link):
+    assert link not in render_mysql_index()
+
+
+@pytest.mark.parametrize('link', SQLITE_ONLY)
+def test_sqlite_index_links_its_pages(client, link):
+    assert link in client.get('/').get_data(as_text=True)
+
+
+def test_mysql_index_links_only_its_own_routes():
+    html = render_mysql_index()
+    adapter = mysql_app.app.url_map.bind('localhost')
+    for path in set(re.findall(r'(?:href|action)="(/[^"#?]*)', html)):
+        if not path.startswith('/static/'):
+            assert adapter.test(path, 'GET') or adapter.test(path, 'POST'), path